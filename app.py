@@ -9,6 +9,7 @@ from flask import (
     url_for,
     flash,
     g,
+    Response,
 )
 from flask_login import (
     LoginManager,
@@ -19,22 +20,30 @@ from flask_login import (
     current_user,
 )
 from werkzeug.security import generate_password_hash, check_password_hash
+import click
 import sqlite3
 import os
 import datetime
 import json
 import threading
-import shutil
+import base64
+import binascii
+import re
+import signal
 from pathlib import Path
 import time
-import re  # For cleaning up command templates
 
-from utils import helpers
+from utils import database, helpers, journal, metrics, output_index, zip_stream
+from scanner import checkpoints, findings, planner, task_processes, task_queue, targets as target_routing
+from scanner.command_template import find_param_errors, find_unfilled_placeholders
+from scanner.inventory import ToolInventory
+from scanner.rate_limits import RateScheduler
+from scanner.result_cache import ResultCache
+from scanner.scheduler import JobScheduler
+from scanner.task_runner import JobRun
+from scanner.worker import TaskWorker
 
 
-# Placeholder for the scan engine logic
-# In a real application, this would be in a separate module (e.g., scanner/engine.py)
-# and would contain the actual tool execution logic.
 def run_scan_process(
     job_id,
     job_path,
@@ -44,336 +53,106 @@ def run_scan_process(
     db_path_for_thread,
     tool_definitions_for_thread,
     app_logger,
+    max_parallel_tasks=1,
+    tool_slots=None,
+    cancel_event=None,
+    result_cache=None,
+    engine="threads",
+    rate_scheduler=None,
+    queued_task=None,
 ):
-    app_logger.info(f"Motor de escaneo iniciado para job {job_id} en {job_path}")
-
-    # Ensure tool_outputs directory exists
-    tool_outputs_dir = Path(job_path) / "tool_outputs"
-    os.makedirs(tool_outputs_dir, exist_ok=True)
-
-    job_summary_path = Path(job_path) / "summary.json"
-
-    # Initial summary data structure (will be updated by the main thread before this starts)
-    current_summary_data = {}
-    if job_summary_path.exists():
-        try:
-            with open(job_summary_path, "r", encoding="utf-8") as f_sum:
-                current_summary_data = json.load(f_sum)
-        except json.JSONDecodeError:
-            app_logger.error(
-                f"Job {job_id}: summary.json corrupt at start of scan process."
-            )
-            current_summary_data = {"logs": [], "tool_progress": {}}  # Fallback
-
-    if "logs" not in current_summary_data:
-        current_summary_data["logs"] = []
-    if "tool_progress" not in current_summary_data:
-        current_summary_data["tool_progress"] = {}
-
-    total_tools_to_run = len(targets) * len(selected_tools_config_list)
-    completed_tools_count = 0
-
-    conn_thread = sqlite3.connect(db_path_for_thread)
-    conn_thread.row_factory = sqlite3.Row
-
-    try:
-        for target_idx, target_item in enumerate(targets):
-            # Target can be a simple string or an object if more details are needed
-            target_value = (
-                target_item
-                if isinstance(target_item, str)
-                else target_item.get("value", str(target_item))
-            )
-
-            for tool_config_entry in selected_tools_config_list:
-                tool_id = tool_config_entry["id"]
-                user_cli_params_for_tool = tool_config_entry.get(
-                    "cli_params", {}
-                )  # Params specific to this tool invocation
-                tool_definition = tool_definitions_for_thread.get(tool_id, {})
-
-                # Check for cancellation request
-                cursor_cancel = conn_thread.cursor()
-                cursor_cancel.execute("SELECT status FROM job WHERE id = ?", (job_id,))
-                job_status_db = cursor_cancel.fetchone()
-                cursor_cancel.close()
-                if job_status_db and job_status_db["status"] in [
-                    "REQUEST_CANCEL",
-                    "CANCELLED",
-                ]:
-                    app_logger.info(
-                        f"Cancelación detectada para job {job_id} dentro del motor. Herramienta {tool_id} en {target_value} no se ejecutará."
-                    )
-                    current_summary_data["logs"].append(
-                        {
-                            "timestamp": datetime.datetime.now().isoformat(),
-                            "message": f"Escaneo cancelado antes de ejecutar {tool_id} en {target_value}.",
-                            "type": "warn",
-                        }
-                    )
-                    with open(job_summary_path, "w", encoding="utf-8") as f_sum:
-                        json.dump(current_summary_data, f_sum, indent=4)
-                    conn_thread.close()
-                    return "CANCELLED"
-
-                tool_output_filename = f"{tool_id}_{target_value.replace('://', '_').replace('/', '_').replace(':', '_')}_{helpers.get_current_timestamp_str()}.txt"
-                tool_output_filepath = tool_outputs_dir / tool_output_filename
-
-                command_template = tool_definition.get("command_template", "")
-                if not command_template:
-                    app_logger.warning(
-                        f"Job {job_id}: No command template for tool {tool_id}"
-                    )
-                    current_summary_data["logs"].append(
-                        {
-                            "timestamp": datetime.datetime.now().isoformat(),
-                            "message": f"No se encontró plantilla de comando para {tool_id}.",
-                            "type": "error",
-                        }
-                    )
-                    current_summary_data["tool_progress"][
-                        f"{tool_id}_on_{target_value}"
-                    ] = {
-                        "status": "error",
-                        "error_message": "No command template",
-                        "output_file": None,
-                    }
-                    continue
-
-                # Replace placeholders
-                final_command = command_template
-                final_command = final_command.replace("{target}", target_value)
-                final_command = final_command.replace(
-                    "{target_url}", target_value
-                )  # Common placeholder
-                final_command = final_command.replace(
-                    "{target_host_or_ip}", target_value
-                )  # Common placeholder
-                final_command = final_command.replace("{target_domain}", target_value)
-                final_command = final_command.replace(
-                    "{output_file}", str(tool_output_filepath)
-                )
-                final_command = final_command.replace(
-                    "{output_file_base}",
-                    str(
-                        tool_outputs_dir
-                        / f"{tool_id}_{target_value.replace('://', '_').replace('/', '_').replace(':', '_')}"
-                    ),
-                )
-                final_command = final_command.replace(
-                    "{output_file_json}", str(tool_output_filepath.with_suffix(".json"))
-                )
-                final_command = final_command.replace(
-                    "{output_file_xml}", str(tool_output_filepath.with_suffix(".xml"))
-                )
-                final_command = final_command.replace(
-                    "{output_file_dir}", str(tool_outputs_dir)
-                )
-
-                # Replace tool-specific CLI parameters from user_cli_params_for_tool and advanced_options
-                # Priority: user_cli_params_for_tool > advanced_options (tool specific) > advanced_options (global)
-
-                # Global advanced options might influence parameters too (e.g., Nmap timing)
-                if tool_id == "nmap_top_ports" and advanced_options.get(
-                    "customScanTime"
-                ):
-                    final_command = final_command.replace(
-                        "{nmap_timing_option}", advanced_options["customScanTime"]
-                    )
-                else:  # remove placeholder if not set
-                    final_command = final_command.replace(
-                        "{nmap_timing_option}",
-                        tool_definition.get("cli_params_config", [{}])[0].get(
-                            "default", "-T3"
-                        ),
-                    )
-
-                for param_key, param_value in user_cli_params_for_tool.items():
-                    final_command = final_command.replace(
-                        f"{{{param_key}}}", str(param_value)
-                    )
-
-                # Remove any remaining unreplaced placeholders like {some_other_param}
-                final_command = re.sub(r"\{[a-zA-Z0-9_]+\}", "", final_command)
-
-                app_logger.info(
-                    f"Job {job_id}: Ejecutando [{tool_id}] en [{target_value}]: {final_command}"
-                )
-                current_summary_data["logs"].append(
-                    {
-                        "timestamp": datetime.datetime.now().isoformat(),
-                        "message": f"Ejecutando: {final_command}",
-                        "type": "command",
-                    }
-                )
-                current_summary_data["tool_progress"][
-                    f"{tool_id}_on_{target_value}"
-                ] = {
-                    "status": "running",
-                    "command": final_command,
-                    "start_time": datetime.datetime.now().isoformat(),
-                }
-                with open(job_summary_path, "w", encoding="utf-8") as f_sum:
-                    json.dump(current_summary_data, f_sum, indent=4)
-
-                tool_run_status = "error"  # Default to error
-                tool_error_message = ""
-                try:
-                    # Actual tool execution
-                    process = subprocess.run(
-                        final_command,
-                        shell=tool_definition.get(
-                            "needs_shell", False
-                        ),  # Critical for security
-                        capture_output=True,
-                        text=True,
-                        timeout=int(
-                            advanced_options.get("tool_timeout", 3600)
-                        ),  # Default 1 hour timeout per tool
-                        check=False,  # Don't raise exception for non-zero exit codes immediately
-                    )
-                    with open(tool_output_filepath, "w", encoding="utf-8") as f_out:
-                        f_out.write(f"--- Command ---\n{final_command}\n\n")
-                        f_out.write(
-                            f"--- STDOUT for {tool_definition.get('name', tool_id)} on {target_value} ---\n"
-                        )
-                        f_out.write(process.stdout if process.stdout else "")
-                        f_out.write(
-                            f"\n\n--- STDERR for {tool_definition.get('name', tool_id)} on {target_value} ---\n"
-                        )
-                        f_out.write(process.stderr if process.stderr else "")
-
-                    if process.returncode == 0:
-                        tool_run_status = "completed"
-                        current_summary_data["logs"].append(
-                            {
-                                "timestamp": datetime.datetime.now().isoformat(),
-                                "message": f"{tool_id} en {target_value} completado.",
-                                "type": "success",
-                            }
-                        )
-                    else:
-                        tool_run_status = "error"
-                        tool_error_message = f"Exit code {process.returncode}. Stderr: {process.stderr[:200]}"
-                        current_summary_data["logs"].append(
-                            {
-                                "timestamp": datetime.datetime.now().isoformat(),
-                                "message": f"Error en {tool_id} en {target_value}: {tool_error_message}",
-                                "type": "error",
-                            }
-                        )
-
-                except subprocess.TimeoutExpired:
-                    tool_run_status = "error"
-                    tool_error_message = "Timeout Expirado"
-                    current_summary_data["logs"].append(
-                        {
-                            "timestamp": datetime.datetime.now().isoformat(),
-                            "message": f"Timeout para {tool_id} en {target_value}.",
-                            "type": "error",
-                        }
-                    )
-                    with open(tool_output_filepath, "a", encoding="utf-8") as f_out:
-                        f_out.write("\n\n--- ERROR: TIMEOUT EXPIRED ---")
-                except Exception as e_tool:
-                    tool_run_status = "error"
-                    tool_error_message = str(e_tool)
-                    current_app.logger.error(
-                        f"Job {job_id}: Excepción ejecutando {tool_id} en {target_value}: {e_tool}"
-                    )
-                    current_summary_data["logs"].append(
-                        {
-                            "timestamp": datetime.datetime.now().isoformat(),
-                            "message": f"Excepción en {tool_id} en {target_value}: {e_tool}",
-                            "type": "error",
-                        }
-                    )
-                    with open(tool_output_filepath, "a", encoding="utf-8") as f_out:
-                        f_out.write(f"\n\n--- EXCEPTION: {e_tool} ---")
-
-                completed_tools_count += 1
-                current_progress = (
-                    int((completed_tools_count / total_tools_to_run) * 100)
-                    if total_tools_to_run > 0
-                    else 0
-                )
-
-                current_summary_data["tool_progress"][
-                    f"{tool_id}_on_{target_value}"
-                ].update(
-                    {
-                        "status": tool_run_status,
-                        "output_file": str(
-                            tool_output_filepath.name
-                        ),  # Store relative path or just name
-                        "end_time": datetime.datetime.now().isoformat(),
-                        "error_message": (
-                            tool_error_message if tool_error_message else None
-                        ),
-                    }
-                )
-                current_summary_data["overall_progress"] = current_progress
-                with open(job_summary_path, "w", encoding="utf-8") as f_sum:
-                    json.dump(current_summary_data, f_sum, indent=4)
-
-                conn_thread.execute(
-                    "UPDATE job SET overall_progress = ? WHERE id = ?",
-                    (current_progress, job_id),
-                )
-                conn_thread.commit()
-
-        final_job_status = "COMPLETED"
-        if any(
-            tp.get("status") == "error"
-            for tp in current_summary_data["tool_progress"].values()
-        ):
-            final_job_status = "COMPLETED_WITH_ERRORS"
-
-        # Check final cancellation status from DB one last time
-        cursor_final_cancel = conn_thread.cursor()
-        cursor_final_cancel.execute("SELECT status FROM job WHERE id = ?", (job_id,))
-        job_final_status_db = cursor_final_cancel.fetchone()
-        cursor_final_cancel.close()
-        if job_final_status_db and job_final_status_db["status"] == "CANCELLED":
-            final_job_status = (
-                "CANCELLED"  # Override if it was cancelled during the last tool run
-            )
-
-    except Exception as e_main:
-        app_logger.error(
-            f"Error mayor en el motor de escaneo para job {job_id}: {e_main}"
-        )
-        current_summary_data["logs"].append(
-            {
-                "timestamp": datetime.datetime.now().isoformat(),
-                "message": f"Error crítico del motor: {e_main}",
-                "type": "error",
-            }
-        )
-        current_summary_data["error_message"] = str(e_main)
-        with open(job_summary_path, "w", encoding="utf-8") as f_sum:
-            json.dump(current_summary_data, f_sum, indent=4)
-        final_job_status = "ERROR"
-    finally:
-        conn_thread.close()
-
-    return final_job_status
+    """Ejecuta las tareas del job y devuelve su estado final (ver scanner.task_runner.JobRun).
+
+    Con `queued_task` solo se ejecuta esa tarea, ya planificada: lo usan los workers
+    independientes (ver run_queued_task), que no reconstruyen el DAG ni compactan el
+    diario por tarea. Es un dict con `task` (ver scanner.planner), `upstream_results`
+    (checkpoints de sus dependencias), `total_tasks` y `finished_tasks` del job.
+    """
+    job_run = JobRun(
+        job_id,
+        job_path,
+        advanced_options,
+        db_path_for_thread,
+        tool_definitions_for_thread,
+        app_logger,
+        max_parallel_tasks=max_parallel_tasks,
+        tool_slots=tool_slots,
+        cancel_event=cancel_event,
+        result_cache=result_cache,
+        engine=engine,
+        rate_scheduler=rate_scheduler,
+    )
+    if queued_task is not None:
+        return job_run.run_queued_task(queued_task)
+    return job_run.run(targets, selected_tools_config_list)
 
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.environ.get("FLASK_SECRET_KEY", os.urandom(32))
-app.config["DATABASE"] = os.path.join(
-    os.path.dirname(os.path.abspath(__file__)), "panthera.db"
+# Rutas configurables para que varios procesos (web y `flask worker`) compartan la misma
+# base de datos y resultados fuera del árbol del repositorio
+app.config["DATABASE"] = os.environ.get(
+    "DATABASE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "panthera.db"),
 )
-app.config["RESULTS_DIR"] = os.path.join(
-    os.path.dirname(os.path.abspath(__file__)), "scan_results"
+app.config["RESULTS_DIR"] = os.environ.get(
+    "RESULTS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "scan_results"),
 )
-app.config["TOOLS_CONFIG_PATH"] = os.path.join(
-    os.path.dirname(os.path.abspath(__file__)), "tools_config.json"
+app.config["TOOLS_CONFIG_PATH"] = os.environ.get(
+    "TOOLS_CONFIG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "tools_config.json"),
 )
 app.config["MAX_PARALLEL_THREADS_PER_JOB"] = int(
-    os.environ.get("MAX_PARALLEL_THREADS_PER_JOB", 1)
-)  # Limita hilos por job
+    os.environ.get("MAX_PARALLEL_THREADS_PER_JOB", 3)
+)  # Limita hilos por job (tareas herramienta×objetivo simultáneas)
+app.config["MAX_CONCURRENT_JOBS"] = int(
+    os.environ.get("MAX_CONCURRENT_JOBS", 2)
+)  # Jobs en ejecución a la vez; el resto espera en PENDING
+app.config["MAX_CONCURRENT_TOOLS"] = int(
+    os.environ.get("MAX_CONCURRENT_TOOLS", 3)
+)  # Procesos de herramientas simultáneos sumando todos los jobs (por proceso `flask worker` en modo "workers")
+app.config["MAX_JOBS_PER_USER"] = int(os.environ.get("MAX_JOBS_PER_USER", 1))
+app.config["ADMISSION_MAX_CPU_PERCENT"] = float(
+    os.environ.get("ADMISSION_MAX_CPU_PERCENT", 85)
+)
+app.config["ADMISSION_MIN_AVAILABLE_MEMORY_MB"] = int(
+    os.environ.get("ADMISSION_MIN_AVAILABLE_MEMORY_MB", 1024)
+)
+
+app.config["TOOL_CACHE_DIR"] = os.environ.get(
+    "TOOL_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "tool_cache"),
+)  # Resultados reutilizables entre jobs (herramientas con cache_ttl_seconds)
+app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")  # Vacío: /metrics sin autenticación
+app.config["MAX_TOOLS_PER_HOST"] = int(
+    os.environ.get("MAX_TOOLS_PER_HOST", 2)
+)  # Herramientas con rate_control a la vez sobre un mismo host (0: sin límite)
+app.config["RATE_BUDGET_PPS"] = int(
+    os.environ.get("RATE_BUDGET_PPS", 3000)
+)  # Paquetes/s repartidos entre las herramientas con rate_param y rate_unit "pps" (0: sin presupuesto)
+app.config["RATE_BUDGET_RPS"] = int(
+    os.environ.get("RATE_BUDGET_RPS", 300)
+)  # Peticiones HTTP/s repartidas entre las herramientas con rate_unit "rps" (0: sin presupuesto)
+app.config["SCAN_ENGINE"] = os.environ.get(
+    "SCAN_ENGINE", "threads"
+)  # "asyncio": un bucle de eventos supervisa todos los procesos en lugar de un hilo por tarea
+app.config["SCAN_EXECUTION_MODE"] = os.environ.get(
+    "SCAN_EXECUTION_MODE", "inprocess"
+)  # "workers": la app solo encola jobs y los ejecutan procesos `flask worker` aparte
+app.config["WORKER_CONCURRENCY"] = int(
+    os.environ.get("WORKER_CONCURRENCY", 2)
+)  # Tareas simultáneas por proceso `flask worker`
+
+TERMINAL_JOB_STATUSES = ("COMPLETED", "COMPLETED_WITH_ERRORS", "CANCELLED", "ERROR")
+JOBS_PAGE_SIZE = 50  # Jobs por página en /api/jobs
+JOBS_MAX_PAGE_SIZE = 200
+JOBS_PREVIEW_TARGETS = 5  # Objetivos guardados en job.targets_preview para el listado (el total va en target_count)
+FINDINGS_PAGE_SIZE = 500  # Filas por consulta en /api/scan/findings
+FINDINGS_MAX_PAGE_SIZE = 5000
+SEARCH_PAGE_SIZE = 20  # Resultados por página en /api/search
+SEARCH_MAX_PAGE_SIZE = 100
+ROUTING_PREVIEW_TARGETS = 5  # Objetivos omitidos que se nombran por herramienta al crear un job
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -381,22 +160,20 @@ login_manager.login_view = "login"
 login_manager.login_message = "Por favor, inicia sesión para acceder a esta página."
 login_manager.login_message_category = "info"
 
-active_scan_threads = {}  # job_id: threading.Thread object
 
 
 def get_db():
     db = getattr(g, "_database", None)
     if db is None:
-        db = g._database = sqlite3.connect(app.config["DATABASE"])
-        db.row_factory = sqlite3.Row
+        db = g._database = database.get_pool(app.config["DATABASE"]).acquire()
     return db
 
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, "_database", None)
+    db = g.pop("_database", None)
     if db is not None:
-        db.close()
+        database.get_pool(app.config["DATABASE"]).release(db)
 
 
 def init_db_command():
@@ -404,6 +181,7 @@ def init_db_command():
     schema_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
     with app.open_resource(schema_path, mode="r") as f:
         db.cursor().executescript(f.read())
+    database.apply_schema_upgrades(db)
     db.commit()
     current_app.logger.info("Base de datos inicializada.")
     cursor = db.cursor()
@@ -423,19 +201,52 @@ def init_db_cli():
     init_db_command()
 
 
+@app.cli.command("index-outputs")
+def index_outputs_cli():
+    """Indexa para /api/search las salidas de los jobs existentes (solo lo que falte)."""
+    db = get_db()
+    tool_ids = list(helpers.get_tools_definition())
+    jobs = db.execute("SELECT id, results_path FROM job").fetchall()
+    total_bytes = 0
+    for job_row in jobs:
+        if job_row["results_path"]:
+            total_bytes += output_index.index_job_directory(
+                db, job_row["id"], job_row["results_path"], tool_ids
+            )
+    current_app.logger.info(
+        f"Índice de salidas actualizado: {len(jobs)} jobs, {total_bytes} bytes nuevos."
+    )
+
+
 class User(UserMixin):
     def __init__(self, id, username):
         self.id = id
         self.username = username
 
 
+USER_CACHE_TTL_SECONDS = 300
+_user_cache = {}  # user_id (str): (User, instante de carga)
+_user_cache_lock = threading.Lock()
+
+
 @login_manager.user_loader
 def load_user(user_id):
+    # flask_login llama a esto en cada request autenticada; se evita ir a la DB cada vez
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id)
+    if cached and time.monotonic() - cached[1] < USER_CACHE_TTL_SECONDS:
+        return cached[0]
+
     db = get_db()
     cur = db.execute("SELECT * FROM user WHERE id = ?", (user_id,))
     user_data = cur.fetchone()
     if user_data:
-        return User(id=user_data["id"], username=user_data["username"])
+        user = User(id=user_data["id"], username=user_data["username"])
+        with _user_cache_lock:
+            _user_cache[user_id] = (user, time.monotonic())
+        return user
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
     return None
 
 
@@ -482,10 +293,14 @@ def index():
 @login_required
 def get_app_config_route():
     try:
+        tool_config = helpers.get_tool_config()
         config_data = {
-            "tools": helpers.get_tools_definition(),
-            "profiles": helpers.get_scan_profiles(),
-            "phases": helpers.get_pentest_phases(),
+            "tools": tool_config.tools,
+            "profiles": tool_config.profiles,
+            "phases": tool_config.phases,
+            "inventory": tool_inventory.get(
+                tool_config.tools, tool_config.command_templates
+            ),
             "script_root": request.script_root,
         }
         return jsonify(config_data)
@@ -506,6 +321,12 @@ def scan_job_thread_target(
     db_path,
     tool_definitions,
     app_logger_for_thread,
+    max_parallel_tasks=1,
+    tool_slots=None,
+    cancel_event=None,
+    result_cache=None,
+    engine="threads",
+    rate_scheduler=None,
 ):
     """Wrapper to call the scan process and update DB on completion/error."""
     final_status = "ERROR"  # Default in case of unexpected crash in run_scan_process
@@ -521,6 +342,12 @@ def scan_job_thread_target(
             db_path,
             tool_definitions,
             app_logger_for_thread,
+            max_parallel_tasks,
+            tool_slots,
+            cancel_event,
+            result_cache,
+            engine=engine,
+            rate_scheduler=rate_scheduler,
         )
     except Exception as e:
         app_logger_for_thread.error(
@@ -529,12 +356,23 @@ def scan_job_thread_target(
         final_status = "ERROR"
         error_msg_thread = str(e)
     finally:
-        active_scan_threads.pop(job_id, None)
         try:
-            with sqlite3.connect(db_path) as conn_final:
+            end_timestamp = datetime.datetime.now().isoformat()
+            job_journal = journal.JobJournal(job_path)
+            job_journal.update(
+                status=final_status, end_timestamp=end_timestamp, overall_progress=100
+            )
+            job_journal.compact()
+
+            # El progreso por lotes pendiente no debe pisar el estado final
+            database.get_progress_batcher(db_path).discard(job_id)
+            metrics.JOBS_FINISHED.inc(status=final_status)
+            with database.get_pool(db_path).connection() as conn_final, metrics.DB_WRITE_SECONDS.time(
+                operation="job_final"
+            ):
                 # Ensure end_timestamp is set, and status reflects outcome
                 final_update_query = "UPDATE job SET status = ?, end_timestamp = ?, overall_progress = 100"
-                params = [final_status, datetime.datetime.now().isoformat()]
+                params = [final_status, end_timestamp]
                 if error_msg_thread:
                     final_update_query += ", error_message = ?"
                     params.append(error_msg_thread)
@@ -547,56 +385,372 @@ def scan_job_thread_target(
                     f"Job {job_id} finalizado en DB con estado: {final_status}"
                 )
 
-                # Attempt to create ZIP archive if completed successfully or with errors
-                if final_status in ["COMPLETED", "COMPLETED_WITH_ERRORS"]:
-                    zip_filename_base = f"{job_id}_results"
-                    zip_path_on_disk = (
-                        Path(app.config["RESULTS_DIR"]) / f"{zip_filename_base}.zip"
-                    )  # Store in parent of job_path
-
-                    try:
-                        shutil.make_archive(
-                            str(Path(app.config["RESULTS_DIR"]) / zip_filename_base),
-                            "zip",
-                            job_path,
-                        )
-                        zip_url_path = f"/api/results/download/{zip_filename_base}.zip"
-                        conn_final.execute(
-                            "UPDATE job SET zip_path = ? WHERE id = ?",
-                            (zip_url_path, job_id),
-                        )
-                        conn_final.commit()
-                        app_logger_for_thread.info(
-                            f"Resultados para job {job_id} empaquetados en {zip_path_on_disk}"
-                        )
-                    except Exception as e_zip:
-                        app_logger_for_thread.error(
-                            f"Error al crear ZIP para job {job_id}: {e_zip}"
-                        )
-                        # Log this error in summary.json as well
-                        summary_path = Path(job_path) / "summary.json"
-                        s_data = {}
-                        if summary_path.exists():
-                            with open(summary_path, "r") as f:
-                                s_data = json.load(f)
-                        if "logs" not in s_data:
-                            s_data["logs"] = []
-                        s_data["logs"].append(
-                            {
-                                "timestamp": datetime.datetime.now().isoformat(),
-                                "message": f"Error creando ZIP: {e_zip}",
-                                "type": "error",
-                            }
-                        )
-                        with open(summary_path, "w") as f:
-                            json.dump(s_data, f, indent=4)
-
         except Exception as e_db_final:
             app_logger_for_thread.error(
                 f"Error CRÍTICO al actualizar estado final en DB para job {job_id}: {e_db_final}"
             )
 
 
+def decode_job_row(job_row):
+    """Columnas JSON de un job: (objetivos, herramientas seleccionadas, opciones avanzadas)."""
+    return (
+        json.loads(job_row["targets"]) if job_row["targets"] else [],
+        json.loads(job_row["selected_tools_config"]) if job_row["selected_tools_config"] else [],
+        json.loads(job_row["advanced_options"]) if job_row["advanced_options"] else {},
+    )
+
+
+def start_job_run(job_row):
+    """Marca en el diario el inicio (o la reanudación) de un job admitido.
+
+    Devuelve (herramientas seleccionadas sin las no instaladas, definiciones de herramientas).
+    """
+    job_journal = journal.JobJournal(job_row["results_path"])
+    if job_row["start_timestamp"]:
+        # Ya había empezado antes de un reinicio: se conserva la hora de inicio original
+        job_journal.update(status="RUNNING")
+        job_journal.log("Job reanudado tras el reinicio del servidor.", "warn")
+    else:
+        job_journal.update(
+            status="RUNNING", start_timestamp=datetime.datetime.now().isoformat()
+        )
+
+    # Las herramientas no instaladas se quitan antes de planificar tareas (el inventario
+    # pudo cambiar desde que se encoló el job)
+    tool_config = helpers.get_tool_config()
+    tool_definitions = tool_config.tools
+    _, selected_tools_config, _ = decode_job_row(job_row)
+    selected_tools_config, dropped_tools = planner.drop_unavailable_tools(
+        selected_tools_config,
+        tool_definitions,
+        tool_inventory.unavailable_tools(tool_definitions, tool_config.command_templates),
+    )
+    for tool_id, reason in dropped_tools.items():
+        job_journal.append(
+            journal.make_log_event(f"{tool_id} omitida: {reason}.", "warn"),
+            journal.make_progress_event(
+                tool_id, {"status": "skipped", "error_message": f"Herramienta {reason}"}
+            ),
+        )
+    return selected_tools_config, tool_definitions
+
+
+def run_scheduled_job(job_row, scheduler):
+    """Ejecuta en el hilo asignado por el planificador un job admitido desde la cola."""
+    selected_tools_config, tool_definitions = start_job_run(job_row)
+    targets, _, advanced_options = decode_job_row(job_row)
+    scan_job_thread_target(
+        job_row["id"],
+        job_row["results_path"],
+        targets,
+        selected_tools_config,
+        advanced_options,
+        app.config["DATABASE"],
+        tool_definitions,
+        app.logger,
+        app.config["MAX_PARALLEL_THREADS_PER_JOB"],
+        scheduler.tool_slots,
+        scheduler.get_cancel_event(job_row["id"]),
+        tool_result_cache,
+        engine=app.config["SCAN_ENGINE"],
+        rate_scheduler=tool_rate_scheduler,
+    )
+
+
+def plan_queued_job(conn, job_row):
+    """Encola en `task_queue` las tareas del DAG de un job que un worker acaba de pasar a RUNNING."""
+    job_id = job_row["id"]
+    job_journal = journal.JobJournal(job_row["results_path"])
+    selected_tools_config, tool_definitions = start_job_run(job_row)
+    targets, _, advanced_options = decode_job_row(job_row)
+    try:
+        scan_tasks = planner.build_task_graph(
+            targets,
+            selected_tools_config,
+            tool_definitions,
+            phase_order=list(helpers.get_pentest_phases()),
+            advanced_options=advanced_options,
+        )
+    except planner.TaskGraphError as e:
+        # El job no se puede planificar: se cierra ya, sin tareas en la cola
+        end_timestamp = datetime.datetime.now().isoformat()
+        job_journal.append(
+            journal.make_log_event(f"Error crítico del motor: {e}", "error"),
+            journal.make_summary_event(
+                {
+                    "status": "ERROR",
+                    "end_timestamp": end_timestamp,
+                    "overall_progress": 100,
+                    "error_message": str(e),
+                }
+            ),
+        )
+        job_journal.compact()
+        conn.execute(
+            "UPDATE job SET status = 'ERROR', end_timestamp = ?, overall_progress = 100, error_message = ? WHERE id = ?",
+            (end_timestamp, str(e), job_id),
+        )
+        metrics.JOBS_FINISHED.inc(status="ERROR")
+        return
+
+    added_dependencies = {
+        task["tool_id"]: task["tool_config_entry"]["added_as_dependency_of"]
+        for task in scan_tasks.values()
+        if task["tool_config_entry"].get("added_as_dependency_of")
+    }
+    for upstream_id, dependent_id in added_dependencies.items():
+        job_journal.log(
+            f"{upstream_id} añadido al job como dependencia de {dependent_id}.", "info"
+        )
+    reused_tasks = checkpoints.load_reusable_tasks(conn, job_id, scan_tasks)
+    task_queue.enqueue_job_tasks(conn, job_id, scan_tasks, reused_tasks)
+    if reused_tasks:
+        job_journal.log(
+            f"Job reanudado: {len(reused_tasks)} de {len(scan_tasks)} tareas ya completadas se reutilizan.",
+            "info",
+        )
+    job_journal.log(
+        f"{len(scan_tasks) - len(reused_tasks)} tareas en la cola de los workers.", "info"
+    )
+
+
+def find_planned_task(job_row, tool_definitions, task_key):
+    """Tarea `task_key` del DAG del job, para las encoladas sin especificación guardada."""
+    targets, selected_tools_config, advanced_options = decode_job_row(job_row)
+    try:
+        scan_tasks = planner.build_task_graph(
+            targets,
+            selected_tools_config,
+            tool_definitions,
+            phase_order=list(helpers.get_pentest_phases()),
+            advanced_options=advanced_options,
+        )
+    except planner.TaskGraphError:
+        return None
+    return scan_tasks.get(task_key)
+
+
+def run_queued_task(claimed, cancel_event):
+    """Ejecuta en un worker una tarea reclamada de `task_queue` (ver scanner.worker).
+
+    La tarea llega planificada y solo se leen los checkpoints de sus dependencias. Las
+    herramientas de todos los hilos del worker comparten los slots de `MAX_CONCURRENT_TOOLS`.
+    """
+    db_path = app.config["DATABASE"]
+    job_id, task_key = claimed["job_id"], claimed["task_key"]
+    with database.get_pool(db_path).connection() as conn:
+        job_row = conn.execute("SELECT * FROM job WHERE id = ?", (job_id,)).fetchone()
+    if job_row is None:
+        return
+    job_journal = journal.JobJournal(job_row["results_path"])
+
+    if claimed["attempts"] > task_queue.MAX_TASK_ATTEMPTS:
+        # Los workers que la tomaron murieron a mitad: no se reintenta indefinidamente
+        with database.get_pool(db_path).connection() as conn:
+            checkpoints.save_task_checkpoint(
+                conn, job_id, task_key, claimed["tool_id"], "error"
+            )
+        job_journal.append(
+            journal.make_log_event(
+                f"{task_key} abandonada tras {task_queue.MAX_TASK_ATTEMPTS} intentos interrumpidos.",
+                "error",
+            ),
+            journal.make_progress_event(
+                task_key,
+                {"status": "error", "error_message": "Intentos agotados"},
+            ),
+        )
+        return
+    if claimed["attempts"] > 1:
+        # El worker anterior murió: su herramienta puede seguir viva en este host
+        with database.get_pool(db_path).connection() as conn:
+            killed, _ = task_processes.kill_stale_processes(conn, job_id, [task_key])
+        if killed:
+            job_journal.log(f"{task_key}: proceso del intento anterior detenido.", "warn")
+
+    tool_definitions = helpers.get_tool_config().tools
+    task = claimed["task"] or find_planned_task(job_row, tool_definitions, task_key)
+    if task is not None:
+        with database.get_pool(db_path).connection() as conn:
+            upstream_results = checkpoints.load_task_results(conn, job_id, task["depends_on"])
+            total_tasks, finished_tasks = task_queue.count_job_tasks(conn, job_id)
+        run_scan_process(
+            job_id,
+            job_row["results_path"],
+            *decode_job_row(job_row),
+            db_path,
+            tool_definitions,
+            app.logger,
+            tool_slots=scan_scheduler.tool_slots,
+            cancel_event=cancel_event,
+            result_cache=tool_result_cache,
+            engine=app.config["SCAN_ENGINE"],
+            rate_scheduler=tool_rate_scheduler,
+            queued_task={
+                "task": task,
+                "upstream_results": upstream_results,
+                "total_tasks": total_tasks,
+                "finished_tasks": finished_tasks,
+            },
+        )
+
+    # Sin checkpoint la tarea no llegó a ejecutarse (dependencia sin salida, herramienta
+    # fuera del DAG en este worker...): se registra como error para no bloquear el job
+    with database.get_pool(db_path).connection() as conn:
+        has_checkpoint = conn.execute(
+            "SELECT 1 FROM job_task WHERE job_id = ? AND task_key = ?", (job_id, task_key)
+        ).fetchone()
+        job_status = conn.execute("SELECT status FROM job WHERE id = ?", (job_id,)).fetchone()
+        if not has_checkpoint and not cancel_event.is_set() and job_status and job_status["status"] == "RUNNING":
+            checkpoints.save_task_checkpoint(conn, job_id, task_key, claimed["tool_id"], "error")
+            job_journal.log(f"{task_key} no se pudo ejecutar en este worker.", "error")
+
+
+def finalize_queued_job(job_id):
+    """Cierra un job de la cola si ya no le quedan tareas; solo un worker gana el cierre."""
+    db_path = app.config["DATABASE"]
+    with database.get_pool(db_path).connection() as conn:
+        final_status = task_queue.get_job_final_status(conn, job_id)
+        if final_status is None:
+            return
+        end_timestamp = datetime.datetime.now().isoformat()
+        with metrics.DB_WRITE_SECONDS.time(operation="job_final"):
+            cur = conn.execute(
+                """UPDATE job SET status = ?, end_timestamp = ?, overall_progress = 100
+                   WHERE id = ? AND status IN ('RUNNING', 'REQUEST_CANCEL')""",
+                (final_status, end_timestamp, job_id),
+            )
+            conn.commit()
+        if cur.rowcount == 0:
+            return  # Otro worker ya lo cerró
+        job_path = conn.execute(
+            "SELECT results_path FROM job WHERE id = ?", (job_id,)
+        ).fetchone()["results_path"]
+
+    database.get_progress_batcher(db_path).discard(job_id)
+    metrics.JOBS_FINISHED.inc(status=final_status)
+    job_journal = journal.JobJournal(job_path)
+    job_journal.update(
+        status=final_status, end_timestamp=end_timestamp, overall_progress=100
+    )
+    job_journal.compact()
+    app.logger.info(f"Job {job_id} finalizado en DB con estado: {final_status}")
+
+
+tool_result_cache = ResultCache(app.config["TOOL_CACHE_DIR"])
+tool_rate_scheduler = RateScheduler(
+    app.config["DATABASE"],
+    max_tasks_per_host=app.config["MAX_TOOLS_PER_HOST"],
+    budgets={"pps": app.config["RATE_BUDGET_PPS"], "rps": app.config["RATE_BUDGET_RPS"]},
+    logger=app.logger,
+)
+tool_inventory = ToolInventory(app.logger)
+
+scan_scheduler = JobScheduler(
+    app.config["DATABASE"],
+    run_scheduled_job,
+    app.logger,
+    max_concurrent_jobs=app.config["MAX_CONCURRENT_JOBS"],
+    max_concurrent_tools=app.config["MAX_CONCURRENT_TOOLS"],
+    max_jobs_per_user=app.config["MAX_JOBS_PER_USER"],
+    max_cpu_percent=app.config["ADMISSION_MAX_CPU_PERCENT"],
+    min_available_memory_mb=app.config["ADMISSION_MIN_AVAILABLE_MEMORY_MB"],
+)
+
+
+@app.before_request
+def ensure_scan_scheduler():
+    # Se arranca en el primer request para no lanzarlo en el proceso padre del reloader;
+    # así también se retoman los jobs que quedaron en PENDING antes de un reinicio.
+    # En modo "workers" los jobs los ejecutan los procesos `flask worker`.
+    if app.config["SCAN_EXECUTION_MODE"] != "workers":
+        scan_scheduler.ensure_started()
+
+
+def count_jobs(*statuses):
+    # Desde la tabla `job`: en modo "workers" los jobs no corren en este proceso
+    with database.get_pool(app.config["DATABASE"]).connection() as conn:
+        return conn.execute(
+            f"SELECT COUNT(*) FROM job WHERE status IN ({', '.join('?' * len(statuses))})",
+            statuses,
+        ).fetchone()[0]
+
+
+@app.cli.command("worker")
+@click.option("--concurrency", type=int, default=None, help="Tareas simultáneas en este worker.")
+@click.option("--worker-id", default=None, help="Identificador del worker (por defecto host:pid).")
+@click.option(
+    "--max-running-jobs",
+    type=int,
+    default=None,
+    help="Jobs en RUNNING a partir de los cuales no se planifican más.",
+)
+@click.option(
+    "--lease-seconds",
+    type=float,
+    default=task_queue.LEASE_SECONDS,
+    show_default=True,
+    help="Segundos sin latido tras los que otro worker puede reclamar una tarea de este.",
+)
+def worker_cli(concurrency, worker_id, max_running_jobs, lease_seconds):
+    """Ejecuta tareas de la cola persistente hasta recibir SIGTERM o Ctrl-C (ver scanner.worker)."""
+    app.logger.setLevel("INFO")
+    concurrency = concurrency or app.config["WORKER_CONCURRENCY"]
+    if concurrency > app.config["MAX_CONCURRENT_TOOLS"]:
+        # Un hilo de más reclamaría tareas que solo esperarían un slot con el lease tomado
+        app.logger.warning(
+            f"Concurrencia del worker limitada a MAX_CONCURRENT_TOOLS ({app.config['MAX_CONCURRENT_TOOLS']})."
+        )
+        concurrency = app.config["MAX_CONCURRENT_TOOLS"]
+    task_worker = TaskWorker(
+        app.config["DATABASE"],
+        run_queued_task,
+        plan_queued_job,
+        finalize_queued_job,
+        app.logger,
+        worker_id=worker_id,
+        concurrency=concurrency,
+        max_running_jobs=max_running_jobs or app.config["MAX_CONCURRENT_JOBS"],
+        lease_seconds=lease_seconds,
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: task_worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: task_worker.stop())
+    task_worker.run()
+
+
+metrics.JOBS_RUNNING.set_function(lambda: count_jobs("RUNNING", "REQUEST_CANCEL"))
+metrics.JOBS_QUEUED.set_function(lambda: count_jobs("PENDING"))
+metrics.RATE_ALLOCATED_PPS.set_function(lambda: tool_rate_scheduler.allocated_rate("pps"))
+metrics.RATE_ALLOCATED_RPS.set_function(lambda: tool_rate_scheduler.allocated_rate("rps"))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+
+@app.after_request
+def observe_request_latency(response):
+    started_at = g.pop("request_started_at", None)
+    if started_at is not None:
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started_at,
+            endpoint=request.endpoint or "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
+    return response
+
+
+@app.route("/metrics")
+def metrics_route():
+    # Sin sesión (lo consulta Prometheus); con METRICS_TOKEN se exige como token Bearer
+    metrics_token = app.config["METRICS_TOKEN"]
+    if metrics_token and request.headers.get("Authorization") != f"Bearer {metrics_token}":
+        return jsonify({"error": "No autorizado."}), 401
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.route("/api/scan/start", methods=["POST"])
 @login_required
 def start_scan_route():
@@ -624,7 +778,22 @@ def start_scan_route():
             400,
         )
 
-    targets = [t.strip() for t in targets_input if t.strip()]
+    # Normalizar y deduplicar: cada objetivo se clasifica (dominio, IP, CIDR, URL, host:puerto)
+    targets, invalid_targets = target_routing.normalize_targets(
+        [t for t in targets_input if t.strip()]
+    )
+    if invalid_targets:
+        return (
+            jsonify(
+                {
+                    "error": "Algunos objetivos no son válidos.",
+                    "details": [
+                        f"{raw_target}: {reason}" for raw_target, reason in invalid_targets.items()
+                    ],
+                }
+            ),
+            400,
+        )
     if not targets:
         return jsonify({"error": "No se proporcionaron objetivos válidos."}), 400
 
@@ -638,6 +807,105 @@ def start_scan_route():
             400,
         )
 
+    # Validar las plantillas antes de encolar: un placeholder sin valor daría un comando roto
+    # Una sola versión de la configuración para toda la validación (puede recargarse en caliente)
+    tool_config = helpers.get_tool_config()
+    tool_definitions = tool_config.tools
+    command_templates = tool_config.command_templates
+    template_errors = []
+    for tool_entry in selected_tools_payload:
+        tool_id = tool_entry.get("id") if isinstance(tool_entry, dict) else None
+        tool_definition = tool_definitions.get(tool_id)
+        if tool_definition is None:
+            template_errors.append(f"Herramienta desconocida: {tool_id}")
+            continue
+        if tool_id not in command_templates:
+            template_errors.append(f"{tool_id}: no tiene plantilla de comando")
+            continue
+        unfilled = find_unfilled_placeholders(
+            command_templates[tool_id],
+            tool_definition,
+            tool_entry.get("cli_params"),
+            [
+                target_form
+                for target_form in (
+                    target_routing.get_target_form(
+                        target_value, tool_definition.get("target_type", "domain_or_ip")
+                    )
+                    for target_value in targets
+                )
+                if target_form is not None
+            ],
+            has_input=bool(planner.get_tool_dependencies(tool_definition)),
+            is_batch=planner.is_list_capable(tool_definition),
+        )
+        for target_value, missing in unfilled.items():
+            placeholders = ", ".join("{" + name + "}" for name in missing)
+            template_errors.append(
+                f"{tool_id}: {placeholders} sin valor"
+                + (f" para {target_value}" if target_value else "")
+            )
+        param_error = find_param_errors(
+            command_templates[tool_id], tool_definition, tool_entry.get("cli_params")
+        )
+        if param_error:
+            template_errors.append(f"{tool_id}: {param_error}")
+    if template_errors:
+        return (
+            jsonify(
+                {
+                    "error": "Las herramientas seleccionadas no se pueden ejecutar con estos objetivos.",
+                    "details": template_errors,
+                }
+            ),
+            400,
+        )
+
+    # Herramientas no instaladas: se descartan antes de encolar
+    selected_tools_payload, dropped_tools = planner.drop_unavailable_tools(
+        selected_tools_payload,
+        tool_definitions,
+        tool_inventory.unavailable_tools(tool_definitions, command_templates),
+    )
+    skipped_tools = [f"{tool_id}: {reason}" for tool_id, reason in dropped_tools.items()]
+    if not selected_tools_payload:
+        return (
+            jsonify(
+                {
+                    "error": "Ninguna de las herramientas seleccionadas está disponible en el servidor.",
+                    "details": skipped_tools,
+                }
+            ),
+            400,
+        )
+
+    # Solo se planifican los pares herramienta×objetivo compatibles con su target_type
+    target_routes, skipped_pairs = planner.route_targets(
+        targets, selected_tools_payload, tool_definitions
+    )
+    skipped_targets = []
+    for tool_id, tool_skipped in skipped_pairs.items():
+        if not target_routes[tool_id]:
+            skipped_tools.append(f"{tool_id}: ningún objetivo es compatible")
+            continue
+        preview = ", ".join(tool_skipped[:ROUTING_PREVIEW_TARGETS])
+        if len(tool_skipped) > ROUTING_PREVIEW_TARGETS:
+            preview += f" y {len(tool_skipped) - ROUTING_PREVIEW_TARGETS} más"
+        skipped_targets.append(f"{tool_id} no se ejecutará en {preview}")
+    selected_tools_payload = [
+        tool_entry for tool_entry in selected_tools_payload if target_routes[tool_entry["id"]]
+    ]
+    if not selected_tools_payload:
+        return (
+            jsonify(
+                {
+                    "error": "Ningún objetivo es compatible con las herramientas seleccionadas.",
+                    "details": skipped_tools,
+                }
+            ),
+            400,
+        )
+
     job_id = f"scan_{helpers.get_current_timestamp_str()}"
     job_path, _ = helpers.create_job_directories(
         app.config["RESULTS_DIR"], job_id, targets
@@ -655,7 +923,7 @@ def start_scan_route():
         "end_timestamp": None,
         "overall_progress": 0,
         "results_path": str(job_path),  # Store as string
-        "zip_path": None,
+        "zip_path": helpers.get_results_download_path(job_id),
         "error_message": None,
         "logs": [
             {
@@ -663,6 +931,22 @@ def start_scan_route():
                 "message": f"Job {job_id} creado y en cola.",
                 "type": "info",
             }
+        ]
+        + [
+            {
+                "timestamp": datetime.datetime.now().isoformat(),
+                "message": f"Herramienta omitida, {skipped_tool}.",
+                "type": "warn",
+            }
+            for skipped_tool in skipped_tools
+        ]
+        + [
+            {
+                "timestamp": datetime.datetime.now().isoformat(),
+                "message": f"Objetivos incompatibles: {skipped_target}.",
+                "type": "info",
+            }
+            for skipped_target in skipped_targets
         ],
         "tool_progress": {
             tool_entry["id"]: {
@@ -678,26 +962,30 @@ def start_scan_route():
     }
     helpers.save_job_summary(
         job_path, initial_summary_data
-    )  # Save initial summary.json
+    )  # Primeros eventos del diario del job
+    journal.compact(job_path)  # Instantánea inicial en summary.json
 
     db = get_db()
     try:
-        db.execute(
-            """INSERT INTO job (id, user_id, status, targets, selected_tools_config, advanced_options, creation_timestamp, results_path, overall_progress)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                job_id,
-                current_user.id,
-                "PENDING",
-                json.dumps(targets),
-                json.dumps(selected_tools_payload),
-                json.dumps(advanced_options_input),
-                initial_summary_data["creation_timestamp"],
-                str(job_path),
-                0,
-            ),
-        )
-        db.commit()
+        with metrics.DB_WRITE_SECONDS.time(operation="job_create"):
+            db.execute(
+                """INSERT INTO job (id, user_id, status, targets, target_count, targets_preview, selected_tools_config, advanced_options, creation_timestamp, results_path, overall_progress)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    job_id,
+                    current_user.id,
+                    "PENDING",
+                    json.dumps(targets),
+                    len(targets),
+                    json.dumps(targets[:JOBS_PREVIEW_TARGETS]),
+                    json.dumps(selected_tools_payload),
+                    json.dumps(advanced_options_input),
+                    initial_summary_data["creation_timestamp"],
+                    str(job_path),
+                    0,
+                ),
+            )
+            db.commit()
     except sqlite3.Error as e:
         current_app.logger.error(f"Error de DB al crear job {job_id}: {e}")
         helpers.save_job_summary(
@@ -719,28 +1007,20 @@ def start_scan_route():
             500,
         )
 
-    tool_definitions = helpers.get_tools_definition()  # Cargar una vez
-
-    # Pasar una copia del logger de la app al hilo
-    thread_logger = current_app.logger
+    # El job queda en PENDING; el planificador lo admitirá cuando haya capacidad
+    scan_scheduler.notify()
 
-    scan_thread = threading.Thread(
-        target=scan_job_thread_target,
-        args=(
-            job_id,
-            job_path,
-            targets,
-            selected_tools_payload,
-            advanced_options_input,
-            app.config["DATABASE"],
-            tool_definitions,
-            thread_logger,
+    return (
+        jsonify(
+            {
+                "message": "Trabajo de escaneo encolado.",
+                "job_id": job_id,
+                "skipped_tools": skipped_tools,
+                "skipped_targets": skipped_targets,
+            }
         ),
+        202,
     )
-    active_scan_threads[job_id] = scan_thread
-    scan_thread.start()
-
-    return jsonify({"message": "Trabajo de escaneo iniciado.", "job_id": job_id}), 202
 
 
 @app.route("/api/scan/status/<job_id>", methods=["GET"])
@@ -755,22 +1035,36 @@ def scan_status_route(job_id):
     if not job_data_db:
         return jsonify({"error": "Job no encontrado o no autorizado."}), 404
 
-    # Cargar el summary.json para obtener logs y tool_progress detallado
     job_path = job_data_db["results_path"]
-    summary_file_path = Path(job_path) / "summary.json"
-    summary_data_file = {}
-    if summary_file_path.exists():
-        try:
-            with open(summary_file_path, "r", encoding="utf-8") as f:
-                summary_data_file = json.load(f)
-        except json.JSONDecodeError:
-            current_app.logger.warning(
-                f"Job {job_id}: summary.json corrupto al obtener estado."
-            )
-            summary_data_file = {
-                "logs": [{"message": "summary.json corrupto", "type": "error"}],
-                "tool_progress": {},
+    since = request.args.get("since", type=int)
+    if since is not None and since >= 0:
+        # Modo delta: solo logs y entradas de tool_progress posteriores al cursor
+        delta = (
+            journal.read_delta(job_path, since)
+            if Path(job_path).is_dir()
+            else {"logs": [], "tool_progress": {}, "fields": {}, "cursor": since}
+        )
+        return jsonify(
+            {
+                "job_id": job_data_db["id"],
+                "status": job_data_db["status"],
+                "overall_progress": job_data_db["overall_progress"],
+                "start_time": job_data_db["start_timestamp"],
+                "end_time": job_data_db["end_timestamp"],
+                "logs": delta["logs"],
+                "tool_progress": delta["tool_progress"],
+                "error_message": job_data_db["error_message"]
+                or delta["fields"].get("error_message"),
+                "zip_path": helpers.get_results_download_path(job_data_db["id"]),
+                "cursor": delta["cursor"],
+                "delta": True,
             }
+        )
+
+    # Instantánea summary.json + cola del diario para obtener logs y tool_progress detallado
+    summary_data_file = {}
+    if Path(job_path).is_dir():
+        summary_data_file = journal.load_state(job_path)
 
     response_data = {
         "job_id": job_data_db["id"],
@@ -779,41 +1073,240 @@ def scan_status_route(job_id):
         "start_time": job_data_db["start_timestamp"],
         "end_time": job_data_db["end_timestamp"],
         "targets": json.loads(job_data_db["targets"]) if job_data_db["targets"] else [],
-        "logs": summary_data_file.get("logs", []),  # Logs desde summary.json
+        "logs": summary_data_file.get("logs", []),  # Logs desde el diario del job
         "tool_progress": summary_data_file.get(
             "tool_progress", {}
-        ),  # Progreso detallado desde summary.json
+        ),  # Progreso detallado (instantánea + eventos posteriores)
         "error_message": job_data_db["error_message"]
         or summary_data_file.get("error_message"),
-        "zip_path": job_data_db["zip_path"],
+        "zip_path": helpers.get_results_download_path(job_data_db["id"]),
+        "cursor": summary_data_file.get("journal_offset", 0),
     }
     return jsonify(response_data)
 
 
+@app.route("/api/scan/findings/<job_id>", methods=["GET"])
+@login_required
+def scan_findings_route(job_id):
+    """Resultados normalizados del job: resumen por tabla o filas de `?kind=` (hosts, ports, urls, findings)."""
+    db = get_db()
+    if not db.execute(
+        "SELECT 1 FROM job WHERE id = ? AND user_id = ?", (job_id, current_user.id)
+    ).fetchone():
+        return jsonify({"error": "Job no encontrado o no autorizado."}), 404
+
+    kind = request.args.get("kind")
+    if not kind:
+        return jsonify({"job_id": job_id, "summary": findings.get_job_findings_summary(db, job_id)})
+    if kind not in findings.FINDINGS_TABLES:
+        return jsonify({"error": f"Tipo de resultado no válido: {kind}."}), 400
+    limit = request.args.get("limit", FINDINGS_PAGE_SIZE, type=int) or FINDINGS_PAGE_SIZE
+    limit = max(1, min(limit, FINDINGS_MAX_PAGE_SIZE))
+    return jsonify(
+        {"job_id": job_id, "kind": kind, "rows": findings.get_job_findings(db, job_id, kind, limit)}
+    )
+
+
+def _format_sse(event_name, data, event_id=None):
+    message = ""
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    message += f"event: {event_name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return message
+
+
+@app.route("/api/scan/events/<job_id>", methods=["GET"])
+@login_required
+def scan_events_route(job_id):
+    """Server-Sent Events con los eventos del diario del job a partir de un cursor."""
+    db = get_db()
+    job_data_db = db.execute(
+        "SELECT results_path FROM job WHERE id = ? AND user_id = ?",
+        (job_id, current_user.id),
+    ).fetchone()
+    if not job_data_db:
+        return jsonify({"error": "Job no encontrado o no autorizado."}), 404
+
+    job_path = job_data_db["results_path"]
+    # EventSource reenvía el último id recibido al reconectar
+    cursor = request.headers.get("Last-Event-ID", type=int)
+    if cursor is None:
+        cursor = request.args.get("since", 0, type=int)
+    db_path = app.config["DATABASE"]
+
+    def event_stream():
+        nonlocal cursor
+        last_status = None
+        last_heartbeat = time.monotonic()
+        conn = database.get_pool(db_path).acquire()
+        try:
+            while True:
+                for event, next_cursor in journal.iter_events(job_path, cursor):
+                    cursor = next_cursor
+                    kind = event.get("event")
+                    if kind == "log":
+                        yield _format_sse("log", journal.log_entry_from_event(event), cursor)
+                    elif kind == "progress":
+                        yield _format_sse(
+                            "progress",
+                            {"key": event["key"], "update": event.get("update", {})},
+                            cursor,
+                        )
+                    elif kind == "summary":
+                        yield _format_sse("summary", event.get("fields", {}), cursor)
+
+                job_row = conn.execute(
+                    "SELECT status, overall_progress FROM job WHERE id = ?",
+                    (job_id,),
+                ).fetchone()
+                if job_row is None:
+                    return
+                if job_row[0] != last_status:
+                    last_status = job_row[0]
+                    yield _format_sse(
+                        "status",
+                        {
+                            "status": job_row[0],
+                            "overall_progress": job_row[1],
+                            "zip_path": helpers.get_results_download_path(job_id),
+                        },
+                    )
+                if job_row[0] in TERMINAL_JOB_STATUSES:
+                    yield _format_sse("end", {"status": job_row[0], "cursor": cursor})
+                    return
+
+                if time.monotonic() - last_heartbeat > 15:
+                    last_heartbeat = time.monotonic()
+                    yield ": keep-alive\n\n"
+                time.sleep(1)
+        finally:
+            database.get_pool(db_path).release(conn)
+
+    return Response(
+        event_stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _encode_jobs_cursor(creation_timestamp, job_id):
+    return base64.urlsafe_b64encode(
+        json.dumps([creation_timestamp, job_id]).encode("utf-8")
+    ).decode("ascii")
+
+
+def _decode_jobs_cursor(cursor):
+    """(creation_timestamp, job_id) del último job de la página anterior; ValueError si no es válido."""
+    try:
+        creation_timestamp, job_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (TypeError, ValueError, UnicodeError, binascii.Error) as e:
+        raise ValueError("cursor inválido") from e
+    return creation_timestamp, job_id
+
+
 @app.route("/api/jobs", methods=["GET"])
 @login_required
 def api_get_jobs():
+    """Historial de jobs del usuario paginado por cursor (más recientes primero).
+
+    Filtros: `status` (lista separada por comas), `since`/`until` (fecha de creación ISO)
+    y `target` (subcadena). La página trae hasta JOBS_PREVIEW_TARGETS objetivos por job.
+    """
+    limit = request.args.get("limit", JOBS_PAGE_SIZE, type=int) or JOBS_PAGE_SIZE
+    limit = max(1, min(limit, JOBS_MAX_PAGE_SIZE))
+
+    conditions = ["user_id = ?"]
+    params = [current_user.id]
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            cursor_timestamp, cursor_job_id = _decode_jobs_cursor(cursor)
+        except ValueError:
+            return jsonify({"error": "Cursor de paginación inválido."}), 400
+        conditions.append("(creation_timestamp, id) < (?, ?)")
+        params.extend([cursor_timestamp, cursor_job_id])
+    statuses = [
+        status.strip().upper()
+        for status in request.args.get("status", "").split(",")
+        if status.strip()
+    ]
+    if statuses:
+        conditions.append(f"status IN ({', '.join('?' * len(statuses))})")
+        params.extend(statuses)
+    if request.args.get("since"):
+        conditions.append("creation_timestamp >= ?")
+        params.append(request.args["since"])
+    if request.args.get("until"):
+        conditions.append("creation_timestamp < ?")
+        params.append(request.args["until"])
+    if request.args.get("target"):
+        escaped_target = re.sub(r"([\\%_])", r"\\\1", request.args["target"].lower())
+        conditions.append("lower(targets) LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped_target}%")
+
     db = get_db()
-    cur = db.execute(
-        "SELECT id, status, creation_timestamp, targets, zip_path FROM job WHERE user_id = ? ORDER BY creation_timestamp DESC",
-        (current_user.id,),
-    )
-    jobs_raw = cur.fetchall()
+    rows = db.execute(
+        f"""SELECT id, status, creation_timestamp, target_count, targets_preview
+            FROM job
+            WHERE {' AND '.join(conditions)}
+            ORDER BY creation_timestamp DESC, id DESC
+            LIMIT ?""",
+        params + [limit + 1],
+    ).fetchall()
+
+    jobs_list = [
+        {
+            "id": row["id"],
+            "status": row["status"],
+            "timestamp": row["creation_timestamp"],  # Usar creation_timestamp para consistencia
+            "targets": json.loads(row["targets_preview"]) if row["targets_preview"] else [],
+            "target_count": row["target_count"] or 0,
+            "zip_path": helpers.get_results_download_path(row["id"]),
+        }
+        for row in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last_row = rows[limit - 1]
+        next_cursor = _encode_jobs_cursor(last_row["creation_timestamp"], last_row["id"])
+    return jsonify({"jobs": jobs_list, "next_cursor": next_cursor})
 
-    jobs_list = []
-    for row in jobs_raw:
-        jobs_list.append(
-            {
-                "id": row["id"],
-                "status": row["status"],
-                "timestamp": row[
-                    "creation_timestamp"
-                ],  # Usar creation_timestamp para consistencia
-                "targets": json.loads(row["targets"]) if row["targets"] else [],
-                "zip_path": row["zip_path"],
-            }
+
+@app.route("/api/search", methods=["GET"])
+@login_required
+def api_search():
+    """Búsqueda de texto completo en las salidas de los jobs del usuario.
+
+    `q` es obligatorio (todas las palabras deben aparecer); filtros opcionales `job_id` y
+    `tool_id`; paginación con `limit` y `offset`.
+    """
+    query_text = request.args.get("q", "").strip()
+    if not query_text:
+        return jsonify({"error": "Falta el texto a buscar (q)."}), 400
+    limit = request.args.get("limit", SEARCH_PAGE_SIZE, type=int) or SEARCH_PAGE_SIZE
+    limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+    offset = max(0, request.args.get("offset", 0, type=int) or 0)
+
+    try:
+        rows = output_index.search(
+            get_db(),
+            current_user.id,
+            query_text,
+            limit + 1,
+            offset,
+            job_id=request.args.get("job_id"),
+            tool_id=request.args.get("tool_id"),
         )
-    return jsonify(jobs_list)
+    except sqlite3.OperationalError as e:
+        current_app.logger.warning(f"Búsqueda inválida '{query_text}': {e}")
+        return jsonify({"error": "No se pudo interpretar la búsqueda."}), 400
+    return jsonify(
+        {
+            "query": query_text,
+            "results": rows[:limit],
+            "next_offset": offset + limit if len(rows) > limit else None,
+        }
+    )
 
 
 @app.route("/api/scan/cancel/<job_id>", methods=["POST"])
@@ -843,35 +1336,40 @@ def cancel_scan_route(job_id):
         )
 
     try:
-        # Actualizar estado en DB a REQUEST_CANCEL. El hilo del job debería detectarlo.
-        db.execute("UPDATE job SET status = ? WHERE id = ?", ("REQUEST_CANCEL", job_id))
+        # Un job que sigue en la cola se cancela directamente: no hay hilo que lo detecte.
+        cur_pending = db.execute(
+            "UPDATE job SET status = ?, end_timestamp = ? WHERE id = ? AND status = 'PENDING'",
+            ("CANCELLED", datetime.datetime.now().isoformat(), job_id),
+        )
+        new_status = "CANCELLED"
+        if cur_pending.rowcount == 0:
+            # Actualizar estado en DB a REQUEST_CANCEL. El hilo del job debería detectarlo.
+            db.execute(
+                "UPDATE job SET status = ? WHERE id = ?", ("REQUEST_CANCEL", job_id)
+            )
+            new_status = "REQUEST_CANCEL"
         db.commit()
+        if new_status == "REQUEST_CANCEL":
+            # Mata ya las herramientas en curso si el job corre en este proceso;
+            # si no, el motor verá REQUEST_CANCEL en la DB en unos segundos.
+            scan_scheduler.request_cancel(job_id)
 
-        # Actualizar summary.json también
-        summary_file_path = Path(job_path) / "summary.json"
-        s_data = {}
-        if summary_file_path.exists():
-            with open(summary_file_path, "r") as f:
-                s_data = json.load(f)
-        if "logs" not in s_data:
-            s_data["logs"] = []
-        s_data["status"] = "REQUEST_CANCEL"
-        s_data["logs"].append(
-            {
-                "timestamp": datetime.datetime.now().isoformat(),
-                "message": f"Solicitud de cancelación recibida para job {job_id}.",
-                "type": "warn",
-            }
+        # Registrar también en el diario del job
+        journal.append_events(
+            job_path,
+            [
+                journal.make_summary_event({"status": new_status}),
+                journal.make_log_event(
+                    f"Solicitud de cancelación recibida para job {job_id}.", "warn"
+                ),
+            ],
         )
-        with open(summary_file_path, "w") as f:
-            json.dump(s_data, f, indent=4)
 
         current_app.logger.info(
             f"Solicitud de cancelación para job {job_id} registrada."
         )
-        # El hilo de escaneo es responsable de verificar esta bandera y detenerse.
         # Si el hilo ya terminó, el estado final (COMPLETED, ERROR) prevalecerá eventualmente.
-        # Si el hilo se detiene limpiamente, debería actualizar el estado a CANCELLED.
+        # Al detenerse, el hilo del job actualiza el estado a CANCELLED.
         return (
             jsonify(
                 {"message": f"Solicitud de cancelación para el job {job_id} enviada."}
@@ -886,48 +1384,56 @@ def cancel_scan_route(job_id):
         )
 
 
-@app.route(
-    "/api/results/download/<zip_filename>"
-)  # Cambiado para usar el nombre del archivo directamente
+@app.route("/api/results/download/<zip_filename>")
 @login_required
 def download_job_results_zip(zip_filename):
-    # Validar que el zip_filename pertenezca a un job del usuario actual
-    db = get_db()
-    # El zip_filename podría ser job_id + "_results.zip"
-    # Necesitamos extraer el job_id para verificar la propiedad.
-    # Asumimos que zip_filename es como "scan_YYYYMMDD_HHMMSS_ffffff_results.zip"
-
-    # Forma más segura: buscar en la DB por zip_path
-    # El zip_path en la DB es como "/api/results/download/scan_..."
-    db_zip_path_search = f"/api/results/download/{zip_filename}"
-    cur = db.execute(
-        "SELECT results_path FROM job WHERE zip_path = ? AND user_id = ?",
-        (db_zip_path_search, current_user.id),
-    )
-    job_data = cur.fetchone()
+    """ZIP de los resultados del job generado al vuelo; parcial si el job sigue en curso.
 
+    `?compression=0-9` elige el nivel de compresión (0 = sin comprimir).
+    """
+    job_id = zip_filename.removesuffix(".zip").removesuffix("_results")
+    db = get_db()
+    job_data = db.execute(
+        "SELECT results_path, status FROM job WHERE id = ? AND user_id = ?",
+        (job_id, current_user.id),
+    ).fetchone()
     if not job_data:
         return jsonify({"error": "Archivo ZIP no encontrado o no autorizado."}), 404
 
-    # El archivo ZIP se almacena en app.config['RESULTS_DIR']
-    file_on_disk_path = Path(app.config["RESULTS_DIR"]) / zip_filename
-
-    if not file_on_disk_path.is_file():
+    job_path = job_data["results_path"]
+    if not Path(job_path).is_dir():
         current_app.logger.error(
-            f"Archivo ZIP {file_on_disk_path} no encontrado en disco para job (DB path: {db_zip_path_search})."
+            f"Directorio de resultados {job_path} no encontrado en disco para job {job_id}."
         )
-        return jsonify({"error": "Archivo ZIP no encontrado en el servidor."}), 404
+        return jsonify({"error": "Resultados no encontrados en el servidor."}), 404
 
-    try:
-        return send_file(
-            str(file_on_disk_path),
-            as_attachment=True,
-            download_name=zip_filename,
-            mimetype="application/zip",
-        )
-    except Exception as e:
-        current_app.logger.error(f"Error al enviar archivo ZIP {zip_filename}: {e}")
-        return jsonify({"error": "No se pudo enviar el archivo ZIP."}), 500
+    compression_level = request.args.get(
+        "compression", zip_stream.DEFAULT_COMPRESSION_LEVEL, type=int
+    )
+    if compression_level is None or not 0 <= compression_level <= 9:
+        return jsonify({"error": "El nivel de compresión debe estar entre 0 y 9."}), 400
+
+    download_name = zip_filename
+    if job_data["status"] not in TERMINAL_JOB_STATUSES:
+        download_name = f"{job_id}_results_partial.zip"
+
+    def generate_zip():
+        try:
+            yield from zip_stream.iter_zip_stream(job_path, compression_level)
+        except Exception as e:
+            # Los cabeceras ya se enviaron: solo queda cortar la descarga
+            app.logger.error(f"Error al generar ZIP para job {job_id}: {e}")
+            raise
+
+    return Response(
+        generate_zip(),
+        mimetype="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{download_name}"',
+            "Cache-Control": "no-store",
+            "X-Accel-Buffering": "no",
+        },
+    )
 
 
 if __name__ == "__main__":
@@ -952,4 +1458,8 @@ if __name__ == "__main__":
                 )
             cursor_check.close()
 
+    # Retomar ya en el arranque los jobs interrumpidos; con el reloader, solo en el proceso que sirve
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true" and app.config["SCAN_EXECUTION_MODE"] != "workers":
+        scan_scheduler.ensure_started()
+
     app.run(host="0.0.0.0", port=5000, debug=True)
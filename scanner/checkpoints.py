@@ -0,0 +1,63 @@
+"""Checkpoints de las tareas de un job en la tabla `job_task`.
+
+Cada tarea que termina (completada, con error u omitida por una dependencia) se
+guarda al momento. Si el servidor se reinicia con el job a medias, el job vuelve a
+la cola y al reanudarse las tareas completadas no se repiten: aportan su archivo de
+salida a las que dependen de ellas. Las que fallaron o se omitieron (quizá por la
+propia interrupción) se vuelven a planificar. Los workers independientes (ver
+scanner.worker) leen de aquí también el resultado de las dependencias de cada tarea.
+"""
+import datetime
+import os
+
+CHECKPOINT_STATUSES = ("completed", "error", "skipped")
+
+
+def save_task_checkpoint(conn, job_id, task_key, tool_id, status, output_path=None):
+    """Guarda el resultado final de una tarea (las demás situaciones no se guardan)."""
+    if status not in CHECKPOINT_STATUSES:
+        return
+    conn.execute(
+        """INSERT INTO job_task (job_id, task_key, tool_id, status, output_path, updated_at)
+           VALUES (?, ?, ?, ?, ?, ?)
+           ON CONFLICT (job_id, task_key) DO UPDATE SET
+               status = excluded.status,
+               output_path = excluded.output_path,
+               updated_at = excluded.updated_at""",
+        (job_id, task_key, tool_id, status, output_path, datetime.datetime.now().isoformat()),
+    )
+    conn.commit()
+
+
+def load_reusable_tasks(conn, job_id, task_keys):
+    """{task_key: {"status", "output_path"}} de las tareas completadas que no hay que repetir.
+
+    Una tarea completada cuya salida ya no existe se vuelve a ejecutar.
+    """
+    reusable = {}
+    rows = conn.execute(
+        "SELECT task_key, status, output_path FROM job_task WHERE job_id = ? AND status = 'completed'",
+        (job_id,),
+    ).fetchall()
+    for row in rows:
+        if row["task_key"] not in task_keys:
+            continue  # La configuración cambió desde la ejecución anterior
+        if row["output_path"] and not os.path.exists(row["output_path"]):
+            continue
+        reusable[row["task_key"]] = {"status": row["status"], "output_path": row["output_path"]}
+    return reusable
+
+
+def load_task_results(conn, job_id, task_keys):
+    """{task_key: {"status", "output_path"}} de las tareas de `task_keys` con checkpoint."""
+    if not task_keys:
+        return {}
+    rows = conn.execute(
+        f"""SELECT task_key, status, output_path FROM job_task
+            WHERE job_id = ? AND task_key IN ({', '.join('?' * len(task_keys))})""",
+        [job_id, *task_keys],
+    ).fetchall()
+    return {
+        row["task_key"]: {"status": row["status"], "output_path": row["output_path"]}
+        for row in rows
+    }
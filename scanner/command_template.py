@@ -0,0 +1,234 @@
+"""Plantillas de comando compiladas.
+
+Cada `command_template` de tools_config.json se compila una sola vez: se separa
+una redirección final `> {placeholder}` (el motor escribe stdout en ese archivo
+sin pasar por un shell), se tokeniza con shlex y se guarda qué placeholders usa.
+Solo los comandos con pipes u otros operadores de shell se ejecutan con shell.
+"""
+import re
+import shlex
+from urllib.parse import urlsplit
+
+PLACEHOLDER_RE = re.compile(r"\{([a-zA-Z0-9_]+)\}")
+_STDOUT_REDIRECT_RE = re.compile(r"^(?P<body>.*?)\s*>\s*\{(?P<name>[a-zA-Z0-9_]+)\}\s*$", re.S)
+_SHELL_OPERATORS_RE = re.compile(r"[|&;<>`$()]")
+_SHELL_COMMAND_SEPARATOR_RE = re.compile(r"\|\||&&|[|;&]")
+_SHELL_BUILTINS = frozenset({"echo", "printf", "cd", "test", "[", "true", "false", "export", "exec"})
+
+TARGET_PLACEHOLDERS = (
+    "target",
+    "target_url",
+    "target_domain",
+    "target_host_or_ip",
+    "target_port",
+    "target_host_or_ip_and_port",
+)
+OUTPUT_PLACEHOLDERS = (
+    "output_file",
+    "output_file_base",
+    "output_file_json",
+    "output_file_xml",
+    "output_file_dir",
+)
+# Valores que genera el motor: nunca se parten en varios argumentos
+ENGINE_PLACEHOLDERS = frozenset(
+    TARGET_PLACEHOLDERS + OUTPUT_PLACEHOLDERS + ("input_file", "targets_file")
+)
+
+
+class TemplateError(ValueError):
+    """La plantilla no se puede renderizar (placeholders sin valor o parámetros mal citados)."""
+
+
+def _split_param(name, value):
+    """Argumentos de un parámetro libre (p. ej. {nmap_extra_args}) según las reglas del shell."""
+    try:
+        return shlex.split(value)
+    except ValueError as e:
+        raise TemplateError(f"{{{name}}} no se puede separar en argumentos ({e}): {value}") from e
+
+
+def get_target_values(target_value):
+    """Placeholders derivados de un objetivo (dominio, IP, host:puerto o URL).
+
+    `target_port` solo aparece si el objetivo indica puerto (o esquema http/https).
+    """
+    values = {
+        "target": target_value,
+        "target_url": target_value,
+        "target_domain": target_value,
+        "target_host_or_ip": target_value,
+        "target_host_or_ip_and_port": target_value,
+    }
+    host, port = target_value, None
+    if "://" in target_value:
+        parts = urlsplit(target_value)
+        host = parts.hostname or target_value
+        try:
+            port = parts.port
+        except ValueError:
+            port = None
+        if port is None:
+            port = {"http": 80, "https": 443}.get(parts.scheme.lower())
+    elif target_value.count(":") == 1:  # host:puerto (no IPv6)
+        host, _, port_text = target_value.partition(":")
+        port = int(port_text) if port_text.isdigit() else None
+    values["target_domain"] = values["target_host_or_ip"] = host
+    values["target_host_or_ip_and_port"] = host
+    if port is not None:
+        values["target_port"] = str(port)
+        values["target_host_or_ip_and_port"] = f"{host}:{port}"
+    return values
+
+
+def get_param_values(tool_definition, cli_params=None):
+    """Parámetros CLI: defaults de `cli_params_config` ("" si no tienen) sobrescritos por el usuario."""
+    values = {
+        param_config["name"]: str(param_config.get("default") or "")
+        for param_config in tool_definition.get("cli_params_config", [])
+    }
+    for param_key, param_value in (cli_params or {}).items():
+        values[param_key] = "" if param_value is None else str(param_value)
+    return values
+
+
+class CommandTemplate:
+    def __init__(self, template, needs_shell=False):
+        self.source = template
+        self.placeholders = frozenset(PLACEHOLDER_RE.findall(template))
+
+        body = template
+        self.stdout_placeholder = None
+        redirect_match = _STDOUT_REDIRECT_RE.match(template)
+        if redirect_match and not _SHELL_OPERATORS_RE.search(
+            redirect_match.group("body").replace("|", "")
+        ):
+            body = redirect_match.group("body")
+            self.stdout_placeholder = redirect_match.group("name")
+        self.body = body
+
+        # `needs_shell` solo se respeta si queda algún operador de shell tras quitar la redirección
+        self.use_shell = bool(needs_shell and _SHELL_OPERATORS_RE.search(body))
+        self._tokens = None if self.use_shell else [
+            self._compile_token(token) for token in shlex.split(body)
+        ]
+        self.binaries = self._find_binaries()
+
+    def _find_binaries(self):
+        """Ejecutables que invoca la plantilla (sin builtins del shell ni nombres con placeholders)."""
+        if not self.use_shell:
+            first_parts = self._tokens[0][0] if self._tokens else [""]
+            return [first_parts[0]] if len(first_parts) == 1 and first_parts[0] else []
+        binaries = []
+        for segment in _SHELL_COMMAND_SEPARATOR_RE.split(self.body):
+            try:
+                words = shlex.split(segment)
+            except ValueError:
+                continue
+            if words and words[0] not in _SHELL_BUILTINS and not PLACEHOLDER_RE.search(words[0]):
+                binaries.append(words[0])
+        return binaries
+
+    @staticmethod
+    def _compile_token(token):
+        parts = PLACEHOLDER_RE.split(token)  # [literal, nombre, literal, nombre, ...]
+        whole_param = (
+            len(parts) == 3
+            and parts[0] == ""
+            and parts[2] == ""
+            and parts[1] not in ENGINE_PLACEHOLDERS
+        )
+        return parts, whole_param
+
+    def missing_placeholders(self, values):
+        return sorted(name for name in self.placeholders if name not in values)
+
+    def render(self, values):
+        """Devuelve (comando, ruta_stdout): argv (lista) o cadena de shell, y el archivo de stdout o None."""
+        missing = self.missing_placeholders(values)
+        if missing:
+            raise TemplateError(
+                "Placeholders sin valor: " + ", ".join("{" + name + "}" for name in missing)
+            )
+        stdout_path = values[self.stdout_placeholder] if self.stdout_placeholder else None
+
+        if self.use_shell:
+            def substitute(match):
+                name = match.group(1)
+                # Los valores del motor se citan; los parámetros pueden ser varios argumentos
+                if name in ENGINE_PLACEHOLDERS:
+                    return shlex.quote(values[name])
+                _split_param(name, values[name])  # Unas comillas sin cerrar romperían el comando
+                return values[name]
+
+            return PLACEHOLDER_RE.sub(substitute, self.body), stdout_path
+
+        argv = []
+        for parts, whole_param in self._tokens:
+            if whole_param:
+                # Un parámetro solo (p. ej. {nmap_extra_args}) aporta 0..n argumentos
+                argv.extend(_split_param(parts[1], values[parts[1]]))
+                continue
+            argv.append(
+                "".join(
+                    values[part] if i % 2 else part for i, part in enumerate(parts)
+                )
+            )
+        return argv, stdout_path
+
+    def display(self, command, stdout_path=None):
+        """Comando legible para logs y progreso."""
+        text = command if isinstance(command, str) else shlex.join(command)
+        return f"{text} > {shlex.quote(stdout_path)}" if stdout_path else text
+
+
+def compile_tool_templates(tool_definitions):
+    """Compila las plantillas de todas las herramientas: {tool_id: CommandTemplate}."""
+    return {
+        tool_id: CommandTemplate(
+            tool_definition.get("command_template", ""),
+            tool_definition.get("needs_shell", False),
+        )
+        for tool_id, tool_definition in tool_definitions.items()
+        if tool_definition.get("command_template")
+    }
+
+
+def find_unfilled_placeholders(
+    template, tool_definition, cli_params, targets, has_input=False, is_batch=False
+):
+    """Placeholders que quedarían sin valor al ejecutar la herramienta, por objetivo.
+
+    Devuelve {objetivo: [nombres]} (clave None para herramientas de lote); vacío si todo se rellena.
+    """
+    base_values = get_param_values(tool_definition, cli_params)
+    base_values.update({name: "" for name in OUTPUT_PLACEHOLDERS})
+    if has_input:
+        base_values["input_file"] = ""
+    if is_batch:
+        base_values["targets_file"] = ""
+        missing = template.missing_placeholders(base_values)
+        return {None: missing} if missing else {}
+
+    unfilled = {}
+    for target_value in targets:
+        missing = template.missing_placeholders(
+            dict(base_values, **get_target_values(target_value))
+        )
+        if missing:
+            unfilled[target_value] = missing
+    return unfilled
+
+
+def find_param_errors(template, tool_definition, cli_params):
+    """Error al renderizar la plantilla con los parámetros del usuario (None si es válida).
+
+    Los placeholders del motor se rellenan con valores vacíos: solo se comprueban los parámetros.
+    """
+    values = {name: "" for name in template.placeholders}
+    values.update(get_param_values(tool_definition, cli_params))
+    try:
+        template.render(values)
+    except TemplateError as e:
+        return str(e)
+    return None
@@ -4,6 +4,7 @@ import datetime
 import shlex
 import time
 import shutil # Added import
+import functools
 from utils import get_tool_config # Importar la función para obtener la configuración de herramientas
 
 MAX_CONCURRENT_TOOLS = 3 # Limitar concurrencia para no sobrecargar el sistema (12GB RAM)
@@ -15,15 +16,13 @@ def log_message(job_id, message, active_jobs, level='INFO'):
     if job_id in active_jobs:
         active_jobs[job_id]['logs'].append(log_entry)
 
+@functools.lru_cache(maxsize=None)
+def _which(tool_name, search_path):
+    return shutil.which(tool_name, path=search_path)
+
 def check_tool_installed(tool_name):
-    """Verifica si una herramienta está instalada y es ejecutable usando shutil.which."""
-    if shutil.which(tool_name):
-        return True
-    else:
-        # Opcional: Podríamos intentar verificar si es una ruta absoluta y si existe y es ejecutable
-        # if os.path.isabs(tool_name) and os.path.exists(tool_name) and os.access(tool_name, os.X_OK):
-        #    return True
-        return False
+    """Verifica si una herramienta está instalada y es ejecutable (resultado cacheado por PATH)."""
+    return _which(tool_name, os.environ.get("PATH")) is not None
 
 def run_single_tool(job_id, target, tool_config, job_path, active_jobs):
     tool_name = tool_config['name']
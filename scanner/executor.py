@@ -0,0 +1,600 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import errno
+import os
+import resource
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import psutil
+
+STREAM_CHUNK_SIZE = 64 * 1024
+STDERR_TAIL_BYTES = 1024
+CANCEL_POLL_INTERVAL = 0.5
+TERMINATE_GRACE_SECONDS = 5.0
+RESOURCE_SAMPLE_INTERVAL = 0.5
+CPU_LIMIT_GRACE_SECONDS = 5  # Entre SIGXCPU (límite blando) y SIGKILL (límite duro)
+LIMITS_GATE_SCRIPT = 'read _gate; exec "$@" < /dev/null'
+PROCESS_LOOP_IO_THREADS = 8  # Hilos compartidos del bucle para el trabajo bloqueante (disco, DB, psutil)
+
+_process_loop = None
+_process_loop_lock = threading.Lock()
+
+
+def _pump_stream(stream, sink, stats, prefix, stderr_tail=None):
+    """Copia un pipe al archivo destino por bloques, sin acumular la salida en memoria."""
+    try:
+        while True:
+            chunk = stream.read1(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            sink.write(chunk)
+            stats[f"{prefix}_bytes"] += len(chunk)
+            stats[f"{prefix}_lines"] += chunk.count(b"\n")
+            if stderr_tail is not None:
+                stderr_tail[:] = (stderr_tail + chunk)[-STDERR_TAIL_BYTES:]
+    finally:
+        stream.close()
+
+
+def _process_limits(resource_limits):
+    """(cpu_seconds, nice) a aplicar al proceso, o None si no hay ninguno."""
+    cpu_seconds = int(resource_limits.get("cpu_seconds") or 0)
+    nice = max(0, int(resource_limits.get("nice") or 0))
+    return (cpu_seconds, nice) if cpu_seconds or nice else None
+
+
+def _limits_gate_argv(args, use_shell):
+    """Envuelve el comando en un sh que espera una línea por stdin antes del exec.
+
+    Los límites se aplican desde el padre (preexec_fn no es seguro con hilos y obliga
+    a usar fork); mientras tanto el proceso está parado en la puerta, así que el
+    comando real y todo lo que lance ya nacen con ellos. exec conserva el pid.
+    """
+    if use_shell:
+        args = ["/bin/sh", "-c", args]
+    elif os.sep not in args[0] and shutil.which(args[0]) is None:
+        # Igual que Popen sin la puerta: una herramienta ausente es un OSError
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), args[0])
+    return ["/bin/sh", "-c", LIMITS_GATE_SCRIPT, "panthera-gate"] + list(args)
+
+
+def _apply_process_limits(pid, limits):
+    """Aplica RLIMIT_CPU (prlimit) y `nice` a un proceso ya creado."""
+    cpu_seconds, nice = limits
+    try:
+        process = psutil.Process(pid)
+        if cpu_seconds:
+            process.rlimit(
+                resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + CPU_LIMIT_GRACE_SECONDS)
+            )
+        if nice:
+            process.nice(min(19, process.nice() + nice))
+    except psutil.Error:
+        pass  # Ya terminó
+
+
+def _wait_with_rusage(process, exited, usage):
+    """Espera al proceso con wait4 para obtener su consumo (incluidos los hijos que recogió)."""
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    usage["rusage"] = rusage
+    exited.set()
+
+
+def _sample_process_tree(root_process):
+    """(RSS en bytes, segundos de CPU) sumados sobre el proceso y todos sus descendientes."""
+    try:
+        processes = [root_process] + root_process.children(recursive=True)
+    except psutil.Error:
+        return 0, 0.0
+    rss_bytes, cpu_seconds = 0, 0.0
+    for proc in processes:
+        try:
+            with proc.oneshot():
+                rss_bytes += proc.memory_info().rss
+                cpu_times = proc.cpu_times()
+        except psutil.Error:
+            continue  # Terminó entre el listado y la lectura
+        cpu_seconds += (
+            cpu_times.user + cpu_times.system + cpu_times.children_user + cpu_times.children_system
+        )
+    return rss_bytes, cpu_seconds
+
+
+def _get_process(pid):
+    try:
+        return psutil.Process(pid)
+    except psutil.Error:
+        return None
+
+
+def _kill_process_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _terminate_process_group(process, grace_seconds):
+    """SIGTERM a todo el grupo; SIGKILL a lo que siga vivo pasados `grace_seconds`."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    deadline = time.monotonic() + grace_seconds
+    while time.monotonic() < deadline:
+        # El líder lo recoge el hilo de wait4, así que no cuenta como miembro del grupo
+        try:
+            os.killpg(process.pid, 0)
+        except ProcessLookupError:
+            return  # No queda ningún proceso del grupo
+        time.sleep(0.1)
+    _kill_process_group(process)
+
+
+def _finish_output_files(console_log_path, stderr_spool_path, stderr_label, stdout_path, stats):
+    """Cuenta la salida redirigida a `stdout_path` y anexa el spool de stderr al log."""
+    if stdout_path:
+        # Con stdout redirigido el proceso escribe directamente en el archivo: contar al final
+        stats["stdout_bytes"] = 0
+        with open(stdout_path, "rb") as f_stdout_read:
+            for chunk in iter(lambda: f_stdout_read.read(STREAM_CHUNK_SIZE), b""):
+                stats["stdout_bytes"] += len(chunk)
+                stats["stdout_lines"] += chunk.count(b"\n")
+
+    # Anexar stderr como sección final del log, copiando por bloques
+    with open(console_log_path, "ab") as f_out, open(stderr_spool_path, "rb") as f_err:
+        f_out.write(f"\n\n--- {stderr_label} ---\n".encode("utf-8"))
+        shutil.copyfileobj(f_err, f_out, STREAM_CHUNK_SIZE)
+    os.remove(stderr_spool_path)
+
+
+def run_streaming(
+    command,
+    console_log_path,
+    use_shell=False,
+    timeout=None,
+    header=None,
+    stdout_label="STDOUT",
+    stderr_label="STDERR",
+    on_progress=None,
+    progress_interval=5.0,
+    cwd=None,
+    cancel_event=None,
+    terminate_grace=TERMINATE_GRACE_SECONDS,
+    stdout_path=None,
+    resource_limits=None,
+    on_start=None,
+):
+    """Ejecuta un comando volcando stdout/stderr a disco mientras corre.
+
+    `command` es una lista argv o, con `use_shell`, una cadena. stdout se escribe
+    directamente en `console_log_path`, o en `stdout_path` si se indica (el proceso
+    hereda el archivo, equivalente a `> archivo` sin shell); stderr se escribe en un
+    archivo temporal que se anexa al final del log como sección propia.
+    `on_progress(stats)` se llama cada `progress_interval` segundos con los
+    contadores de bytes/líneas. Si se activa `cancel_event` o vence `timeout`, el
+    grupo de procesos recibe SIGTERM y, tras `terminate_grace` segundos, SIGKILL.
+    `resource_limits` admite `memory_mb` (RSS máximo del árbol de procesos, vigilado
+    por muestreo), `cpu_seconds` (RLIMIT_CPU de cada proceso) y `nice`, aplicados
+    desde el padre antes de que arranque el comando (ver `_limits_gate_argv`).
+    `on_start(pid)` se llama al crear el proceso; su pid es también el id de su grupo.
+    Devuelve un dict con `returncode`, `timed_out`, `cancelled`, `memory_exceeded`,
+    los contadores, el consumo (`peak_rss_mb`, `cpu_seconds`, `wall_seconds`) y
+    `stderr_tail` (últimos bytes de stderr, decodificados).
+    """
+    if use_shell or not isinstance(command, str):
+        args = command
+    else:
+        args = shlex.split(command)
+    stderr_spool_path = f"{console_log_path}.stderr.tmp"
+    stats = {
+        "stdout_bytes": 0,
+        "stdout_lines": 0,
+        "stderr_bytes": 0,
+        "stderr_lines": 0,
+    }
+    stderr_tail = bytearray()
+    timed_out = False
+    cancelled = False
+    memory_exceeded = False
+    resource_limits = resource_limits or {}
+    memory_limit_bytes = int(resource_limits.get("memory_mb") or 0) * 1024 * 1024
+    limits = _process_limits(resource_limits)
+    if limits:
+        args, use_shell = _limits_gate_argv(args, use_shell), False
+    usage = {}
+    peak_rss_bytes = 0
+    sampled_cpu_seconds = 0.0
+
+    with open(console_log_path, "wb") as f_out, open(stderr_spool_path, "wb") as f_err, (
+        open(stdout_path, "wb") if stdout_path else contextlib.nullcontext()
+    ) as f_stdout:
+        if header:
+            f_out.write(header.encode("utf-8"))
+        f_out.write(f"--- {stdout_label} ---\n".encode("utf-8"))
+        if f_stdout is not None:
+            f_out.write(f"(redirigido a {stdout_path})\n".encode("utf-8"))
+        f_out.flush()
+
+        try:
+            process = subprocess.Popen(
+                args,
+                shell=use_shell,
+                stdin=subprocess.PIPE if limits else subprocess.DEVNULL,
+                stdout=f_stdout if f_stdout is not None else subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=cwd,
+                start_new_session=True,  # Grupo propio: así se mata también a los hijos del shell
+            )
+        except OSError:
+            f_err.close()
+            os.remove(stderr_spool_path)
+            raise
+        readers = []
+        rusage_waiter = None
+        try:
+            if limits:
+                _apply_process_limits(process.pid, limits)
+                with contextlib.suppress(BrokenPipeError):
+                    process.stdin.write(b"\n")  # Abre la puerta
+                    process.stdin.close()
+            if on_start:
+                on_start(process.pid)
+            readers.append(
+                threading.Thread(
+                    target=_pump_stream,
+                    args=(process.stderr, f_err, stats, "stderr", stderr_tail),
+                    daemon=True,
+                )
+            )
+            if f_stdout is None:
+                readers.append(
+                    threading.Thread(
+                        target=_pump_stream,
+                        args=(process.stdout, f_out, stats, "stdout"),
+                        daemon=True,
+                    )
+                )
+            for reader in readers:
+                reader.start()
+            started_at = time.monotonic()
+            exited = threading.Event()
+            rusage_waiter = threading.Thread(
+                target=_wait_with_rusage, args=(process, exited, usage), daemon=True
+            )
+            rusage_waiter.start()
+            try:
+                root_process = psutil.Process(process.pid)
+            except psutil.Error:
+                root_process = None  # Ya terminó: el consumo sale de wait4
+
+            deadline = time.monotonic() + timeout if timeout else None
+            next_progress = time.monotonic() + progress_interval
+            next_sample = time.monotonic()
+            while True:
+                now = time.monotonic()
+                if root_process is not None and now >= next_sample:
+                    next_sample = now + RESOURCE_SAMPLE_INTERVAL
+                    rss_bytes, tree_cpu_seconds = _sample_process_tree(root_process)
+                    peak_rss_bytes = max(peak_rss_bytes, rss_bytes)
+                    sampled_cpu_seconds = max(sampled_cpu_seconds, tree_cpu_seconds)
+                wait_for = min(next_progress, next_sample) - now
+                if deadline is not None:
+                    wait_for = min(wait_for, deadline - now)
+                if cancel_event is not None:
+                    wait_for = min(wait_for, CANCEL_POLL_INTERVAL)
+                if exited.wait(timeout=max(0.0, wait_for)):
+                    break
+                if cancel_event is not None and cancel_event.is_set():
+                    cancelled = True
+                elif deadline is not None and time.monotonic() >= deadline:
+                    timed_out = True
+                elif memory_limit_bytes and peak_rss_bytes > memory_limit_bytes:
+                    memory_exceeded = True
+                if cancelled or timed_out or memory_exceeded:
+                    _terminate_process_group(process, terminate_grace)
+                    exited.wait()
+                    break
+                if time.monotonic() >= next_progress:
+                    next_progress += progress_interval
+                    if on_progress:
+                        if f_stdout is not None:
+                            stats["stdout_bytes"] = os.fstat(f_stdout.fileno()).st_size
+                        f_out.flush()  # El callback puede leer el log (p. ej. para indexarlo)
+                        on_progress(
+                            dict(
+                                stats,
+                                peak_rss_mb=round(peak_rss_bytes / (1024 * 1024), 1),
+                                cpu_seconds=round(sampled_cpu_seconds, 2),
+                            )
+                        )
+            wall_seconds = time.monotonic() - started_at
+        finally:
+            # Si algo falla a mitad (p. ej. on_progress), el grupo de procesos no puede quedar vivo
+            if process.returncode is None:
+                _kill_process_group(process)
+                if rusage_waiter is None:
+                    process.wait()
+                else:
+                    rusage_waiter.join()
+            for reader in readers:
+                reader.join()
+
+    _finish_output_files(console_log_path, stderr_spool_path, stderr_label, stdout_path, stats)
+
+    # wait4: CPU exacta del proceso y de los hijos que recogió; ru_maxrss (KiB) es el
+    # máximo de un solo proceso, el muestreo aporta la suma del árbol
+    rusage = usage["rusage"]
+    rusage_cpu_seconds = rusage.ru_utime + rusage.ru_stime
+    rusage_rss_bytes = rusage.ru_maxrss * 1024
+
+    result = dict(stats)
+    result.update(
+        {
+            "returncode": process.returncode,
+            "timed_out": timed_out,
+            "cancelled": cancelled,
+            "memory_exceeded": memory_exceeded,
+            "peak_rss_mb": round(max(peak_rss_bytes, rusage_rss_bytes) / (1024 * 1024), 1),
+            "cpu_seconds": round(max(sampled_cpu_seconds, rusage_cpu_seconds), 2),
+            "wall_seconds": round(wall_seconds, 2),
+            "stderr_tail": bytes(stderr_tail).decode("utf-8", errors="replace"),
+        }
+    )
+    return result
+
+
+def _run_process_loop(loop, ready):
+    asyncio.set_event_loop(loop)
+    loop.set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(
+            max_workers=PROCESS_LOOP_IO_THREADS, thread_name_prefix="panthera-process-io"
+        )
+    )
+    if sys.version_info < (3, 12):
+        # Antes de 3.12 el vigilante por defecto usa un hilo por proceso; con pidfd
+        # el propio bucle recoge a los hijos (Linux 5.3+)
+        try:
+            os.close(os.pidfd_open(os.getpid()))
+        except (AttributeError, OSError):
+            pass
+        else:
+            watcher = asyncio.PidfdChildWatcher()
+            watcher.attach_loop(loop)
+            asyncio.set_child_watcher(watcher)
+    ready.set()
+    loop.run_forever()
+
+
+def get_process_loop():
+    """Bucle de eventos compartido que supervisa los procesos de `run_streaming_async`.
+
+    Corre en un único hilo daemon del proceso y se crea la primera vez que se pide.
+    Su executor por defecto (`run_in_executor(None, ...)`) es un único pool de
+    PROCESS_LOOP_IO_THREADS hilos compartido por todos los jobs.
+    """
+    global _process_loop
+    with _process_loop_lock:
+        if _process_loop is None or _process_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            threading.Thread(
+                target=_run_process_loop,
+                args=(loop, ready),
+                name="panthera-process-loop",
+                daemon=True,
+            ).start()
+            ready.wait()
+            _process_loop = loop
+        return _process_loop
+
+
+async def _pump_stream_async(stream, sink, stats, prefix, stderr_tail=None):
+    """Versión asíncrona de `_pump_stream`."""
+    while True:
+        chunk = await stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        sink.write(chunk)
+        stats[f"{prefix}_bytes"] += len(chunk)
+        stats[f"{prefix}_lines"] += chunk.count(b"\n")
+        if stderr_tail is not None:
+            stderr_tail[:] = (stderr_tail + chunk)[-STDERR_TAIL_BYTES:]
+
+
+async def _terminate_process_group_async(process, grace_seconds):
+    """Versión asíncrona de `_terminate_process_group`: la espera no bloquea el bucle."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    deadline = time.monotonic() + grace_seconds
+    while time.monotonic() < deadline:
+        try:
+            os.killpg(process.pid, 0)
+        except ProcessLookupError:
+            return
+        await asyncio.sleep(0.1)
+    _kill_process_group(process)
+
+
+async def run_streaming_async(
+    command,
+    console_log_path,
+    use_shell=False,
+    timeout=None,
+    header=None,
+    stdout_label="STDOUT",
+    stderr_label="STDERR",
+    on_progress=None,
+    progress_interval=5.0,
+    cwd=None,
+    cancel_event=None,
+    terminate_grace=TERMINATE_GRACE_SECONDS,
+    stdout_path=None,
+    resource_limits=None,
+    on_start=None,
+):
+    """Equivalente de `run_streaming` sobre asyncio.create_subprocess_exec.
+
+    Mismos argumentos y mismo resultado, pero sin hilos por proceso: la lectura de
+    los pipes, el timeout, la cancelación y el muestreo de recursos corren en el
+    bucle que lo ejecuta (ver `get_process_loop`). `on_start`, `on_progress` y el
+    muestreo con psutil van al executor del bucle; si una llamada a `on_progress` sigue
+    en curso se omite la siguiente. Sin wait4, el consumo sale solo del muestreo.
+    """
+    loop = asyncio.get_running_loop()
+    stderr_spool_path = f"{console_log_path}.stderr.tmp"
+    stats = {
+        "stdout_bytes": 0,
+        "stdout_lines": 0,
+        "stderr_bytes": 0,
+        "stderr_lines": 0,
+    }
+    stderr_tail = bytearray()
+    timed_out = False
+    cancelled = False
+    memory_exceeded = False
+    resource_limits = resource_limits or {}
+    memory_limit_bytes = int(resource_limits.get("memory_mb") or 0) * 1024 * 1024
+    limits = _process_limits(resource_limits)
+    peak_rss_bytes = 0
+    sampled_cpu_seconds = 0.0
+
+    with open(console_log_path, "wb") as f_out, open(stderr_spool_path, "wb") as f_err, (
+        open(stdout_path, "wb") if stdout_path else contextlib.nullcontext()
+    ) as f_stdout:
+        if header:
+            f_out.write(header.encode("utf-8"))
+        f_out.write(f"--- {stdout_label} ---\n".encode("utf-8"))
+        if f_stdout is not None:
+            f_out.write(f"(redirigido a {stdout_path})\n".encode("utf-8"))
+        f_out.flush()
+
+        process_options = dict(
+            stdin=subprocess.PIPE if limits else subprocess.DEVNULL,
+            stdout=f_stdout if f_stdout is not None else subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd,
+            start_new_session=True,  # Grupo propio: así se mata también a los hijos del shell
+        )
+        # Antes de crear el proceso: con muchos arranques a la vez el bucle retoma esta
+        # corrutina tarde y el proceso ya lleva un rato corriendo
+        started_at = time.monotonic()
+        try:
+            if use_shell and not limits:
+                process = await asyncio.create_subprocess_shell(command, **process_options)
+            else:
+                if use_shell:
+                    args = command
+                else:
+                    args = shlex.split(command) if isinstance(command, str) else command
+                if limits:
+                    args = _limits_gate_argv(args, use_shell)
+                process = await asyncio.create_subprocess_exec(*args, **process_options)
+        except OSError:
+            f_err.close()
+            os.remove(stderr_spool_path)
+            raise
+        readers_done = None
+        try:
+            if limits:
+                await loop.run_in_executor(None, _apply_process_limits, process.pid, limits)
+                process.stdin.write(b"\n")  # Abre la puerta
+                process.stdin.close()
+            if on_start:
+                await loop.run_in_executor(None, on_start, process.pid)
+            readers = [_pump_stream_async(process.stderr, f_err, stats, "stderr", stderr_tail)]
+            if f_stdout is None:
+                readers.append(_pump_stream_async(process.stdout, f_out, stats, "stdout"))
+            readers_done = asyncio.ensure_future(asyncio.gather(*readers))
+            exited = asyncio.ensure_future(process.wait())
+            root_process = await loop.run_in_executor(None, _get_process, process.pid)
+            progress_call = None
+
+            deadline = time.monotonic() + timeout if timeout else None
+            next_progress = time.monotonic() + progress_interval
+            next_sample = time.monotonic()
+            while True:
+                now = time.monotonic()
+                if root_process is not None and now >= next_sample:
+                    next_sample = now + RESOURCE_SAMPLE_INTERVAL
+                    rss_bytes, tree_cpu_seconds = await loop.run_in_executor(
+                        None, _sample_process_tree, root_process
+                    )
+                    peak_rss_bytes = max(peak_rss_bytes, rss_bytes)
+                    sampled_cpu_seconds = max(sampled_cpu_seconds, tree_cpu_seconds)
+                wait_for = min(next_progress, next_sample) - now
+                if deadline is not None:
+                    wait_for = min(wait_for, deadline - now)
+                if cancel_event is not None:
+                    wait_for = min(wait_for, CANCEL_POLL_INTERVAL)
+                await asyncio.wait([exited], timeout=max(0.0, wait_for))
+                if exited.done():
+                    break
+                if cancel_event is not None and cancel_event.is_set():
+                    cancelled = True
+                elif deadline is not None and time.monotonic() >= deadline:
+                    timed_out = True
+                elif memory_limit_bytes and peak_rss_bytes > memory_limit_bytes:
+                    memory_exceeded = True
+                if cancelled or timed_out or memory_exceeded:
+                    await _terminate_process_group_async(process, terminate_grace)
+                    await exited
+                    break
+                if time.monotonic() >= next_progress:
+                    next_progress += progress_interval
+                    if on_progress and (progress_call is None or progress_call.done()):
+                        if progress_call is not None:
+                            progress_call.result()  # Propaga los errores del callback anterior
+                        if f_stdout is not None:
+                            stats["stdout_bytes"] = os.fstat(f_stdout.fileno()).st_size
+                        f_out.flush()  # El callback puede leer el log (p. ej. para indexarlo)
+                        progress_call = loop.run_in_executor(
+                            None,
+                            on_progress,
+                            dict(
+                                stats,
+                                peak_rss_mb=round(peak_rss_bytes / (1024 * 1024), 1),
+                                cpu_seconds=round(sampled_cpu_seconds, 2),
+                            ),
+                        )
+            wall_seconds = time.monotonic() - started_at
+            await readers_done
+            if progress_call is not None:
+                await progress_call
+        finally:
+            # Si algo falla a mitad (p. ej. on_progress), el grupo de procesos no puede quedar vivo
+            if process.returncode is None:
+                _kill_process_group(process)
+                await process.wait()
+            if readers_done is not None and not readers_done.done():
+                await asyncio.wait([readers_done])  # Escriben en archivos que se cierran al salir
+
+    # Recorre archivos potencialmente grandes: fuera del bucle
+    await loop.run_in_executor(
+        None, _finish_output_files, console_log_path, stderr_spool_path, stderr_label, stdout_path, stats
+    )
+
+    result = dict(stats)
+    result.update(
+        {
+            "returncode": process.returncode,
+            "timed_out": timed_out,
+            "cancelled": cancelled,
+            "memory_exceeded": memory_exceeded,
+            "peak_rss_mb": round(peak_rss_bytes / (1024 * 1024), 1),
+            "cpu_seconds": round(sampled_cpu_seconds, 2),
+            "wall_seconds": round(wall_seconds, 2),
+            "stderr_tail": bytes(stderr_tail).decode("utf-8", errors="replace"),
+        }
+    )
+    return result
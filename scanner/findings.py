@@ -0,0 +1,522 @@
+"""Resultados normalizados a partir de las salidas de las herramientas.
+
+Cada herramienta con `output_parser` en tools_config.json se procesa al terminar su
+tarea: el parser lee el archivo de forma incremental (iterparse para XML, decodificación
+por bloques para JSON, línea a línea para texto) y produce registros que se guardan
+en las tablas hosts, ports, services, urls y findings (ver schema_upgrades.sql).
+"""
+import ipaddress
+import json
+import re
+import tempfile
+import xml.etree.ElementTree as ET
+from urllib.parse import urlsplit
+
+INSERT_BATCH_SIZE = 500
+JSON_READ_CHUNK_SIZE = 64 * 1024
+TESTSSL_REPORTED_SEVERITIES = {"LOW", "MEDIUM", "HIGH", "CRITICAL"}
+FINDINGS_TABLES = ("hosts", "ports", "urls", "findings")
+
+_BRACKET_GROUP_RE = re.compile(r"\[([^\]]*)\]")
+_NUCLEI_LINE_RE = re.compile(
+    r"^\[(?P<check_id>[^\]]+)\]\s+\[(?P<protocol>[^\]]+)\]\s+\[(?P<severity>[^\]]+)\]\s+(?P<matched_at>\S+)(?:\s+(?P<extra>.*))?$"
+)
+_STATUS_CODES_RE = re.compile(r"^\d{3}(?:,\d{3})*$")
+
+
+class FindingsParseError(ValueError):
+    """La salida de la herramienta no tiene el formato esperado por su parser."""
+
+
+def _host_of(value):
+    """Host de una URL o de un `host:puerto`."""
+    if "://" in value:
+        return urlsplit(value).hostname
+    if value.count(":") == 1:
+        return value.partition(":")[0]
+    return value
+
+
+def _port_of(value):
+    if "://" in value:
+        parts = urlsplit(value)
+        try:
+            return parts.port or {"http": 80, "https": 443}.get(parts.scheme.lower())
+        except ValueError:
+            return None
+    if value.count(":") == 1:
+        port_text = value.partition(":")[2]
+        return int(port_text) if port_text.isdigit() else None
+    return None
+
+
+def _iter_lines(path):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def iter_json_array(path):
+    """Elementos de un archivo JSON con un array (o valores sueltos) sin cargarlo entero."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        eof = False
+        while True:
+            # Saltar separadores del array; masscan deja a veces una coma antes de ']'
+            position = 0
+            while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+                position += 1
+            buffer = buffer[position:]
+            if buffer:
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise FindingsParseError(f"JSON incompleto en {path}")
+                else:
+                    yield item
+                    buffer = buffer[end:]
+                    continue
+            elif eof:
+                return
+            chunk = f.read(JSON_READ_CHUNK_SIZE)
+            if chunk:
+                buffer += chunk
+            else:
+                eof = True
+
+
+def parse_nmap_xml(path):
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.tag != "host":
+            continue
+        address = None
+        for address_element in element.findall("address"):
+            if address_element.get("addrtype") in ("ipv4", "ipv6"):
+                address = address_element.get("addr")
+                break
+        hostname_element = element.find("hostnames/hostname")
+        hostname = hostname_element.get("name") if hostname_element is not None else None
+        host = address or hostname
+        if host:
+            yield "host", {"host": host, "hostname": hostname}
+            for port_element in element.findall("ports/port"):
+                state_element = port_element.find("state")
+                service_element = port_element.find("service")
+                yield "port", {
+                    "host": host,
+                    "port": int(port_element.get("portid")),
+                    "protocol": port_element.get("protocol", "tcp"),
+                    "state": state_element.get("state") if state_element is not None else "open",
+                    "service": None if service_element is None else {
+                        "name": service_element.get("name"),
+                        "product": service_element.get("product"),
+                        "version": service_element.get("version"),
+                        "extra_info": service_element.get("extrainfo"),
+                    },
+                }
+        element.clear()  # Mantener la memoria acotada con salidas grandes
+
+
+def parse_masscan_json(path):
+    for item in iter_json_array(path):
+        host = item.get("ip")
+        if not host:
+            continue
+        for port_entry in item.get("ports", []):
+            yield "port", {
+                "host": host,
+                "port": int(port_entry["port"]),
+                "protocol": port_entry.get("proto", "tcp"),
+                "state": port_entry.get("status", "open"),
+                "service": (
+                    {"name": port_entry["service"].get("name")}
+                    if isinstance(port_entry.get("service"), dict)
+                    else None
+                ),
+            }
+
+
+def parse_dnsrecon_xml(path):
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.tag != "record":
+            continue
+        address = element.get("address")
+        if address and element.get("type") in ("A", "AAAA", "MX", "NS", "SRV", "PTR"):
+            hostname = element.get("target") or element.get("name") or element.get("mname")
+            yield "host", {"host": address, "hostname": hostname}
+            if element.get("type") == "SRV" and (element.get("port") or "").isdigit():
+                yield "port", {"host": address, "port": int(element.get("port")), "service": None}
+        element.clear()
+
+
+def parse_testssl_json(path):
+    seen_ports = set()
+    for item in iter_json_array(path):
+        if not isinstance(item, dict):
+            continue
+        # testssl escribe "nombre/IP" en `ip`
+        hostname, _, address = (item.get("ip") or "").rpartition("/")
+        host = address or hostname
+        port = int(item["port"]) if str(item.get("port", "")).isdigit() else None
+        if host and port and (host, port) not in seen_ports:
+            seen_ports.add((host, port))
+            yield "host", {"host": host, "hostname": hostname or None}
+            yield "port", {"host": host, "port": port, "service": None}
+        severity = (item.get("severity") or "").upper()
+        if severity in TESTSSL_REPORTED_SEVERITIES:
+            yield "finding", {
+                "check_id": item.get("id", "testssl"),
+                "severity": severity.lower(),
+                "host": host,
+                "port": port,
+                "matched_at": f"{host}:{port}" if port else host,
+                "description": item.get("finding"),
+                "cve": item.get("cve") or None,
+            }
+
+
+def parse_nuclei_lines(path):
+    for line in _iter_lines(path):
+        if line.startswith("{"):  # -jsonl
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            info = item.get("info", {})
+            matched_at = item.get("matched-at") or item.get("host") or ""
+            classification = info.get("classification") or {}
+            yield "finding", {
+                "check_id": item.get("template-id", "nuclei"),
+                "severity": info.get("severity", "info"),
+                "host": _host_of(item.get("host") or matched_at) or "",
+                "port": _port_of(matched_at),
+                "matched_at": matched_at,
+                "description": info.get("name"),
+                "cve": ",".join(classification.get("cve-id") or []) or None,
+            }
+            continue
+        match = _NUCLEI_LINE_RE.match(line)
+        if not match:
+            continue
+        matched_at = match.group("matched_at")
+        check_id = match.group("check_id")
+        yield "finding", {
+            "check_id": check_id,
+            "severity": match.group("severity").lower(),
+            "host": _host_of(matched_at) or "",
+            "port": _port_of(matched_at),
+            "matched_at": matched_at,
+            "description": match.group("extra"),
+            "cve": check_id.upper() if check_id.upper().startswith("CVE-") else None,
+        }
+
+
+def parse_httpx_lines(path):
+    for line in _iter_lines(path):
+        if line.startswith("{"):  # -json
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            url = item.get("url")
+            if url:
+                yield "url", {
+                    "url": url,
+                    "host": _host_of(url),
+                    "status_code": item.get("status_code") or item.get("status-code"),
+                    "title": item.get("title"),
+                    "technologies": ",".join(item.get("tech") or item.get("technologies") or []) or None,
+                }
+            continue
+        url, _, rest = line.partition(" ")
+        groups = _BRACKET_GROUP_RE.findall(rest)
+        status_code = None
+        if groups and _STATUS_CODES_RE.match(groups[0]):
+            status_code = int(groups.pop(0).split(",")[-1])  # Último código tras las redirecciones
+        yield "url", {
+            "url": url,
+            "host": _host_of(url),
+            "status_code": status_code,
+            "title": groups[0] if groups else None,
+            "technologies": groups[1] if len(groups) > 1 else None,
+        }
+
+
+def parse_url_lines(path):
+    for line in _iter_lines(path):
+        url = line.split()[0]
+        if "://" in url:
+            yield "url", {"url": url, "host": _host_of(url)}
+
+
+def parse_naabu_lines(path):
+    for line in _iter_lines(path):
+        port = _port_of(line)
+        if port:
+            yield "port", {"host": _host_of(line), "port": port, "service": None}
+
+
+def _is_ip_address(value):
+    try:
+        ipaddress.ip_address(value)
+    except ValueError:
+        return False
+    return True
+
+
+def parse_dnsx_lines(path):
+    # Con -resp: `host [A] [1.2.3.4]`; el tipo de registro y los destinos CNAME no son hosts
+    for line in _iter_lines(path):
+        hostname, _, rest = line.partition(" ")
+        addresses = [
+            group.strip() for group in _BRACKET_GROUP_RE.findall(rest) if _is_ip_address(group.strip())
+        ]
+        for address in addresses or [hostname]:
+            yield "host", {"host": address, "hostname": hostname}
+
+
+def parse_hostname_lines(path):
+    for line in _iter_lines(path):
+        hostname = line.split()[0].lower()
+        yield "host", {"host": hostname, "hostname": hostname}
+
+
+# output_parser: (función, placeholder con la ruta del archivo, sufijo añadido a esa ruta)
+PARSERS = {
+    "nmap_xml": (parse_nmap_xml, "output_file_base", ".xml"),
+    "masscan_json": (parse_masscan_json, "output_file_json", ""),
+    "dnsrecon_xml": (parse_dnsrecon_xml, "output_file_xml", ""),
+    "testssl_json": (parse_testssl_json, "output_file_json", ""),
+    "nuclei_lines": (parse_nuclei_lines, "output_file", ""),
+    "httpx_lines": (parse_httpx_lines, "output_file", ""),
+    "url_lines": (parse_url_lines, "output_file", ""),
+    "naabu_lines": (parse_naabu_lines, "output_file", ""),
+    "dnsx_lines": (parse_dnsx_lines, "output_file", ""),
+    "hostname_lines": (parse_hostname_lines, "output_file", ""),
+}
+
+
+def get_parser_input_path(parser_name, job_path_values):
+    """Archivo que lee el parser, a partir de las rutas del job usadas al renderizar la plantilla."""
+    _, placeholder, suffix = PARSERS[parser_name]
+    base_path = job_path_values.get(placeholder)
+    return base_path + suffix if base_path else None
+
+
+class FindingsWriter:
+    """Guarda los registros de una tarea; hosts y puertos se deduplican por job.
+
+    `counts` cuenta solo las filas nuevas: un upsert sobre una fila existente no suma.
+    """
+
+    def __init__(self, conn, job_id, tool_id):
+        self.conn = conn
+        self.job_id = job_id
+        self.tool_id = tool_id
+        self._host_ids = {}
+        self._pending_urls = []
+        self._pending_findings = []
+        self.counts = {"hosts": 0, "ports": 0, "urls": 0, "findings": 0}
+
+    def _host_id(self, host, hostname=None):
+        host_id = self._host_ids.get(host)
+        if host_id is None or hostname:
+            inserted = self.conn.execute(
+                """INSERT INTO hosts (job_id, host, hostname, tool_id) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (job_id, host) DO NOTHING RETURNING id""",
+                (self.job_id, host, hostname, self.tool_id),
+            ).fetchone()
+            if inserted is not None:
+                host_id = inserted[0]
+                self.counts["hosts"] += 1
+            else:
+                host_id = self.conn.execute(
+                    """UPDATE hosts SET hostname = COALESCE(hostname, ?)
+                       WHERE job_id = ? AND host = ? RETURNING id""",
+                    (hostname, self.job_id, host),
+                ).fetchone()[0]
+            self._host_ids[host] = host_id
+        return host_id
+
+    def add(self, kind, record):
+        if kind == "host":
+            self._host_id(record["host"], record.get("hostname"))
+        elif kind == "port":
+            port_key = (
+                self._host_id(record["host"], record.get("hostname")),
+                record["port"],
+                record.get("protocol") or "tcp",
+            )
+            state = record.get("state") or "open"
+            inserted = self.conn.execute(
+                """INSERT INTO ports (job_id, host_id, port, protocol, state, tool_id) VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (host_id, port, protocol) DO NOTHING RETURNING id""",
+                (self.job_id, *port_key, state, self.tool_id),
+            ).fetchone()
+            if inserted is not None:
+                port_id = inserted[0]
+                self.counts["ports"] += 1
+            else:
+                port_id = self.conn.execute(
+                    """UPDATE ports SET state = CASE WHEN state = 'open' THEN state ELSE ? END
+                       WHERE host_id = ? AND port = ? AND protocol = ? RETURNING id""",
+                    (state, *port_key),
+                ).fetchone()[0]
+            service = record.get("service")
+            if service and any(service.values()):
+                self.conn.execute(
+                    """INSERT INTO services (port_id, name, product, version, extra_info, tool_id)
+                       VALUES (?, ?, ?, ?, ?, ?)
+                       ON CONFLICT (port_id) DO UPDATE SET
+                           name = COALESCE(excluded.name, services.name),
+                           product = COALESCE(excluded.product, services.product),
+                           version = COALESCE(excluded.version, services.version),
+                           extra_info = COALESCE(excluded.extra_info, services.extra_info)""",
+                    (
+                        port_id,
+                        service.get("name"),
+                        service.get("product"),
+                        service.get("version"),
+                        service.get("extra_info"),
+                        self.tool_id,
+                    ),
+                )
+        elif kind == "url":
+            self._pending_urls.append(
+                (
+                    self.job_id,
+                    record["url"],
+                    record.get("host"),
+                    record.get("status_code"),
+                    record.get("title"),
+                    record.get("technologies"),
+                    self.tool_id,
+                )
+            )
+            if len(self._pending_urls) >= INSERT_BATCH_SIZE:
+                self._flush_urls()
+        elif kind == "finding":
+            self._pending_findings.append(
+                (
+                    self.job_id,
+                    self.tool_id,
+                    record["check_id"],
+                    record.get("severity") or "info",
+                    record.get("host") or "",
+                    record.get("port"),
+                    record.get("matched_at") or "",
+                    record.get("description"),
+                    record.get("cve"),
+                )
+            )
+            if len(self._pending_findings) >= INSERT_BATCH_SIZE:
+                self._flush_findings()
+
+    def _flush_urls(self):
+        if self._pending_urls:
+            changes_before = self.conn.total_changes
+            self.conn.executemany(
+                """INSERT INTO urls (job_id, url, host, status_code, title, technologies, tool_id)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (job_id, url) DO NOTHING""",
+                self._pending_urls,
+            )
+            self.counts["urls"] += self.conn.total_changes - changes_before
+            # Completar las que ya existían (en las recién insertadas no cambia nada)
+            self.conn.executemany(
+                """UPDATE urls SET
+                       status_code = COALESCE(?, status_code),
+                       title = COALESCE(?, title),
+                       technologies = COALESCE(?, technologies)
+                   WHERE job_id = ? AND url = ?""",
+                [
+                    (status_code, title, technologies, job_id, url)
+                    for job_id, url, _, status_code, title, technologies, _ in self._pending_urls
+                ],
+            )
+            self._pending_urls = []
+
+    def _flush_findings(self):
+        if self._pending_findings:
+            changes_before = self.conn.total_changes
+            self.conn.executemany(
+                """INSERT OR IGNORE INTO findings
+                   (job_id, tool_id, check_id, severity, host, port, matched_at, description, cve)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                self._pending_findings,
+            )
+            self.counts["findings"] += self.conn.total_changes - changes_before
+            self._pending_findings = []
+
+    def flush(self):
+        self._flush_urls()
+        self._flush_findings()
+
+
+def ingest_tool_output(conn, job_id, tool_id, parser_name, input_path):
+    """Procesa una salida y la guarda en una sola transacción. Devuelve las filas nuevas por tabla.
+
+    El parser vuelca primero los registros a un archivo temporal, sin tocar la base de
+    datos: el bloqueo de escritura dura solo las inserciones, no la lectura de la salida,
+    y un error a mitad no deja en las tablas una parte de ella. Los registros usan
+    upsert, así que volver a procesar la misma salida no duplica filas.
+    """
+    parse = PARSERS[parser_name][0]
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as spool:
+        try:
+            for kind, record in parse(input_path):
+                spool.write(json.dumps([kind, record]) + "\n")
+        except ET.ParseError as e:
+            raise FindingsParseError(f"XML inválido en {input_path}: {e}") from e
+        spool.seek(0)
+        writer = FindingsWriter(conn, job_id, tool_id)
+        try:
+            for line in spool:
+                writer.add(*json.loads(line))
+            writer.flush()
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+    return writer.counts
+
+
+def get_job_findings_summary(conn, job_id):
+    """Número de registros por tabla y de hallazgos por severidad de un job."""
+    summary = {
+        table: conn.execute(f"SELECT COUNT(*) FROM {table} WHERE job_id = ?", (job_id,)).fetchone()[0]
+        for table in FINDINGS_TABLES
+    }
+    summary["findings_by_severity"] = {
+        row[0]: row[1]
+        for row in conn.execute(
+            "SELECT severity, COUNT(*) FROM findings WHERE job_id = ? GROUP BY severity",
+            (job_id,),
+        )
+    }
+    return summary
+
+
+_JOB_FINDINGS_QUERIES = {
+    "hosts": "SELECT host, hostname, tool_id FROM hosts WHERE job_id = ? ORDER BY host LIMIT ?",
+    "ports": """SELECT h.host, h.hostname, p.port, p.protocol, p.state, s.name AS service,
+                       s.product, s.version, p.tool_id
+                FROM ports p JOIN hosts h ON h.id = p.host_id
+                LEFT JOIN services s ON s.port_id = p.id
+                WHERE p.job_id = ? ORDER BY h.host, p.port LIMIT ?""",
+    "urls": """SELECT url, host, status_code, title, technologies, tool_id
+               FROM urls WHERE job_id = ? ORDER BY url LIMIT ?""",
+    "findings": """SELECT check_id, severity, host, port, matched_at, description, cve, tool_id
+                   FROM findings WHERE job_id = ?
+                   ORDER BY CASE severity WHEN 'critical' THEN 0 WHEN 'high' THEN 1
+                       WHEN 'medium' THEN 2 WHEN 'low' THEN 3 ELSE 4 END, host LIMIT ?""",
+}
+
+
+def get_job_findings(conn, job_id, kind, limit):
+    """Filas de una tabla de resultados (`hosts`, `ports`, `urls` o `findings`) de un job."""
+    return [dict(row) for row in conn.execute(_JOB_FINDINGS_QUERIES[kind], (job_id, limit))]
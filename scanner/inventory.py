@@ -0,0 +1,130 @@
+"""Inventario de las herramientas instaladas.
+
+Resuelve una sola vez los ejecutables de cada herramienta de `tools_definition`
+(`shutil.which` sobre el PATH del proceso) y consulta su versión en segundo plano.
+El inventario se rehace solo cuando cambian el PATH o los ejecutables configurados.
+"""
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import threading
+
+DEFAULT_VERSION_ARGS = ["--version"]
+VERSION_PROBE_TIMEOUT = 3.0
+VERSION_MAX_LENGTH = 120
+
+
+def get_tool_binaries(tool_definition, command_template):
+    """Ejecutables de la herramienta: `binary` en la config o los que invoca su plantilla."""
+    binary = tool_definition.get("binary")
+    if binary:
+        return [binary] if isinstance(binary, str) else list(binary)
+    return list(command_template.binaries) if command_template else []
+
+
+def probe_version(binary_path, version_args=None):
+    """Primera línea no vacía de `<binario> --version` (o `version_args`); None si falla."""
+    try:
+        result = subprocess.run(
+            [binary_path] + list(version_args or DEFAULT_VERSION_ARGS),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            timeout=VERSION_PROBE_TIMEOUT,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    for line in result.stdout.decode("utf-8", errors="replace").splitlines():
+        line = line.strip()
+        if line:
+            return line[:VERSION_MAX_LENGTH]
+    return None
+
+
+class ToolInventory:
+    def __init__(self, logger=None, probe_versions=True, max_probe_workers=8):
+        self.logger = logger
+        self.probe_versions = probe_versions
+        self.max_probe_workers = max_probe_workers
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._entries = {}  # tool_id: {"binaries", "path", "available", "missing", "version"}
+
+    def _make_fingerprint(self, tool_definitions, command_templates):
+        return (
+            os.environ.get("PATH", ""),
+            tuple(
+                sorted(
+                    (
+                        tool_id,
+                        tuple(get_tool_binaries(tool_definition, command_templates.get(tool_id))),
+                        tuple(tool_definition.get("version_args") or DEFAULT_VERSION_ARGS),
+                    )
+                    for tool_id, tool_definition in tool_definitions.items()
+                )
+            ),
+        )
+
+    def get(self, tool_definitions, command_templates):
+        """Inventario {tool_id: entrada}; se recalcula si cambió el PATH o la configuración."""
+        fingerprint = self._make_fingerprint(tool_definitions, command_templates)
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                self._refresh(fingerprint, tool_definitions, command_templates)
+            return {tool_id: dict(entry) for tool_id, entry in self._entries.items()}
+
+    def unavailable_tools(self, tool_definitions, command_templates):
+        inventory = self.get(tool_definitions, command_templates)
+        return {tool_id for tool_id, entry in inventory.items() if not entry["available"]}
+
+    def _refresh(self, fingerprint, tool_definitions, command_templates):
+        entries = {}
+        paths_to_probe = {}  # ruta del ejecutable: version_args
+        for tool_id, tool_definition in tool_definitions.items():
+            binaries = get_tool_binaries(tool_definition, command_templates.get(tool_id))
+            resolved = {binary: shutil.which(binary) for binary in binaries}
+            missing = [binary for binary, path in resolved.items() if path is None]
+            primary_path = resolved.get(binaries[0]) if binaries else None
+            entries[tool_id] = {
+                "binaries": binaries,
+                "path": primary_path,
+                "available": bool(binaries) and not missing,
+                "missing": missing,
+                "version": None,
+            }
+            if primary_path:
+                paths_to_probe.setdefault(primary_path, tool_definition.get("version_args"))
+
+        self._fingerprint = fingerprint
+        self._entries = entries
+        unavailable = sorted(tool_id for tool_id, entry in entries.items() if not entry["available"])
+        if self.logger:
+            self.logger.info(
+                f"Inventario de herramientas: {len(entries) - len(unavailable)} disponibles"
+                + (f", no disponibles: {', '.join(unavailable)}" if unavailable else "")
+            )
+        if self.probe_versions and paths_to_probe:
+            threading.Thread(
+                target=self._probe_versions,
+                args=(fingerprint, paths_to_probe),
+                name="panthera-tool-inventory",
+                daemon=True,
+            ).start()
+
+    def _probe_versions(self, fingerprint, paths_to_probe):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_probe_workers) as pool:
+            future_to_path = {
+                pool.submit(probe_version, path, version_args): path
+                for path, version_args in paths_to_probe.items()
+            }
+            versions = {
+                future_to_path[future]: future.result()
+                for future in concurrent.futures.as_completed(future_to_path)
+            }
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                return  # El inventario se rehízo mientras se consultaban versiones
+            for entry in self._entries.values():
+                if entry["path"] in versions:
+                    entry["version"] = versions[entry["path"]]
@@ -0,0 +1,282 @@
+"""Planificación de las tareas herramienta×objetivo de un job.
+
+Las tareas forman un DAG: una herramienta con `depends_on_output_of` espera
+a que termine la herramienta de la que depende sobre el mismo objetivo y
+recibe su archivo de salida como `{input_file}`. Las fases (`phase_key`) no
+imponen orden entre sí; solo sirven para priorizar las tareas listas.
+
+Las herramientas que aceptan listas (`target_type` terminado en `_list`) se
+agrupan en tareas de lote: una ejecución por bloque de hasta `batch_size`
+objetivos, que reciben en `{targets_file}`.
+
+Cada herramienta solo recibe los objetivos compatibles con su `target_type`, en
+la forma que espera (ver `scanner.targets`); una herramienta dependiente solo se
+ejecuta sobre los objetivos que también recibió su upstream.
+"""
+import re
+from urllib.parse import urlparse
+
+from scanner.targets import get_target_form
+
+DEFAULT_BATCH_SIZE = 200
+
+_HOST_TOKEN_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9-]*(?:\.[A-Za-z0-9-]+)+")
+
+
+class TaskGraphError(ValueError):
+    """La configuración de dependencias de las herramientas no forma un DAG válido."""
+
+
+def get_tool_dependencies(tool_definition):
+    """Devuelve siempre una lista con los tool_id de los que depende la herramienta."""
+    depends_on = tool_definition.get("depends_on_output_of") or []
+    if isinstance(depends_on, str):
+        depends_on = [depends_on]
+    return list(depends_on)
+
+
+def make_task_key(tool_id, target_value):
+    return f"{tool_id}_on_{target_value}"
+
+
+def make_batch_key(tool_id, batch_index):
+    return f"{tool_id}_batch_{batch_index}"
+
+
+def is_list_capable(tool_definition):
+    """Las herramientas con target_type `*_list` procesan varios objetivos por ejecución."""
+    return tool_definition.get("target_type", "").endswith("_list")
+
+
+def get_batch_size(tool_definition, advanced_options=None):
+    """Tamaño de lote: opción avanzada `batch_size` > `batch_size` de la herramienta > por defecto."""
+    batch_size = (advanced_options or {}).get("batch_size") or tool_definition.get(
+        "batch_size", DEFAULT_BATCH_SIZE
+    )
+    return max(1, int(batch_size))
+
+
+def get_target_host(target_value):
+    """Host de un objetivo (dominio, IP, URL o host:puerto) para atribuir resultados."""
+    if "://" in target_value:
+        return (urlparse(target_value).hostname or target_value).lower()
+    if target_value.count(":") == 1:  # host:puerto (no IPv6)
+        return target_value.split(":", 1)[0].lower()
+    return target_value.lower()
+
+
+def count_results_per_target(output_path, batch_targets):
+    """Cuenta las líneas de salida de un lote que mencionan cada objetivo (o un subdominio suyo)."""
+    targets_by_host = {}
+    for target_value in batch_targets:
+        targets_by_host.setdefault(get_target_host(target_value), []).append(target_value)
+    counts = {target_value: 0 for target_value in batch_targets}
+
+    with open(output_path, "r", encoding="utf-8", errors="replace") as f_out:
+        for line in f_out:
+            matched_targets = set()
+            for token in _HOST_TOKEN_RE.findall(line):
+                labels = token.lower().split(".")
+                # a.b.example.com también cuenta para b.example.com y example.com
+                for i in range(len(labels) - 1):
+                    matched_targets.update(targets_by_host.get(".".join(labels[i:]), []))
+            for target_value in matched_targets:
+                counts[target_value] += 1
+    return counts
+
+
+def _expand_tool_entries(selected_tools_config_list, tool_definitions):
+    """Añade al job las herramientas de las que dependen las seleccionadas."""
+    tool_entries = {}
+    for tool_entry in selected_tools_config_list:
+        tool_entries[tool_entry["id"]] = tool_entry
+
+    pending = list(tool_entries)
+    while pending:
+        tool_id = pending.pop()
+        for upstream_id in get_tool_dependencies(tool_definitions.get(tool_id, {})):
+            if upstream_id not in tool_definitions:
+                raise TaskGraphError(
+                    f"{tool_id} depende de {upstream_id}, que no está definida."
+                )
+            if upstream_id not in tool_entries:
+                tool_entries[upstream_id] = {
+                    "id": upstream_id,
+                    "cli_params": {},
+                    "added_as_dependency_of": tool_id,
+                }
+                pending.append(upstream_id)
+    return list(tool_entries.values())
+
+
+def drop_unavailable_tools(selected_tools_config_list, tool_definitions, unavailable_tools):
+    """Quita de la selección las herramientas no instaladas y las que dependen de ellas.
+
+    Devuelve (selección restante, {tool_id: motivo}).
+    """
+    def blocking_tool(tool_id, seen=()):
+        if tool_id in unavailable_tools:
+            return tool_id
+        for upstream_id in get_tool_dependencies(tool_definitions.get(tool_id, {})):
+            if upstream_id not in seen:
+                blocker = blocking_tool(upstream_id, seen + (tool_id,))
+                if blocker:
+                    return blocker
+        return None
+
+    kept, dropped = [], {}
+    for tool_entry in selected_tools_config_list:
+        tool_id = tool_entry["id"]
+        blocker = blocking_tool(tool_id)
+        if blocker is None:
+            kept.append(tool_entry)
+        elif blocker == tool_id:
+            dropped[tool_id] = "no está instalada"
+        else:
+            dropped[tool_id] = f"depende de {blocker}, que no está instalada"
+    return kept, dropped
+
+
+def route_targets(target_values, tool_entries, tool_definitions):
+    """Reparte los objetivos entre las herramientas según su `target_type`.
+
+    Devuelve ({tool_id: [(objetivo, forma para la herramienta)]},
+    {tool_id: [objetivos omitidos]}).
+    """
+    routes = {}
+
+    def routed_targets(tool_id, seen=()):
+        if tool_id in routes:
+            return routes[tool_id]
+        tool_definition = tool_definitions.get(tool_id, {})
+        target_type = tool_definition.get("target_type", "domain_or_ip")
+        upstream_targets = [
+            {target for target, _ in routed_targets(upstream_id, seen + (tool_id,))}
+            for upstream_id in get_tool_dependencies(tool_definition)
+            if upstream_id not in seen
+        ]
+        tool_routes = []
+        for target_value in target_values:
+            if not all(target_value in targets_set for targets_set in upstream_targets):
+                continue
+            target_form = get_target_form(target_value, target_type)
+            if target_form is not None:
+                tool_routes.append((target_value, target_form))
+        routes[tool_id] = tool_routes
+        return tool_routes
+
+    skipped = {}
+    for tool_entry in tool_entries:
+        tool_id = tool_entry["id"]
+        routed = {target for target, _ in routed_targets(tool_id)}
+        missing = [target for target in target_values if target not in routed]
+        if missing:
+            skipped[tool_id] = missing
+    return {tool_entry["id"]: routes[tool_entry["id"]] for tool_entry in tool_entries}, skipped
+
+
+def _check_acyclic(tool_entries, tool_definitions):
+    visiting, visited = set(), set()
+
+    def visit(tool_id, path):
+        if tool_id in visited:
+            return
+        if tool_id in visiting:
+            raise TaskGraphError(
+                "Dependencias circulares entre herramientas: "
+                + " -> ".join(path + [tool_id])
+            )
+        visiting.add(tool_id)
+        for upstream_id in get_tool_dependencies(tool_definitions.get(tool_id, {})):
+            visit(upstream_id, path + [tool_id])
+        visiting.discard(tool_id)
+        visited.add(tool_id)
+
+    for tool_entry in tool_entries:
+        visit(tool_entry["id"], [])
+
+
+def build_task_graph(
+    targets,
+    selected_tools_config_list,
+    tool_definitions,
+    phase_order=None,
+    advanced_options=None,
+):
+    """Construye las tareas de un job como un dict ordenado task_key -> tarea.
+
+    Cada tarea es un dict con `key`, `tool_id`, `target`, `target_value` (la forma
+    del objetivo que recibe la herramienta), `tool_config_entry`, `depends_on`
+    (task_keys) y `priority` (posición de su fase en `phase_order`).
+    Las tareas de lote tienen `target` None y las listas `batch_targets` y `batch_values`.
+    Los pares herramienta×objetivo incompatibles no generan tarea.
+    """
+    phase_rank = {phase_key: i for i, phase_key in enumerate(phase_order or [])}
+    tool_entries = _expand_tool_entries(selected_tools_config_list, tool_definitions)
+    _check_acyclic(tool_entries, tool_definitions)
+
+    target_values = []
+    for target_item in targets:
+        # Target can be a simple string or an object if more details are needed
+        target_values.append(
+            target_item
+            if isinstance(target_item, str)
+            else target_item.get("value", str(target_item))
+        )
+
+    routes, _ = route_targets(target_values, tool_entries, tool_definitions)
+
+    tasks = {}
+    task_key_for = {}  # (tool_id, target): task_key de la tarea (individual o lote) que lo cubre
+    for tool_entry in tool_entries:
+        tool_id = tool_entry["id"]
+        tool_definition = tool_definitions.get(tool_id, {})
+        base_task = {
+            "tool_id": tool_id,
+            "tool_config_entry": tool_entry,
+            "priority": phase_rank.get(tool_definition.get("phase_key"), len(phase_rank)),
+        }
+        tool_routes = routes[tool_id]
+        if is_list_capable(tool_definition):
+            batch_size = get_batch_size(tool_definition, advanced_options)
+            for batch_index, start in enumerate(range(0, len(tool_routes), batch_size)):
+                batch_routes = tool_routes[start : start + batch_size]
+                task_key = make_batch_key(tool_id, batch_index)
+                tasks[task_key] = dict(
+                    base_task,
+                    key=task_key,
+                    target=None,
+                    batch_targets=[target for target, _ in batch_routes],
+                    batch_values=list(dict.fromkeys(form for _, form in batch_routes)),
+                )
+                for target_value, _ in batch_routes:
+                    task_key_for[(tool_id, target_value)] = task_key
+        else:
+            for target_value, target_form in tool_routes:
+                task_key = make_task_key(tool_id, target_value)
+                tasks[task_key] = dict(
+                    base_task, key=task_key, target=target_value, target_value=target_form
+                )
+                task_key_for[(tool_id, target_value)] = task_key
+
+    # Las dependencias se resuelven al final porque el upstream puede ser un lote
+    for task in tasks.values():
+        depends_on = []
+        for target_value in task.get("batch_targets") or [task["target"]]:
+            for upstream_id in get_tool_dependencies(tool_definitions.get(task["tool_id"], {})):
+                upstream_key = task_key_for[(upstream_id, target_value)]
+                if upstream_key not in depends_on:
+                    depends_on.append(upstream_key)
+        task["depends_on"] = depends_on
+    return tasks
+
+
+def get_ready_tasks(pending_tasks, finished_task_keys):
+    """Tareas pendientes cuyas dependencias ya terminaron, ordenadas por fase."""
+    ready = [
+        task
+        for task in pending_tasks.values()
+        if all(dep in finished_task_keys for dep in task["depends_on"])
+    ]
+    ready.sort(key=lambda task: task["priority"])
+    return ready
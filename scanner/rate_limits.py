@@ -0,0 +1,226 @@
+"""Cortesía por destino y presupuestos globales de tasa.
+
+Las herramientas con `rate_control` en tools_config.json contactan directamente con
+el objetivo: no se ejecutan más de `max_tasks_per_host` a la vez sobre el mismo host
+(un lote cuenta en todos sus hosts). Las que además declaran `rate_param` reciben al
+arrancar una parte del presupuesto global de su unidad (`rate_unit`: "pps", paquetes
+por segundo como masscan o naabu, o "rps", peticiones HTTP por segundo como nuclei) y
+el motor reescribe ese parámetro con la tasa concedida. Cada unidad tiene su propio
+presupuesto en `budgets`: paquetes y peticiones no se pueden sumar. La tasa de un
+proceso en marcha no se puede cambiar, así que el reparto se decide al arrancar: cada
+herramienta obtiene lo que pide si cabe, o su parte justa entre las que ya corren, y
+espera si no queda ni `min_rate`.
+
+Los permisos se guardan en las tablas `rate_lease` y `rate_lease_host`, así que el
+límite y el presupuesto son los mismos para todos los procesos que comparten la base
+de datos (web y `flask worker`). Cada proceso renueva los permisos que tiene; los de
+un proceso que muere caducan a los RATE_LEASE_SECONDS. Una liberación en el mismo
+proceso despierta a las tareas en espera; las de otros procesos se ven al reintentar
+cada RATE_RETRY_INTERVAL segundos, con una consulta de solo lectura: el bloqueo de
+escritura solo se toma cuando el permiso parece caber.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+import uuid
+
+from scanner.slots import AsyncWaiters
+from scanner.worker import make_worker_id
+from utils import database
+
+RATE_LEASE_SECONDS = 30.0
+RATE_RETRY_INTERVAL = 0.5  # Espera máxima antes de volver a mirar los permisos de otros procesos
+DEFAULT_RATE_UNIT = "pps"
+
+
+class RateLease:
+    """Permiso para ejecutar una herramienta: hosts ocupados y tasa concedida (None si no aplica)."""
+
+    def __init__(self, lease_id, hosts, rate, budgeted, unit=DEFAULT_RATE_UNIT):
+        self.lease_id = lease_id
+        self.hosts = hosts
+        self.rate = rate
+        self.budgeted = budgeted
+        self.unit = unit
+
+
+class RateScheduler:
+    def __init__(self, db_path, max_tasks_per_host=2, budgets=None, logger=None):
+        self.db_path = db_path
+        self.max_tasks_per_host = max_tasks_per_host  # 0: sin límite por host
+        self.budgets = dict(budgets or {})  # {unidad: tasa}; 0 o ausente: sin presupuesto
+        self.logger = logger
+        self.owner_id = f"{make_worker_id()}:{uuid.uuid4().hex[:8]}"
+        self._held = 0
+        self._releases = 0  # Generación: cambia con cada liberación en este proceso
+        self._condition = threading.Condition()
+        self._async_waiters = AsyncWaiters()
+        self._renewer = None
+
+    def allocated_rate(self, unit=DEFAULT_RATE_UNIT):
+        """Presupuesto de `unit` concedido ahora a herramientas en ejecución, sumando todos los procesos."""
+        with database.get_pool(self.db_path).connection() as conn:
+            return conn.execute(
+                "SELECT COALESCE(SUM(rate), 0) FROM rate_lease WHERE unit = ? AND expires_at >= ?",
+                (unit, time.time()),
+            ).fetchone()[0]
+
+    def _try_grant(self, hosts, requested_rate, min_rate, unit):
+        if not hosts and (requested_rate is None or not self.budgets.get(unit)):
+            return RateLease(None, hosts, requested_rate, False, unit)  # Nada que repartir
+        try:
+            lease = self._grant(hosts, requested_rate, min_rate, unit)
+        except sqlite3.Error as e:
+            if self.logger:
+                self.logger.warning(f"No se pudo consultar los permisos de tasa: {e}")
+            return None
+        if lease is not None:
+            with self._condition:
+                self._held += 1
+            self._ensure_renewer()
+        return lease
+
+    def _check_grant(self, conn, hosts, requested_rate, min_rate, unit, now):
+        """(tasa, cuenta en el presupuesto) si el permiso cabe ahora; None si hay que esperar."""
+        if self.max_tasks_per_host and hosts:
+            busiest = conn.execute(
+                f"""SELECT COUNT(*) AS tasks FROM rate_lease_host h
+                    JOIN rate_lease l ON l.lease_id = h.lease_id
+                    WHERE h.host IN ({', '.join('?' * len(hosts))}) AND l.expires_at >= ?
+                    GROUP BY h.host ORDER BY tasks DESC LIMIT 1""",
+                (*hosts, now),
+            ).fetchone()
+            if busiest is not None and busiest["tasks"] >= self.max_tasks_per_host:
+                return None
+        budget = self.budgets.get(unit, 0)
+        if requested_rate is None or not budget:
+            return requested_rate, False
+        allocated_rate, budgeted_tasks = conn.execute(
+            """SELECT COALESCE(SUM(rate), 0), COUNT(rate) FROM rate_lease
+               WHERE unit = ? AND expires_at >= ?""",
+            (unit, now),
+        ).fetchone()
+        available = budget - allocated_rate
+        fair_share = budget // (budgeted_tasks + 1)
+        rate = min(requested_rate, available, max(min_rate, fair_share))
+        if rate < min(min_rate, requested_rate, budget):
+            return None
+        return rate, True
+
+    def _grant(self, hosts, requested_rate, min_rate, unit):
+        now = time.time()
+        with database.get_pool(self.db_path).connection() as conn:
+            # Solo lectura primero: con muchas tareas esperando, casi todos los reintentos
+            # acaban aquí sin tomar el bloqueo de escritura
+            if self._check_grant(conn, hosts, requested_rate, min_rate, unit, now) is None:
+                return None
+            conn.execute("BEGIN IMMEDIATE")
+            # Permisos de procesos que murieron sin liberarlos
+            conn.execute(
+                """DELETE FROM rate_lease_host
+                   WHERE lease_id IN (SELECT lease_id FROM rate_lease WHERE expires_at < ?)""",
+                (now,),
+            )
+            conn.execute("DELETE FROM rate_lease WHERE expires_at < ?", (now,))
+            granted = self._check_grant(conn, hosts, requested_rate, min_rate, unit, now)
+            if granted is None:
+                conn.rollback()
+                return None
+            rate, budgeted = granted
+            lease_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO rate_lease (lease_id, owner_id, rate, unit, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (lease_id, self.owner_id, rate if budgeted else None, unit, now + RATE_LEASE_SECONDS),
+            )
+            conn.executemany(
+                "INSERT INTO rate_lease_host (host, lease_id) VALUES (?, ?)",
+                [(host, lease_id) for host in hosts],
+            )
+            conn.commit()
+        return RateLease(lease_id, hosts, rate, budgeted, unit)
+
+    def _ensure_renewer(self):
+        with self._condition:
+            if self._renewer is not None and self._renewer.is_alive():
+                return
+            self._renewer = threading.Thread(
+                target=self._renew_loop, name="panthera-rate-leases", daemon=True
+            )
+            self._renewer.start()
+
+    def _renew_loop(self):
+        """Prolonga los permisos de este proceso mientras tenga alguno."""
+        while True:
+            time.sleep(RATE_LEASE_SECONDS / 3)
+            with self._condition:
+                if not self._held:
+                    self._renewer = None
+                    return
+            try:
+                with database.get_pool(self.db_path).connection() as conn:
+                    conn.execute(
+                        "UPDATE rate_lease SET expires_at = ? WHERE owner_id = ?",
+                        (time.time() + RATE_LEASE_SECONDS, self.owner_id),
+                    )
+                    conn.commit()
+            except sqlite3.Error as e:
+                if self.logger:
+                    self.logger.warning(f"No se pudieron renovar los permisos de tasa: {e}")
+
+    def acquire(self, hosts, requested_rate=None, min_rate=1, unit=DEFAULT_RATE_UNIT, timeout=None):
+        """Espera hasta `timeout` segundos (None: sin límite) un permiso; None si no llegó."""
+        hosts = tuple(sorted(set(hosts)))
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._condition:
+                generation = self._releases
+            lease = self._try_grant(hosts, requested_rate, min_rate, unit)
+            if lease is not None:
+                return lease
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            with self._condition:
+                if self._releases == generation:
+                    self._condition.wait(
+                        RATE_RETRY_INTERVAL if remaining is None else min(remaining, RATE_RETRY_INTERVAL)
+                    )
+
+    async def acquire_async(self, hosts, requested_rate=None, min_rate=1, unit=DEFAULT_RATE_UNIT, timeout=None):
+        """Como `acquire`, sin bloquear el bucle de eventos: la consulta va a su executor."""
+        loop = asyncio.get_running_loop()
+        hosts = tuple(sorted(set(hosts)))
+        deadline = loop.time() + timeout if timeout is not None else None
+        while True:
+            with self._condition:
+                woken = self._async_waiters.add()
+            try:
+                lease = await loop.run_in_executor(
+                    None, self._try_grant, hosts, requested_rate, min_rate, unit
+                )
+                if lease is not None:
+                    return lease
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                await asyncio.wait(
+                    [woken],
+                    timeout=RATE_RETRY_INTERVAL if remaining is None else min(remaining, RATE_RETRY_INTERVAL),
+                )
+            finally:
+                with self._condition:
+                    self._async_waiters.discard(woken)
+
+    def release(self, lease):
+        if lease.lease_id is None:
+            return
+        with database.get_pool(self.db_path).connection() as conn:
+            conn.execute("DELETE FROM rate_lease_host WHERE lease_id = ?", (lease.lease_id,))
+            conn.execute("DELETE FROM rate_lease WHERE lease_id = ?", (lease.lease_id,))
+            conn.commit()
+        with self._condition:
+            self._held -= 1
+            self._releases += 1
+            self._condition.notify_all()
+            self._async_waiters.wake_all()
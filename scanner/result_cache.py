@@ -0,0 +1,143 @@
+"""Caché de resultados de herramientas compartida entre jobs.
+
+Una entrada se identifica por (tool_id, objetivos normalizados, comando efectivo
+sin rutas propias del job, contenido de los archivos de entrada) y guarda los
+archivos que la ejecución dejó en `tool_outputs`. Solo se cachean las
+herramientas con `cache_ttl_seconds` > 0 en tools_config.json.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from urllib.parse import urlsplit, urlunsplit
+
+META_FILENAME = "meta.json"
+
+# Tras el prefijo solo se admite una extensión: evita recoger archivos de otro objetivo
+# cuyo nombre empieza igual (p. ej. nmap_example.com.mx.nmap para nmap_example.com).
+_OUTPUT_SUFFIX_RE = re.compile(r"(\.[A-Za-z0-9]+)?")
+
+
+def normalize_target(target_value):
+    """Minúsculas en dominios/IPs y en esquema+host de las URLs; sin espacios ni '/' final."""
+    target_value = target_value.strip()
+    if "://" not in target_value:
+        return target_value.lower().rstrip("/")
+    parts = urlsplit(target_value)
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), parts.query, "")
+    )
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def find_output_files(output_dir, prefixes):
+    """Archivos de `output_dir` llamados `<prefijo>[.ext]` para algún prefijo de `prefixes`.
+
+    `prefixes` es {slot: prefijo}; devuelve {"<slot>@<.ext>": ruta}.
+    """
+    files = {}
+    for file_name in os.listdir(output_dir):
+        file_path = os.path.join(output_dir, file_name)
+        if not os.path.isfile(file_path):
+            continue
+        for slot, prefix in prefixes.items():
+            if file_name.startswith(prefix) and _OUTPUT_SUFFIX_RE.fullmatch(
+                file_name[len(prefix):]
+            ):
+                files[f"{slot}@{file_name[len(prefix):]}"] = file_path
+                break
+    return files
+
+
+class ResultCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def _entry_path(self, cache_key):
+        return os.path.join(self.cache_dir, cache_key[:2], cache_key)
+
+    def make_key(self, tool_id, targets, key_command, input_paths=()):
+        """`key_command` es el comando renderizado con las rutas del job ya sustituidas por marcadores."""
+        key_material = {
+            "tool_id": tool_id,
+            "targets": sorted(normalize_target(t) for t in targets),
+            "command": key_command,
+            "inputs": [_file_digest(path) for path in input_paths],
+        }
+        return hashlib.sha256(
+            json.dumps(key_material, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def lookup(self, cache_key, ttl_seconds):
+        """Devuelve la metadata de la entrada si existe y no ha caducado; None si no."""
+        entry_path = self._entry_path(cache_key)
+        try:
+            with open(os.path.join(entry_path, META_FILENAME), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - meta.get("created_at", 0) >= ttl_seconds:
+            shutil.rmtree(entry_path, ignore_errors=True)
+            return None
+        if not all(os.path.exists(os.path.join(entry_path, name)) for name in meta["files"]):
+            return None
+        meta["path"] = entry_path
+        return meta
+
+    def restore(self, meta, output_dir, prefixes):
+        """Enlaza los archivos de la entrada en `output_dir` con los nombres del job actual.
+
+        `prefixes` es {slot: prefijo}, el mismo dict usado al guardar.
+        """
+        restored = []
+        for name in meta["files"]:
+            slot, rest = name.split("@", 1)
+            destination = os.path.join(output_dir, prefixes[slot] + rest)
+            if os.path.exists(destination):
+                os.remove(destination)
+            _link_or_copy(os.path.join(meta["path"], name), destination)
+            restored.append(destination)
+        return restored
+
+    def store(self, cache_key, output_dir, prefixes, meta=None):
+        """Guarda los archivos de `output_dir` llamados `<prefijo>[.ext]` para algún prefijo de `prefixes`.
+
+        `prefixes` es {slot: prefijo}; cada archivo se guarda como `<slot>@<.ext>` para
+        poder restaurarlo con los nombres de otro job. Devuelve el número de archivos guardados.
+        """
+        files = find_output_files(output_dir, prefixes)
+        if not files:
+            return 0
+
+        entry_path = self._entry_path(cache_key)
+        temp_path = f"{entry_path}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(temp_path)
+        try:
+            for name, file_path in files.items():
+                _link_or_copy(file_path, os.path.join(temp_path, name))
+            entry_meta = dict(meta or {}, created_at=time.time(), files=sorted(files))
+            with open(os.path.join(temp_path, META_FILENAME), "w", encoding="utf-8") as f:
+                json.dump(entry_meta, f, indent=4)
+            # Reemplazar la entrada anterior; si otro job escribe la misma clave a la vez, gana uno
+            shutil.rmtree(entry_path, ignore_errors=True)
+            os.rename(temp_path, entry_path)
+        finally:
+            shutil.rmtree(temp_path, ignore_errors=True)
+        return len(files)
@@ -0,0 +1,289 @@
+import datetime
+import socket
+import sqlite3
+import threading
+import time
+
+import psutil
+
+from scanner import task_processes
+from scanner.slots import ToolSlots
+from scanner.worker import make_worker_id
+from utils import database
+
+OWNER_HEARTBEAT_TIMEOUT = 30.0  # Segundos sin latido tras los que un job se da por huérfano
+
+
+class JobScheduler:
+    """Planificador global de jobs de escaneo.
+
+    La cola es persistente: son las filas de la tabla `job` en estado PENDING.
+    Un único hilo admite jobs cuando hay capacidad (límite global de jobs,
+    reparto justo por usuario y CPU/RAM disponibles según psutil). Todas las
+    herramientas de todos los jobs comparten `tool_slots`, que limita el
+    número de procesos de herramientas simultáneos en la máquina.
+
+    Cada job admitido queda a nombre de este proceso (`job.owner_id`), que renueva
+    `owner_heartbeat_at` en cada vuelta. Pueden convivir varios procesos web: cada uno
+    solo recupera los jobs cuyo dueño ya no existe.
+    """
+
+    def __init__(
+        self,
+        db_path,
+        run_job,
+        logger,
+        max_concurrent_jobs=2,
+        max_concurrent_tools=3,
+        max_jobs_per_user=1,
+        max_cpu_percent=85.0,
+        min_available_memory_mb=1024,
+        poll_interval=2.0,
+    ):
+        self.db_path = db_path
+        self.run_job = run_job  # callable(job_row, scheduler) ejecutado en su propio hilo
+        self.logger = logger
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_jobs_per_user = max_jobs_per_user
+        self.max_cpu_percent = max_cpu_percent
+        self.min_available_memory_mb = min_available_memory_mb
+        self.poll_interval = poll_interval
+        self.owner_id = make_worker_id()
+
+        self.tool_slots = ToolSlots(max_concurrent_tools)
+        self.running_jobs = {}  # job_id: {"thread": Thread, "user_id": int, "cancel_event": Event}
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_admission_block = None
+
+    def ensure_started(self):
+        """Arranca el hilo del planificador si aún no está corriendo."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            psutil.cpu_percent(interval=None)  # La primera lectura siempre es 0.0
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._loop, name="panthera-scheduler", daemon=True
+            )
+            self._thread.start()
+            self.logger.info("Planificador de jobs iniciado.")
+
+    def _owner_is_gone(self, owner_id, heartbeat_at, running_job_ids, job_id):
+        if not owner_id or heartbeat_at is None:
+            return True  # Job de una versión sin dueño registrado
+        if heartbeat_at < time.time() - OWNER_HEARTBEAT_TIMEOUT:
+            return True
+        owner_host, _, owner_pid = owner_id.rpartition(":")
+        if owner_host != socket.gethostname() or not owner_pid.isdigit():
+            return False  # Otro host con latido reciente
+        if owner_id == self.owner_id:
+            # Mismo host:pid (p. ej. un contenedor reiniciado): huérfano si no corre aquí
+            return job_id not in running_job_ids
+        return not psutil.pid_exists(int(owner_pid))
+
+    def _heartbeat_running_jobs(self):
+        with self._lock:
+            running_job_ids = list(self.running_jobs)
+        if not running_job_ids:
+            return
+        with database.get_pool(self.db_path).connection() as conn:
+            conn.execute(
+                f"""UPDATE job SET owner_heartbeat_at = ?
+                    WHERE owner_id = ? AND id IN ({', '.join('?' * len(running_job_ids))})""",
+                [time.time(), self.owner_id] + running_job_ids,
+            )
+            conn.commit()
+
+    def _recover_orphaned_jobs(self):
+        """Devuelve a la cola los jobs en curso cuyo proceso dueño murió.
+
+        Antes se matan los grupos de procesos de sus herramientas que sigan vivos en este
+        host. Se reanudan desde sus checkpoints; los que tenían una cancelación pendiente
+        se dan por cancelados. Los jobs de la cola de los workers (ver scanner.task_queue)
+        se recuperan por sus leases, no aquí.
+        """
+        with self._lock:
+            running_job_ids = set(self.running_jobs)
+        recovered_ids = []
+        try:
+            with database.get_pool(self.db_path).connection() as conn:
+                candidate_rows = conn.execute(
+                    """SELECT id, status, owner_id, owner_heartbeat_at FROM job
+                       WHERE status IN ('INITIALIZING', 'RUNNING', 'REQUEST_CANCEL')
+                         AND NOT EXISTS (SELECT 1 FROM task_queue q WHERE q.job_id = job.id)"""
+                ).fetchall()
+                for row in candidate_rows:
+                    if row["id"] in running_job_ids or not self._owner_is_gone(
+                        row["owner_id"], row["owner_heartbeat_at"], running_job_ids, row["id"]
+                    ):
+                        continue
+                    killed, remote = task_processes.kill_stale_processes(conn, row["id"])
+                    if killed:
+                        self.logger.warning(
+                            f"Job {row['id']}: {killed} procesos de herramientas de la ejecución anterior detenidos."
+                        )
+                    if remote:
+                        self.logger.warning(
+                            f"Job {row['id']}: {remote} procesos de herramientas en otro host no se pudieron comprobar."
+                        )
+                    if row["status"] == "REQUEST_CANCEL":
+                        conn.execute(
+                            """UPDATE job SET status = 'CANCELLED', end_timestamp = ?
+                               WHERE id = ? AND status = 'REQUEST_CANCEL' AND owner_id IS ?""",
+                            (datetime.datetime.now().isoformat(), row["id"], row["owner_id"]),
+                        )
+                    else:
+                        # Solo si nadie lo recuperó o lo readmitió entretanto
+                        cur = conn.execute(
+                            """UPDATE job SET status = 'PENDING', owner_id = NULL, owner_heartbeat_at = NULL
+                               WHERE id = ? AND status = ? AND owner_id IS ?""",
+                            (row["id"], row["status"], row["owner_id"]),
+                        )
+                        if cur.rowcount:
+                            recovered_ids.append(row["id"])
+                    conn.commit()
+        except sqlite3.Error as e:
+            self.logger.error(f"No se pudieron recuperar los jobs interrumpidos: {e}")
+            return
+        if recovered_ids:
+            self.logger.warning(
+                f"{len(recovered_ids)} jobs interrumpidos vuelven a la cola: " + ", ".join(recovered_ids)
+            )
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def notify(self):
+        """Despierta el planificador (nuevo job en cola o job terminado)."""
+        self._wakeup.set()
+
+    def is_running(self, job_id):
+        with self._lock:
+            return job_id in self.running_jobs
+
+    def get_cancel_event(self, job_id):
+        """Señal de cancelación en proceso del job en curso (None si no corre aquí)."""
+        with self._lock:
+            job_info = self.running_jobs.get(job_id)
+        return job_info["cancel_event"] if job_info else None
+
+    def request_cancel(self, job_id):
+        """Activa la cancelación inmediata de un job en curso; False si no corre en este proceso."""
+        cancel_event = self.get_cancel_event(job_id)
+        if cancel_event is None:
+            return False
+        cancel_event.set()
+        return True
+
+    def _loop(self):
+        next_recovery = 0.0
+        while not self._stop.is_set():
+            try:
+                self._heartbeat_running_jobs()
+                if time.monotonic() >= next_recovery:
+                    next_recovery = time.monotonic() + OWNER_HEARTBEAT_TIMEOUT / 2
+                    self._recover_orphaned_jobs()
+                self._admit_pending_jobs()
+            except Exception as e:
+                self.logger.error(f"Error en el planificador de jobs: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _system_has_capacity(self):
+        cpu_percent = psutil.cpu_percent(interval=None)
+        if cpu_percent > self.max_cpu_percent:
+            return False, f"CPU al {cpu_percent:.0f}%"
+        available_mb = psutil.virtual_memory().available / (1024 * 1024)
+        if available_mb < self.min_available_memory_mb:
+            return False, f"solo {available_mb:.0f} MB de RAM disponibles"
+        return True, None
+
+    def _pick_next_job(self, pending_rows, running_per_user):
+        """Elige el job PENDING del usuario con menos jobs en curso (el más antiguo en empate)."""
+        best_row = None
+        best_key = None
+        for position, row in enumerate(pending_rows):
+            user_running = running_per_user.get(row["user_id"], 0)
+            if user_running >= self.max_jobs_per_user:
+                continue
+            key = (user_running, position)
+            if best_key is None or key < best_key:
+                best_row, best_key = row, key
+        return best_row
+
+    def _admit_pending_jobs(self):
+        with self._lock:
+            free_job_slots = self.max_concurrent_jobs - len(self.running_jobs)
+            running_per_user = {}
+            for job_info in self.running_jobs.values():
+                user_id = job_info["user_id"]
+                running_per_user[user_id] = running_per_user.get(user_id, 0) + 1
+        if free_job_slots <= 0:
+            return
+
+        with database.get_pool(self.db_path).connection() as conn:
+            pending_rows = conn.execute(
+                "SELECT * FROM job WHERE status = 'PENDING' ORDER BY creation_timestamp ASC"
+            ).fetchall()
+            pending_rows = [r for r in pending_rows if not self.is_running(r["id"])]
+
+            while free_job_slots > 0 and pending_rows:
+                job_row = self._pick_next_job(pending_rows, running_per_user)
+                if job_row is None:
+                    return  # Todos los usuarios con jobs en cola están en su límite
+
+                has_capacity, reason = self._system_has_capacity()
+                if not has_capacity:
+                    if reason != self._last_admission_block:
+                        self.logger.info(
+                            f"Admisión de jobs en pausa ({reason}); {len(pending_rows)} en cola."
+                        )
+                    self._last_admission_block = reason
+                    return
+                self._last_admission_block = None
+
+                pending_rows.remove(job_row)
+                cur = conn.execute(
+                    """UPDATE job SET status = 'RUNNING', start_timestamp = COALESCE(start_timestamp, ?),
+                           owner_id = ?, owner_heartbeat_at = ?
+                       WHERE id = ? AND status = 'PENDING'""",
+                    (datetime.datetime.now().isoformat(), self.owner_id, time.time(), job_row["id"]),
+                )
+                conn.commit()
+                if cur.rowcount == 0:
+                    continue  # Cancelado mientras estaba en cola
+
+                self._launch(dict(job_row))
+                free_job_slots -= 1
+                running_per_user[job_row["user_id"]] = (
+                    running_per_user.get(job_row["user_id"], 0) + 1
+                )
+
+    def _launch(self, job_row):
+        job_id = job_row["id"]
+        job_thread = threading.Thread(
+            target=self._run_and_release, args=(job_row,), name=f"job-{job_id}"
+        )
+        with self._lock:
+            self.running_jobs[job_id] = {
+                "thread": job_thread,
+                "user_id": job_row["user_id"],
+                "cancel_event": threading.Event(),
+            }
+        self.logger.info(f"Job {job_id} admitido por el planificador.")
+        job_thread.start()
+
+    def _run_and_release(self, job_row):
+        try:
+            self.run_job(job_row, self)
+        finally:
+            with self._lock:
+                self.running_jobs.pop(job_row["id"], None)
+            self.notify()
@@ -0,0 +1,94 @@
+"""Slots de procesos de herramientas que comparten el motor de hilos y el asyncio.
+
+`ToolSlots` se usa como un threading.BoundedSemaphore desde los hilos y, desde el
+bucle de eventos compartido (ver executor.get_process_loop), con `acquire_async`,
+que espera sin bloquear el bucle ni sondear: cada `release` despierta a las
+corrutinas en espera, que vuelven a intentarlo.
+"""
+import asyncio
+import threading
+
+
+def _set_woken(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AsyncWaiters:
+    """Corrutinas esperando a que otro hilo libere un recurso protegido por un lock."""
+
+    def __init__(self):
+        self._waiters = set()
+
+    def add(self):
+        """Future que se completa en el próximo `wake_all`; llamar con el lock del recurso tomado."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiters.add((loop, future))
+        return future
+
+    def discard(self, future):
+        self._waiters.discard((future.get_loop(), future))
+
+    def wake_all(self):
+        """Despierta a todas: cada una vuelve a comprobar si puede tomar el recurso."""
+        for loop, future in self._waiters:
+            loop.call_soon_threadsafe(_set_woken, future)
+        self._waiters.clear()
+
+
+async def wait_woken(lock, waiters, try_acquire, timeout=None):
+    """Repite `try_acquire()` (con `lock` tomado) hasta que devuelva algo distinto de None.
+
+    Entre intentos espera a `waiters.wake_all()`. Devuelve None si pasa `timeout`.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    while True:
+        with lock:
+            acquired = try_acquire()
+            if acquired is not None:
+                return acquired
+            woken = waiters.add()
+        try:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return None
+            await asyncio.wait([woken], timeout=remaining)
+        finally:
+            with lock:
+                waiters.discard(woken)
+
+
+class ToolSlots:
+    """Semáforo acotado de procesos de herramientas con espera asíncrona."""
+
+    def __init__(self, value):
+        self._cond = threading.Condition()
+        self._value = self._max_value = value
+        self._async_waiters = AsyncWaiters()
+
+    def _try_take(self):
+        if self._value <= 0:
+            return None
+        self._value -= 1
+        return True
+
+    def acquire(self, blocking=True, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._value > 0, timeout if blocking else 0):
+                return False
+            self._value -= 1
+            return True
+
+    async def acquire_async(self, timeout=None):
+        """Como `acquire(timeout=...)`, sin bloquear el bucle de eventos."""
+        return bool(await wait_woken(self._cond, self._async_waiters, self._try_take, timeout))
+
+    def release(self):
+        with self._cond:
+            if self._value >= self._max_value:
+                raise ValueError("ToolSlots liberado más veces de las adquiridas")
+            self._value += 1
+            self._cond.notify()
+            self._async_waiters.wake_all()
@@ -0,0 +1,178 @@
+"""Clasificación y normalización de objetivos.
+
+Cada objetivo se clasifica como dominio, IP, CIDR, URL o host:puerto y de él se
+derivan las formas que aceptan los distintos `target_type` de las herramientas
+(p. ej. el host de una URL para nmap o una URL a partir de un dominio para whatweb).
+Un objetivo sin forma compatible con una herramienta no genera tarea para ella.
+"""
+import functools
+import ipaddress
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+KIND_DOMAIN = "domain"
+KIND_IP = "ip"
+KIND_CIDR = "cidr"
+KIND_URL = "url"
+KIND_HOST_PORT = "host_port"
+
+_DOMAIN_RE = re.compile(
+    r"^(?!-)[a-z0-9_-]{1,63}(?<!-)(?:\.(?!-)[a-z0-9_-]{1,63}(?<!-))*$"
+)
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class TargetError(ValueError):
+    """El objetivo no es un dominio, IP, CIDR, URL ni host:puerto válido."""
+
+
+def _classify_host(host):
+    """(tipo, host normalizado) de un host suelto: IP o dominio."""
+    host = host.strip().lower().rstrip(".")
+    if host.startswith("[") and host.endswith("]"):
+        host = host[1:-1]
+    try:
+        return KIND_IP, str(ipaddress.ip_address(host))
+    except ValueError:
+        pass
+    if len(host) <= 253 and _DOMAIN_RE.match(host):
+        return KIND_DOMAIN, host
+    raise TargetError(f"Host no válido: {host or '(vacío)'}")
+
+
+def _format_host_port(host, port):
+    return f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+
+
+def classify_target(raw_target):
+    """Clasifica un objetivo y devuelve un dict con `value` (forma normalizada), `kind`,
+    `host`, `host_kind` (domain/ip), `port` y `scheme` (None si no aplican).
+    """
+    text = raw_target.strip()
+    if not text:
+        raise TargetError("Objetivo vacío")
+
+    if "://" in text:
+        parts = urlsplit(text)
+        scheme = parts.scheme.lower()
+        if not scheme or not parts.hostname:
+            raise TargetError(f"URL no válida: {text}")
+        host_kind, host = _classify_host(parts.hostname)
+        try:
+            explicit_port = parts.port
+        except ValueError as e:
+            raise TargetError(f"Puerto no válido en {text}") from e
+        netloc = host if explicit_port is None else _format_host_port(host, explicit_port)
+        if ":" in host and explicit_port is None:
+            netloc = f"[{host}]"
+        path = "" if parts.path == "/" else parts.path
+        return {
+            "value": urlunsplit((scheme, netloc, path, parts.query, "")),
+            "kind": KIND_URL,
+            "host": host,
+            "host_kind": host_kind,
+            "port": explicit_port or _DEFAULT_PORTS.get(scheme),
+            "scheme": scheme,
+        }
+
+    if "/" in text:
+        try:
+            network = ipaddress.ip_network(text, strict=False)
+        except ValueError as e:
+            raise TargetError(f"CIDR no válido: {text}") from e
+        return {
+            "value": str(network),
+            "kind": KIND_CIDR,
+            "host": None,
+            "host_kind": None,
+            "port": None,
+            "scheme": None,
+        }
+
+    host_text, port = text, None
+    if text.startswith("[") and "]:" in text:  # [IPv6]:puerto
+        host_text, _, port_text = text[1:].partition("]:")
+        port = port_text
+    elif text.count(":") == 1:
+        host_text, _, port = text.partition(":")
+    if port is not None:
+        if not port.isdigit() or not 0 < int(port) < 65536:
+            raise TargetError(f"Puerto no válido en {text}")
+        port = int(port)
+    host_kind, host = _classify_host(host_text)
+    return {
+        "value": host if port is None else _format_host_port(host, port),
+        "kind": KIND_HOST_PORT if port is not None else host_kind,
+        "host": host,
+        "host_kind": host_kind,
+        "port": port,
+        "scheme": None,
+    }
+
+
+def normalize_targets(raw_targets):
+    """Normaliza y deduplica los objetivos conservando el orden.
+
+    Devuelve (objetivos normalizados, {objetivo original: error}).
+    """
+    normalized = {}
+    invalid = {}
+    for raw_target in raw_targets:
+        try:
+            target = classify_target(raw_target)
+        except TargetError as e:
+            invalid[raw_target] = str(e)
+            continue
+        normalized.setdefault(target["value"], target)
+    return list(normalized), invalid
+
+
+def _url_for(target):
+    if target["kind"] == KIND_URL:
+        return target["value"]
+    if target["host"] is None:
+        return None
+    port = target["port"]
+    scheme = "https" if port == 443 else "http"
+    host = f"[{target['host']}]" if ":" in target["host"] else target["host"]
+    netloc = host if port in (None, _DEFAULT_PORTS[scheme]) else f"{host}:{port}"
+    return f"{scheme}://{netloc}"
+
+
+@functools.lru_cache(maxsize=16384)
+def _classify_cached(target_value):
+    return classify_target(target_value)
+
+
+def get_target_form(target_value, target_type):
+    """Forma del objetivo que recibe una herramienta con `target_type`; None si no es compatible.
+
+    Los `target_type` desconocidos (y los objetivos que no se pueden clasificar) reciben
+    el objetivo tal cual.
+    """
+    try:
+        target = _classify_cached(target_value)
+    except TargetError:
+        return target_value
+    kind, host, host_kind = target["kind"], target["host"], target["host_kind"]
+    base_type = target_type[: -len("_list")] if target_type.endswith("_list") else target_type
+
+    if base_type == "domain":
+        return host if host_kind == KIND_DOMAIN else None
+    if base_type == "domain_or_ip":
+        return host
+    if base_type == "host_or_ip":
+        return target["value"] if kind == KIND_CIDR else host
+    if base_type == "host_or_ip_and_port":
+        if host is None:
+            return None
+        return _format_host_port(host, target["port"]) if target["port"] else host
+    if base_type == "url":
+        return _url_for(target)
+    if base_type == "domain_or_url":
+        if kind == KIND_URL:
+            return target["value"]
+        return host if host_kind == KIND_DOMAIN else None
+    if base_type == "url_or_domain":
+        return target["value"]
+    return target_value
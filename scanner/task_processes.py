@@ -0,0 +1,83 @@
+"""Procesos de herramientas en curso, registrados en la tabla `task_process`.
+
+Cada herramienta corre en su propio grupo de procesos (start_new_session), así que
+sobrevive a la caída del proceso que la lanzó. Antes de reanudar un job, o de volver
+a ejecutar una tarea cuyo lease caducó, se matan los grupos que quedaron vivos de la
+ejecución anterior para no tener la misma herramienta corriendo dos veces.
+"""
+import os
+import signal
+import socket
+
+import psutil
+
+CREATE_TIME_TOLERANCE = 1.0  # Segundos: psutil redondea create_time según la plataforma
+
+
+def record_process(conn, job_id, task_key, pid):
+    """Registra el proceso (y grupo) `pid` de una tarea recién lanzada en este host."""
+    try:
+        create_time = psutil.Process(pid).create_time()
+    except psutil.Error:
+        return  # Ya terminó: no queda nada que matar
+    conn.execute(
+        """INSERT INTO task_process (job_id, task_key, host, pid, create_time) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT (job_id, task_key) DO UPDATE SET
+               host = excluded.host, pid = excluded.pid, create_time = excluded.create_time""",
+        (job_id, task_key, socket.gethostname(), pid, create_time),
+    )
+    conn.commit()
+
+
+def forget_process(conn, job_id, task_key):
+    conn.execute(
+        "DELETE FROM task_process WHERE job_id = ? AND task_key = ?", (job_id, task_key)
+    )
+    conn.commit()
+
+
+def _is_recorded_group(pid, create_time):
+    """True si el grupo `pid` sigue siendo el de la herramienta registrada."""
+    try:
+        leader = psutil.Process(pid)
+    except psutil.NoSuchProcess:
+        # El líder murió pero el grupo puede seguir vivo: Linux no reutiliza un pid
+        # mientras haya un grupo con ese id, así que si existe es el original
+        return True
+    except psutil.Error:
+        return False
+    try:
+        return abs(leader.create_time() - create_time) <= CREATE_TIME_TOLERANCE
+    except psutil.Error:
+        return False
+
+
+def kill_stale_processes(conn, job_id, task_keys=None):
+    """Mata los grupos de procesos registrados del job (o de `task_keys`) y olvida sus registros.
+
+    Devuelve (grupos matados, registros de otros hosts que no se pudieron comprobar).
+    """
+    query = "SELECT task_key, host, pid, create_time FROM task_process WHERE job_id = ?"
+    params = [job_id]
+    if task_keys is not None:
+        query += f" AND task_key IN ({', '.join('?' * len(task_keys))})"
+        params.extend(task_keys)
+    rows = conn.execute(query, params).fetchall()
+    killed, remote = 0, 0
+    host = socket.gethostname()
+    for row in rows:
+        if row["host"] != host:
+            remote += 1
+            continue
+        if _is_recorded_group(row["pid"], row["create_time"]):
+            try:
+                os.killpg(row["pid"], signal.SIGKILL)
+                killed += 1
+            except (ProcessLookupError, PermissionError):
+                pass  # El grupo ya no existe
+    conn.executemany(
+        "DELETE FROM task_process WHERE job_id = ? AND task_key = ?",
+        [(job_id, row["task_key"]) for row in rows],
+    )
+    conn.commit()
+    return killed, remote
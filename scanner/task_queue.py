@@ -0,0 +1,190 @@
+"""Cola persistente de tareas herramienta×objetivo para los workers (tabla `task_queue`).
+
+Un worker planifica un job PENDING insertando todas sus tareas en la cola (cada una
+con su especificación del DAG, ver scanner.planner) y lo pasa a RUNNING en la misma
+transacción. Después cualquier worker reclama tareas
+listas (sus dependencias ya están `done`) con un lease que renueva mientras la
+ejecuta; si el worker muere, el lease caduca y otro worker la vuelve a reclamar.
+El resultado de cada tarea se guarda en `job_task` (ver scanner.checkpoints)
+antes de marcarla `done`.
+"""
+import datetime
+import json
+import time
+
+LEASE_SECONDS = 60.0
+MAX_TASK_ATTEMPTS = 3
+
+
+def enqueue_job_tasks(conn, job_id, scan_tasks, finished_task_keys=()):
+    """Inserta las tareas del DAG de un job; las de `finished_task_keys` entran ya como `done`."""
+    now = time.time()
+    conn.executemany(
+        """INSERT INTO task_queue (job_id, task_key, tool_id, priority, depends_on, task_spec, state, enqueued_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT (job_id, task_key) DO NOTHING""",
+        [
+            (
+                job_id,
+                task_key,
+                task["tool_id"],
+                task["priority"],
+                json.dumps(task["depends_on"]),
+                json.dumps(task),
+                "done" if task_key in finished_task_keys else "queued",
+                now,
+            )
+            for task_key, task in scan_tasks.items()
+        ],
+    )
+
+
+def claim_next_job(conn, max_running_jobs):
+    """Pasa a RUNNING el job PENDING más antiguo si hay menos de `max_running_jobs` en curso.
+
+    No hace commit: el llamador inserta las tareas en la misma transacción.
+    Devuelve la fila del job (estado anterior a la actualización) o None.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute(
+        """SELECT * FROM job
+           WHERE status = 'PENDING'
+             AND (SELECT COUNT(*) FROM job WHERE status = 'RUNNING') < ?
+           ORDER BY creation_timestamp ASC
+           LIMIT 1""",
+        (max_running_jobs,),
+    ).fetchone()
+    if row is None:
+        conn.rollback()
+        return None
+    conn.execute(
+        "UPDATE job SET status = 'RUNNING', start_timestamp = COALESCE(start_timestamp, ?) WHERE id = ?",
+        (datetime.datetime.now().isoformat(), row["id"]),
+    )
+    return row
+
+
+def claim_task(conn, worker_id, lease_seconds=LEASE_SECONDS):
+    """Reclama la tarea lista más prioritaria (job más antiguo, fase más temprana).
+
+    Sirven las tareas `queued` y las `leased` cuyo lease caducó. Devuelve
+    {job_id, task_key, tool_id, attempts, task} o None; `task` es None en las tareas
+    encoladas antes de guardarse su especificación.
+    """
+    now = time.time()
+    row = conn.execute(
+        """UPDATE task_queue
+           SET state = 'leased', worker_id = ?, lease_expires_at = ?, attempts = attempts + 1
+           WHERE (job_id, task_key) = (
+               SELECT q.job_id, q.task_key
+               FROM task_queue q
+               JOIN job j ON j.id = q.job_id
+               WHERE j.status = 'RUNNING'
+                 AND (q.state = 'queued' OR (q.state = 'leased' AND q.lease_expires_at < ?))
+                 AND NOT EXISTS (
+                     SELECT 1
+                     FROM json_each(q.depends_on) dep
+                     JOIN task_queue dq ON dq.job_id = q.job_id AND dq.task_key = dep.value
+                     WHERE dq.state != 'done'
+                 )
+               ORDER BY j.creation_timestamp ASC, q.priority ASC, q.enqueued_at ASC
+               LIMIT 1
+           )
+           RETURNING job_id, task_key, tool_id, attempts, task_spec""",
+        (worker_id, now + lease_seconds, now),
+    ).fetchone()
+    conn.commit()
+    if row is None:
+        return None
+    claimed = dict(row)
+    task_spec = claimed.pop("task_spec")
+    claimed["task"] = json.loads(task_spec) if task_spec else None
+    return claimed
+
+
+def count_job_tasks(conn, job_id):
+    """(tareas del job, tareas ya `done`) para el progreso global."""
+    row = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(state = 'done'), 0) FROM task_queue WHERE job_id = ?",
+        (job_id,),
+    ).fetchone()
+    return row[0], row[1]
+
+
+def renew_lease(conn, worker_id, job_id, task_key, lease_seconds=LEASE_SECONDS):
+    """Prolonga el lease; False si la tarea ya no es de este worker."""
+    cur = conn.execute(
+        """UPDATE task_queue SET lease_expires_at = ?
+           WHERE job_id = ? AND task_key = ? AND worker_id = ? AND state = 'leased'""",
+        (time.time() + lease_seconds, job_id, task_key, worker_id),
+    )
+    conn.commit()
+    return cur.rowcount == 1
+
+
+def is_job_cancelling(conn, job_id):
+    """True si el job tiene una cancelación pendiente (o ya se canceló)."""
+    row = conn.execute("SELECT status FROM job WHERE id = ?", (job_id,)).fetchone()
+    return row is not None and row["status"] in ("REQUEST_CANCEL", "CANCELLED")
+
+
+def complete_task(conn, worker_id, job_id, task_key):
+    conn.execute(
+        """UPDATE task_queue SET state = 'done', lease_expires_at = NULL
+           WHERE job_id = ? AND task_key = ? AND worker_id = ?""",
+        (job_id, task_key, worker_id),
+    )
+    conn.commit()
+
+
+def release_task(conn, worker_id, job_id, task_key):
+    """Devuelve a la cola una tarea que este worker no llegó a terminar."""
+    conn.execute(
+        """UPDATE task_queue SET state = 'queued', worker_id = NULL, lease_expires_at = NULL
+           WHERE job_id = ? AND task_key = ? AND worker_id = ? AND state = 'leased'""",
+        (job_id, task_key, worker_id),
+    )
+    conn.commit()
+
+
+def get_job_final_status(conn, job_id):
+    """Estado final del job si ya no le quedan tareas por ejecutar; None si aún no terminó.
+
+    Un job con cancelación pendiente descarta sus tareas en cola y termina CANCELLED
+    cuando no queda ninguna con un lease vigente.
+    """
+    job_row = conn.execute("SELECT status FROM job WHERE id = ?", (job_id,)).fetchone()
+    if job_row is None:
+        return None
+    if job_row["status"] == "REQUEST_CANCEL":
+        conn.execute(
+            "UPDATE task_queue SET state = 'done' WHERE job_id = ? AND state = 'queued'", (job_id,)
+        )
+        conn.commit()
+        still_running = conn.execute(
+            """SELECT 1 FROM task_queue
+               WHERE job_id = ? AND state = 'leased' AND lease_expires_at >= ? LIMIT 1""",
+            (job_id, time.time()),
+        ).fetchone()
+        return None if still_running else "CANCELLED"
+    if job_row["status"] != "RUNNING":
+        return None
+    unfinished = conn.execute(
+        "SELECT 1 FROM task_queue WHERE job_id = ? AND state != 'done' LIMIT 1", (job_id,)
+    ).fetchone()
+    if unfinished:
+        return None
+    has_errors = conn.execute(
+        "SELECT 1 FROM job_task WHERE job_id = ? AND status = 'error' LIMIT 1", (job_id,)
+    ).fetchone()
+    return "COMPLETED_WITH_ERRORS" if has_errors else "COMPLETED"
+
+
+def list_jobs_requesting_cancel(conn):
+    """Jobs con cancelación pendiente que tienen tareas en la cola."""
+    rows = conn.execute(
+        """SELECT DISTINCT q.job_id FROM task_queue q
+           JOIN job j ON j.id = q.job_id
+           WHERE j.status = 'REQUEST_CANCEL'"""
+    ).fetchall()
+    return [row["job_id"] for row in rows]
@@ -0,0 +1,952 @@
+"""Ciclo de vida de las tareas de un job: preparación, ejecución, resultados y progreso.
+
+`JobRun` guarda el estado que comparten las tareas de una ejecución: diario, resultados
+por tarea, contadores de progreso, slots de procesos y tasa.
+`run()` construye el DAG del job (ver scanner.planner) y lo despacha en un pool de hilos
+o en el bucle de eventos compartido; `run_queued_task()` ejecuta una sola tarea ya
+planificada, como hacen los workers independientes (ver scanner.worker).
+"""
+import asyncio
+import concurrent.futures
+import datetime
+import os
+import signal
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from utils import database, helpers, journal, metrics, output_index
+from scanner import checkpoints, executor, findings, planner, task_processes
+from scanner.command_template import (
+    CommandTemplate,
+    TemplateError,
+    get_param_values,
+    get_target_values,
+)
+from scanner.rate_limits import DEFAULT_RATE_UNIT
+from scanner.result_cache import find_output_files
+from scanner.slots import ToolSlots
+
+CANCEL_CHECK_INTERVAL = 2  # Segundos entre comprobaciones de REQUEST_CANCEL en la DB
+OUTPUT_INDEX_INTERVAL = 30  # Segundos entre indexaciones de la salida de una herramienta en curso
+
+
+class JobRun:
+    """Ejecución de las tareas de un job en este proceso.
+
+    Con `engine="asyncio"` los procesos de las herramientas los supervisa un único
+    bucle de eventos compartido (ver executor.run_streaming_async) en lugar de un
+    hilo por tarea; la concurrencia la limitan solo `max_parallel_tasks` y `tool_slots`.
+    `rate_scheduler` (ver scanner.rate_limits) limita además las herramientas por host
+    y reparte el presupuesto global de tasa, compartido con los demás jobs del proceso.
+    """
+
+    def __init__(
+        self,
+        job_id,
+        job_path,
+        advanced_options,
+        db_path,
+        tool_definitions,
+        logger,
+        max_parallel_tasks=1,
+        tool_slots=None,
+        cancel_event=None,
+        result_cache=None,
+        engine="threads",
+        rate_scheduler=None,
+    ):
+        self.job_id = job_id
+        self.job_path = job_path
+        self.advanced_options = advanced_options
+        self.tool_definitions = tool_definitions
+        self.logger = logger
+        self.max_parallel_tasks = max_parallel_tasks
+        self.result_cache = result_cache
+        self.engine = engine
+        self.rate_scheduler = rate_scheduler
+
+        self.tool_outputs_dir = Path(job_path) / "tool_outputs"
+        os.makedirs(self.tool_outputs_dir, exist_ok=True)
+
+        # Logs y progreso se registran como eventos en el diario del job (ver utils.journal)
+        self.job_journal = journal.JobJournal(job_path)
+
+        # Plantillas de comando compiladas al cargar la configuración (ver scanner.command_template)
+        self.command_templates = helpers.get_command_templates()
+
+        # Cada combinación herramienta×objetivo es una tarea del DAG del job (ver scanner.planner)
+        self.task_results = {}  # task_key: {"status": ..., "output_path": ...}
+        self.total_tasks = 0
+        self.finished_tasks = 0
+        # Señal de cancelación en proceso: al activarse se matan las herramientas en curso
+        self.cancel_detected = cancel_event if cancel_event is not None else threading.Event()
+
+        # Los workers del pool comparten contador de progreso y resultados; cada consulta
+        # toma una conexión del pool y el progreso se escribe en la DB por lotes.
+        self.state_lock = threading.Lock()
+        self.db_pool = database.get_pool(db_path)
+        self.progress_batcher = database.get_progress_batcher(db_path)
+
+        # Slots globales de procesos compartidos con los demás jobs (ver JobScheduler)
+        if tool_slots is None:
+            tool_slots = ToolSlots(max(1, int(max_parallel_tasks)))
+        self.tool_slots = tool_slots
+
+    def is_cancel_requested(self):
+        if self.cancel_detected.is_set():
+            return True
+        with self.db_pool.connection() as conn_cancel:
+            job_status_db = conn_cancel.execute(
+                "SELECT status FROM job WHERE id = ?", (self.job_id,)
+            ).fetchone()
+        if job_status_db and job_status_db["status"] in [
+            "REQUEST_CANCEL",
+            "CANCELLED",
+        ]:
+            self.cancel_detected.set()
+            return True
+        return False
+
+    def record_task_result(
+        self,
+        progress_key,
+        progress_update,
+        task_logs,
+        output_path=None,
+        batch_targets=None,
+        tool_id=None,
+    ):
+        # Un lote también actualiza la entrada de cada objetivo que cubre
+        result_counts = {}
+        if batch_targets and output_path:
+            try:
+                result_counts = planner.count_results_per_target(output_path, batch_targets)
+            except OSError as e_count:
+                self.logger.warning(f"Job {self.job_id}: no se pudo atribuir {progress_key}: {e_count}")
+        progress_events = [
+            journal.make_log_event(log_message, log_type)
+            for log_message, log_type in task_logs
+        ]
+        progress_events.append(journal.make_progress_event(progress_key, progress_update))
+        for batch_target in batch_targets or []:
+            progress_events.append(
+                journal.make_progress_event(
+                    planner.make_task_key(tool_id, batch_target),
+                    dict(
+                        progress_update,
+                        batch=progress_key,
+                        result_count=result_counts.get(batch_target),
+                    ),
+                )
+            )
+
+        # Checkpoint durable antes de darla por terminada: un reinicio no la repetirá
+        if tool_id is not None:
+            try:
+                with self.db_pool.connection() as conn_checkpoint:
+                    checkpoints.save_task_checkpoint(
+                        conn_checkpoint,
+                        self.job_id,
+                        progress_key,
+                        tool_id,
+                        progress_update["status"],
+                        output_path,
+                    )
+            except sqlite3.Error as e_checkpoint:
+                self.logger.warning(
+                    f"Job {self.job_id}: no se pudo guardar el checkpoint de {progress_key}: {e_checkpoint}"
+                )
+
+        with self.state_lock:
+            self.task_results[progress_key] = {
+                "status": progress_update["status"],
+                "output_path": output_path,
+            }
+            self.finished_tasks += 1
+            current_progress = (
+                int((self.finished_tasks / self.total_tasks) * 100)
+                if self.total_tasks > 0
+                else 0
+            )
+
+            progress_events.append(
+                journal.make_summary_event({"overall_progress": current_progress})
+            )
+            self.job_journal.append(*progress_events)
+            self.progress_batcher.set_progress(self.job_id, current_progress)
+
+    def ingest_task_findings(self, tool_id, tool_definition, job_path_values, target_label):
+        """Guarda la salida de una tarea completada en las tablas de resultados (ver scanner.findings).
+
+        Devuelve (registros por tabla o None, logs para la tarea).
+        """
+        parser_name = tool_definition.get("output_parser")
+        if not parser_name:
+            return None, []
+        if parser_name not in findings.PARSERS:
+            return None, [(f"Parser de resultados desconocido para {tool_id}: {parser_name}.", "warn")]
+        input_path = findings.get_parser_input_path(parser_name, job_path_values)
+        if not input_path or not os.path.exists(input_path):
+            return None, []
+        try:
+            with self.db_pool.connection() as conn_findings:
+                record_counts = findings.ingest_tool_output(
+                    conn_findings, self.job_id, tool_id, parser_name, input_path
+                )
+        except (OSError, sqlite3.Error, findings.FindingsParseError) as e_findings:
+            self.logger.warning(
+                f"Job {self.job_id}: no se pudo procesar la salida de {tool_id} en {target_label}: {e_findings}"
+            )
+            return None, [(f"No se pudieron procesar los resultados de {tool_id} en {target_label}: {e_findings}", "warn")]
+        return record_counts, []
+
+    def index_task_outputs(self, tool_id, output_prefixes, target_label, running=False):
+        """Añade al índice de texto completo los archivos de una tarea (ver utils.output_index).
+
+        Con `running` la herramienta sigue escribiendo: solo se indexan líneas completas.
+        """
+        try:
+            output_paths = sorted(find_output_files(self.tool_outputs_dir, output_prefixes).values())
+            with self.db_pool.connection() as conn_index:
+                output_index.index_files(
+                    conn_index, self.job_id, tool_id, output_paths, complete_lines_only=running
+                )
+        except (OSError, sqlite3.Error) as e_index:
+            self.logger.warning(
+                f"Job {self.job_id}: no se pudo indexar la salida de {tool_id} en {target_label}: {e_index}"
+            )
+
+    def track_task_process(self, progress_key, pid):
+        """Registra el grupo de procesos de una tarea por si este proceso muere (ver scanner.task_processes)."""
+        try:
+            with self.db_pool.connection() as conn_process:
+                task_processes.record_process(conn_process, self.job_id, progress_key, pid)
+        except sqlite3.Error as e_process:
+            self.logger.warning(f"Job {self.job_id}: no se pudo registrar el proceso de {progress_key}: {e_process}")
+
+    def untrack_task_process(self, progress_key):
+        try:
+            with self.db_pool.connection() as conn_process:
+                task_processes.forget_process(conn_process, self.job_id, progress_key)
+        except sqlite3.Error as e_process:
+            self.logger.warning(f"Job {self.job_id}: no se pudo olvidar el proceso de {progress_key}: {e_process}")
+
+    def build_input_file(self, task, upstream_paths):
+        """Devuelve el archivo de entrada de una tarea a partir de las salidas de sus dependencias."""
+        if len(upstream_paths) == 1:
+            return upstream_paths[0]
+        merged_path = self.tool_outputs_dir / f"{task['key'].replace('://', '_').replace('/', '_').replace(':', '_')}_input.txt"
+        seen_lines = set()
+        with open(merged_path, "w", encoding="utf-8") as f_in:
+            for upstream_path in upstream_paths:
+                with open(upstream_path, "r", encoding="utf-8", errors="replace") as f_up:
+                    for line in f_up:
+                        line = line.strip()
+                        if line and line not in seen_lines:
+                            seen_lines.add(line)
+                            f_in.write(line + "\n")
+        return str(merged_path)
+
+    def prepare_tool_run(self, task):
+        """Prepara una tarea hasta tener su comando listo para ejecutar.
+
+        Devuelve None si la tarea ya quedó resuelta (cancelada, omitida, error de
+        plantilla o resultado de la caché).
+        """
+        target_value = task["target"]
+        batch_targets = task.get("batch_targets")
+        if batch_targets is None:
+            target_label = target_value
+            output_stem = f"{task['tool_id']}_{target_value.replace('://', '_').replace('/', '_').replace(':', '_')}"
+        else:
+            target_label = f"{len(batch_targets)} objetivos ({task['key']})"
+            output_stem = task["key"]
+            target_value = ""  # Las plantillas de lote usan {targets_file}
+        tool_config_entry = task["tool_config_entry"]
+        tool_id = tool_config_entry["id"]
+        user_cli_params_for_tool = tool_config_entry.get(
+            "cli_params", {}
+        )  # Params specific to this tool invocation
+        tool_definition = self.tool_definitions.get(tool_id, {})
+        progress_key = task["key"]
+
+        # Check for cancellation request (solo el primer worker que lo detecta lo registra)
+        if self.cancel_detected.is_set():
+            return
+        if self.is_cancel_requested():
+            self.logger.info(
+                f"Cancelación detectada para job {self.job_id} dentro del motor. Herramienta {tool_id} en {target_label} no se ejecutará."
+            )
+            self.job_journal.log(
+                f"Escaneo cancelado antes de ejecutar {tool_id} en {target_label}.",
+                "warn",
+            )
+            return
+
+        # La salida de las dependencias sustituye a volver a ejecutarlas dentro de la plantilla
+        upstream_paths = []
+        for dep_key in task["depends_on"]:
+            dep_result = self.task_results.get(dep_key, {})
+            if dep_result.get("status") != "completed" or not dep_result.get("output_path"):
+                self.record_task_result(
+                    progress_key,
+                    {
+                        "status": "skipped",
+                        "output_file": None,
+                        "end_time": datetime.datetime.now().isoformat(),
+                        "error_message": f"Dependencia {dep_key} no completada",
+                    },
+                    [(f"{tool_id} en {target_label} omitido: {dep_key} no se completó.", "warn")],
+                    batch_targets=batch_targets,
+                    tool_id=tool_id,
+                )
+                return
+            upstream_paths.append(dep_result["output_path"])
+
+        tool_output_filename = f"{output_stem}_{helpers.get_current_timestamp_str()}.txt"
+        tool_output_filepath = self.tool_outputs_dir / tool_output_filename
+
+        command_template = tool_definition.get("command_template", "")
+        if not command_template:
+            self.logger.warning(f"Job {self.job_id}: No command template for tool {tool_id}")
+            self.record_task_result(
+                progress_key,
+                {
+                    "status": "error",
+                    "error_message": "No command template",
+                    "output_file": None,
+                },
+                [(f"No se encontró plantilla de comando para {tool_id}.", "error")],
+                batch_targets=batch_targets,
+                tool_id=tool_id,
+            )
+            return
+
+        compiled_template = self.command_templates.get(tool_id)
+        if compiled_template is None or compiled_template.source != command_template:
+            compiled_template = CommandTemplate(
+                command_template, tool_definition.get("needs_shell", False)
+            )
+
+        # Si la herramienta escribe su propio {output_file}, la salida de consola va a un .log aparte
+        console_log_filepath = (
+            tool_output_filepath.with_suffix(".log")
+            if "output_file" in compiled_template.placeholders
+            else tool_output_filepath
+        )
+
+        input_filepath = self.build_input_file(task, upstream_paths) if upstream_paths else None
+        targets_filepath = None
+        if batch_targets is not None and "targets_file" in compiled_template.placeholders:
+            targets_filepath = self.tool_outputs_dir / f"{output_stem}_targets.txt"
+            with open(targets_filepath, "w", encoding="utf-8") as f_targets:
+                for batch_value in task.get("batch_values", batch_targets):
+                    f_targets.write(f"{batch_value}\n")
+
+        # Valores de los placeholders. Prioridad: objetivo y rutas del job > opciones
+        # avanzadas globales > parámetros CLI del usuario > defaults de cli_params_config
+        placeholder_values = get_param_values(
+            tool_definition, user_cli_params_for_tool
+        )
+        if tool_id == "nmap_top_ports" and self.advanced_options.get("customScanTime"):
+            placeholder_values["nmap_timing_option"] = self.advanced_options["customScanTime"]
+        target_values = (
+            get_target_values(task.get("target_value", target_value))
+            if batch_targets is None
+            else {}
+        )
+        job_path_values = {
+            "output_file": str(tool_output_filepath),
+            "output_file_base": str(self.tool_outputs_dir / output_stem),
+            "output_file_json": str(tool_output_filepath.with_suffix(".json")),
+            "output_file_xml": str(tool_output_filepath.with_suffix(".xml")),
+            "output_file_dir": str(self.tool_outputs_dir),
+        }
+        if input_filepath:
+            job_path_values["input_file"] = input_filepath
+        if targets_filepath:
+            job_path_values["targets_file"] = str(targets_filepath)
+        placeholder_values.update(target_values)
+        placeholder_values.update(job_path_values)
+
+        try:
+            command, stdout_path = compiled_template.render(placeholder_values)
+        except TemplateError as e_template:
+            self.record_task_result(
+                progress_key,
+                {
+                    "status": "error",
+                    "error_message": str(e_template),
+                    "output_file": None,
+                    "end_time": datetime.datetime.now().isoformat(),
+                },
+                [(f"No se pudo construir el comando de {tool_id} en {target_label}: {e_template}", "error")],
+                batch_targets=batch_targets,
+                tool_id=tool_id,
+            )
+            return
+        final_command = compiled_template.display(command, stdout_path)
+
+        # Caché entre jobs: mismo comando efectivo sobre los mismos objetivos y entradas
+        cache_key = None
+        cache_prefixes = {"output": tool_output_filepath.stem, "base": output_stem}
+        cache_ttl = int(tool_definition.get("cache_ttl_seconds", 0) or 0)
+        if self.result_cache is not None and cache_ttl > 0 and "output_file_dir" not in compiled_template.placeholders:
+            # El comando de la clave lleva marcadores en lugar de rutas y objetivo del job
+            key_values = dict(placeholder_values)
+            for name in list(target_values) + list(job_path_values):
+                key_values[name] = "{" + name + "}"
+            key_command = compiled_template.display(*compiled_template.render(key_values))
+            cache_key = self.result_cache.make_key(
+                tool_id,
+                task.get("batch_values", batch_targets)
+                if batch_targets is not None
+                else [task.get("target_value", target_value)],
+                key_command,
+                upstream_paths,
+            )
+            cached_entry = (
+                None
+                if self.advanced_options.get("bypass_result_cache")
+                else self.result_cache.lookup(cache_key, cache_ttl)
+            )
+            if cached_entry:
+                self.result_cache.restore(cached_entry, self.tool_outputs_dir, cache_prefixes)
+                cached_at = datetime.datetime.fromtimestamp(cached_entry["created_at"]).isoformat()
+                record_counts, findings_logs = self.ingest_task_findings(
+                    tool_id, tool_definition, job_path_values, target_label
+                )
+                self.index_task_outputs(tool_id, cache_prefixes, target_label)
+                self.record_task_result(
+                    progress_key,
+                    {
+                        "status": "completed",
+                        "command": final_command,
+                        "output_file": tool_output_filepath.name,
+                        "end_time": datetime.datetime.now().isoformat(),
+                        "error_message": None,
+                        "cached_at": cached_at,
+                        "cached_from_job": cached_entry.get("job_id"),
+                        "records": record_counts,
+                    },
+                    [(f"{tool_id} en {target_label}: resultado reutilizado de la caché ({cached_at}).", "info")]
+                    + findings_logs,
+                    output_path=(
+                        str(tool_output_filepath) if tool_output_filepath.exists() else None
+                    ),
+                    batch_targets=batch_targets,
+                    tool_id=tool_id,
+                )
+                metrics.TOOL_RUNS.inc(tool_id=tool_id, status="cache_hit")
+                return
+
+        self.logger.info(
+            f"Job {self.job_id}: Ejecutando [{tool_id}] en [{target_label}]: {final_command}"
+        )
+        running_update = {
+            "status": "running",
+            "command": final_command,
+            "start_time": datetime.datetime.now().isoformat(),
+        }
+        self.job_journal.append(
+            journal.make_log_event(f"Ejecutando: {final_command}", "command"),
+            journal.make_progress_event(progress_key, running_update),
+            *[
+                journal.make_progress_event(
+                    planner.make_task_key(tool_id, batch_target),
+                    dict(running_update, batch=progress_key),
+                )
+                for batch_target in batch_targets or []
+            ],
+        )
+
+        next_output_index = time.monotonic() + OUTPUT_INDEX_INTERVAL
+
+        def report_output_progress(output_stats):
+            nonlocal next_output_index
+            # Contadores en vivo; si la herramienta escribe su propio archivo, también su tamaño
+            if tool_output_filepath != console_log_filepath and tool_output_filepath.exists():
+                output_stats["output_file_bytes"] = tool_output_filepath.stat().st_size
+            self.job_journal.progress(progress_key, **output_stats)
+            # La salida se puede buscar mientras la herramienta sigue escribiéndola
+            if time.monotonic() >= next_output_index:
+                next_output_index = time.monotonic() + OUTPUT_INDEX_INTERVAL
+                self.index_task_outputs(tool_id, cache_prefixes, target_label, running=True)
+
+        tool_display_name = tool_definition.get("name", tool_id)
+        rate_control = tool_definition.get("rate_control")
+        rate_param = rate_control.get("rate_param") if rate_control else None
+        try:
+            requested_rate = int(float(placeholder_values[rate_param])) if rate_param else None
+        except (KeyError, ValueError):
+            requested_rate = None  # Valor no numérico: se respeta tal cual, sin presupuesto
+        return {
+            "tool_id": tool_id,
+            "tool_definition": tool_definition,
+            "progress_key": progress_key,
+            "target_label": target_label,
+            "batch_targets": batch_targets,
+            "final_command": final_command,
+            "tool_output_filepath": tool_output_filepath,
+            "console_log_filepath": console_log_filepath,
+            "job_path_values": job_path_values,
+            "cache_key": cache_key,
+            "cache_prefixes": cache_prefixes,
+            "compiled_template": compiled_template,
+            "placeholder_values": placeholder_values,
+            "rate_control": rate_control,
+            "rate_param": rate_param,
+            "requested_rate": requested_rate,
+            "hosts": [
+                planner.get_target_host(host_target)
+                for host_target in (
+                    task.get("batch_values", batch_targets)
+                    if batch_targets is not None
+                    else [task.get("target_value", target_value)]
+                )
+            ],
+            "command": command,
+            "run_options": {
+                "use_shell": compiled_template.use_shell,
+                "stdout_path": stdout_path,
+                "timeout": int(
+                    self.advanced_options.get("tool_timeout", 3600)
+                ),  # Default 1 hour timeout per tool
+                "header": f"--- Command ---\n{final_command}\n\n",
+                "stdout_label": f"STDOUT for {tool_display_name} on {target_label}",
+                "stderr_label": f"STDERR for {tool_display_name} on {target_label}",
+                "on_progress": report_output_progress,
+                "on_start": lambda pid: self.track_task_process(progress_key, pid),
+                "cancel_event": self.cancel_detected,
+                "resource_limits": tool_definition.get("resource_limits"),
+            },
+        }
+
+    def log_cancelled_before_slot(self, tool_run):
+        self.job_journal.log(
+            f"{tool_run['tool_id']} en {tool_run['target_label']} no se ejecutará: escaneo cancelado.",
+            "warn",
+        )
+
+    def get_rate_lease_request(self, tool_run):
+        """(hosts, tasa pedida, tasa mínima, unidad) con que la tarea pide permiso; None si no lo necesita."""
+        rate_control = tool_run["rate_control"]
+        if self.rate_scheduler is None or not rate_control:
+            return None
+        return (
+            tool_run["hosts"] if rate_control.get("per_host") else [],
+            tool_run["requested_rate"],
+            int(rate_control.get("min_rate", 1)),
+            rate_control.get("rate_unit", DEFAULT_RATE_UNIT),
+        )
+
+    def apply_rate_lease(self, tool_run, lease):
+        """Guarda el permiso en la tarea; si la tasa concedida no es la pedida, la pone en el comando."""
+        tool_run["rate_lease"] = lease
+        if lease.rate is not None and lease.rate != tool_run["requested_rate"]:
+            compiled_template = tool_run["compiled_template"]
+            command, stdout_path = compiled_template.render(
+                dict(tool_run["placeholder_values"], **{tool_run["rate_param"]: str(lease.rate)})
+            )
+            final_command = compiled_template.display(command, stdout_path)
+            tool_run["command"] = command
+            tool_run["final_command"] = final_command
+            tool_run["run_options"]["header"] = f"--- Command ---\n{final_command}\n\n"
+            self.job_journal.append(
+                journal.make_log_event(
+                    f"{tool_run['tool_id']} en {tool_run['target_label']}: tasa ajustada a {lease.rate} "
+                    f"(pedía {tool_run['requested_rate']}) por el presupuesto global de "
+                    f"{self.rate_scheduler.budgets[lease.unit]} {lease.unit}.",
+                    "info",
+                ),
+                journal.make_progress_event(
+                    tool_run["progress_key"], {"command": final_command, "rate": lease.rate}
+                ),
+            )
+
+    def acquire_rate_lease(self, tool_run, timeout):
+        """Turno en los hosts de la tarea y su parte del presupuesto de tasa; False si no llegó en `timeout`."""
+        lease_request = self.get_rate_lease_request(tool_run)
+        if lease_request is None:
+            return True
+        lease = self.rate_scheduler.acquire(*lease_request, timeout=timeout)
+        if lease is None:
+            return False
+        self.apply_rate_lease(tool_run, lease)
+        return True
+
+    async def acquire_rate_lease_async(self, tool_run, timeout):
+        """Como `self.acquire_rate_lease`, sin bloquear el bucle de eventos."""
+        lease_request = self.get_rate_lease_request(tool_run)
+        if lease_request is None:
+            return True
+        lease = await self.rate_scheduler.acquire_async(*lease_request, timeout=timeout)
+        if lease is None:
+            return False
+        await asyncio.get_running_loop().run_in_executor(None, self.apply_rate_lease, tool_run, lease)
+        return True
+
+    def release_rate_lease(self, tool_run):
+        lease = tool_run.pop("rate_lease", None)
+        if lease is not None:
+            self.rate_scheduler.release(lease)
+
+    def run_tool_task(self, task):
+        tool_run = self.prepare_tool_run(task)
+        if tool_run is None:
+            return
+        # Esperar un slot global y luego el turno en los hosts sin dejar de atender la
+        # cancelación: el slot es de este proceso, el permiso lo comparten todos y no debe
+        # ocupar hosts ni presupuesto mientras la tarea espera su slot
+        while not self.tool_slots.acquire(timeout=executor.CANCEL_POLL_INTERVAL):
+            if self.cancel_detected.is_set():
+                self.log_cancelled_before_slot(tool_run)
+                return
+        while not self.acquire_rate_lease(tool_run, timeout=executor.CANCEL_POLL_INTERVAL):
+            if self.cancel_detected.is_set():
+                self.tool_slots.release()
+                self.log_cancelled_before_slot(tool_run)
+                return
+        run_result, run_error = None, None
+        metrics.TOOL_PROCESSES_RUNNING.inc()
+        try:
+            run_result = executor.run_streaming(
+                tool_run["command"], tool_run["console_log_filepath"], **tool_run["run_options"]
+            )
+        except Exception as e_run:
+            run_error = e_run
+        finally:
+            metrics.TOOL_PROCESSES_RUNNING.dec()
+            self.tool_slots.release()
+            self.release_rate_lease(tool_run)
+        self.finish_tool_run(tool_run, run_result, run_error)
+
+    async def run_tool_task_async(self, task):
+        """Como `self.run_tool_task`, pero el proceso lo supervisa el bucle de eventos compartido;
+        la preparación y el registro (disco y DB) van a los hilos del bucle.
+        """
+        loop = asyncio.get_running_loop()
+        tool_run = await loop.run_in_executor(None, self.prepare_tool_run, task)
+        if tool_run is None:
+            return
+        while not await self.tool_slots.acquire_async(timeout=executor.CANCEL_POLL_INTERVAL):
+            if self.cancel_detected.is_set():
+                await loop.run_in_executor(None, self.log_cancelled_before_slot, tool_run)
+                return
+        while not await self.acquire_rate_lease_async(tool_run, timeout=executor.CANCEL_POLL_INTERVAL):
+            if self.cancel_detected.is_set():
+                self.tool_slots.release()
+                await loop.run_in_executor(None, self.log_cancelled_before_slot, tool_run)
+                return
+        run_result, run_error = None, None
+        metrics.TOOL_PROCESSES_RUNNING.inc()
+        try:
+            run_result = await executor.run_streaming_async(
+                tool_run["command"], tool_run["console_log_filepath"], **tool_run["run_options"]
+            )
+        except Exception as e_run:
+            run_error = e_run
+        finally:
+            metrics.TOOL_PROCESSES_RUNNING.dec()
+            self.tool_slots.release()
+            await loop.run_in_executor(None, self.release_rate_lease, tool_run)
+        await loop.run_in_executor(None, self.finish_tool_run, tool_run, run_result, run_error)
+
+    def finish_tool_run(self, tool_run, run_result, run_error=None):
+        """Clasifica el resultado del proceso y registra la tarea (caché, hallazgos, índice y checkpoint)."""
+        tool_id = tool_run["tool_id"]
+        tool_definition = tool_run["tool_definition"]
+        progress_key = tool_run["progress_key"]
+        target_label = tool_run["target_label"]
+        batch_targets = tool_run["batch_targets"]
+        final_command = tool_run["final_command"]
+        tool_output_filepath = tool_run["tool_output_filepath"]
+        console_log_filepath = tool_run["console_log_filepath"]
+        job_path_values = tool_run["job_path_values"]
+        cache_key = tool_run["cache_key"]
+        cache_prefixes = tool_run["cache_prefixes"]
+        self.untrack_task_process(progress_key)
+
+        tool_run_status = "error"  # Default to error
+        tool_error_message = ""
+        task_logs = []
+        output_stats = {}
+        try:
+            if run_error is not None:
+                raise run_error
+            metrics.TOOL_DURATION_SECONDS.observe(run_result["wall_seconds"], tool_id=tool_id)
+            output_stats = {
+                counter: run_result[counter]
+                for counter in (
+                    "stdout_bytes",
+                    "stdout_lines",
+                    "stderr_bytes",
+                    "stderr_lines",
+                    "peak_rss_mb",
+                    "cpu_seconds",
+                    "wall_seconds",
+                )
+            }
+
+            if run_result["cancelled"]:
+                run_outcome = tool_run_status = "cancelled"
+                tool_error_message = "Cancelado por el usuario"
+                task_logs.append(
+                    (f"{tool_id} en {target_label} detenido por cancelación del escaneo.", "warn")
+                )
+                with open(console_log_filepath, "a", encoding="utf-8") as f_out:
+                    f_out.write("\n\n--- CANCELLED ---")
+            elif run_result["timed_out"]:
+                tool_run_status, run_outcome = "error", "timeout"
+                tool_error_message = "Timeout Expirado"
+                task_logs.append((f"Timeout para {tool_id} en {target_label}.", "error"))
+                with open(console_log_filepath, "a", encoding="utf-8") as f_out:
+                    f_out.write("\n\n--- ERROR: TIMEOUT EXPIRED ---")
+            elif run_result["memory_exceeded"]:
+                tool_run_status, run_outcome = "error", "memory_limit"
+                tool_error_message = (
+                    f"Límite de memoria superado ({tool_definition['resource_limits']['memory_mb']} MB)"
+                )
+                task_logs.append(
+                    (f"{tool_id} en {target_label} detenido: {tool_error_message}.", "error")
+                )
+                with open(console_log_filepath, "a", encoding="utf-8") as f_out:
+                    f_out.write("\n\n--- ERROR: MEMORY LIMIT EXCEEDED ---")
+            elif run_result["returncode"] == -signal.SIGXCPU:
+                tool_run_status, run_outcome = "error", "cpu_limit"
+                tool_error_message = (
+                    f"Límite de CPU superado ({tool_definition['resource_limits']['cpu_seconds']} s)"
+                )
+                task_logs.append(
+                    (f"{tool_id} en {target_label} detenido: {tool_error_message}.", "error")
+                )
+            elif run_result["returncode"] == 0:
+                run_outcome = tool_run_status = "completed"
+                task_logs.append((f"{tool_id} en {target_label} completado.", "success"))
+            else:
+                run_outcome = tool_run_status = "error"
+                tool_error_message = f"Exit code {run_result['returncode']}. Stderr: {run_result['stderr_tail'][-200:]}"
+                task_logs.append(
+                    (f"Error en {tool_id} en {target_label}: {tool_error_message}", "error")
+                )
+
+        except Exception as e_tool:
+            tool_run_status, run_outcome = "error", "exception"
+            tool_error_message = str(e_tool)
+            self.logger.error(
+                f"Job {self.job_id}: Excepción ejecutando {tool_id} en {target_label}: {e_tool}"
+            )
+            task_logs.append((f"Excepción en {tool_id} en {target_label}: {e_tool}", "error"))
+            with open(console_log_filepath, "a", encoding="utf-8") as f_out:
+                f_out.write(f"\n\n--- EXCEPTION: {e_tool} ---")
+
+        metrics.TOOL_RUNS.inc(tool_id=tool_id, status=run_outcome)
+
+        if cache_key and tool_run_status == "completed":
+            try:
+                self.result_cache.store(
+                    cache_key,
+                    self.tool_outputs_dir,
+                    cache_prefixes,
+                    meta={"tool_id": tool_id, "job_id": self.job_id, "command": final_command},
+                )
+            except OSError as e_cache:
+                self.logger.warning(
+                    f"Job {self.job_id}: no se pudo guardar en caché {tool_id} en {target_label}: {e_cache}"
+                )
+
+        record_counts = None
+        if tool_run_status == "completed":
+            record_counts, findings_logs = self.ingest_task_findings(
+                tool_id, tool_definition, job_path_values, target_label
+            )
+            task_logs.extend(findings_logs)
+        self.index_task_outputs(tool_id, cache_prefixes, target_label)
+
+        self.record_task_result(
+            progress_key,
+            dict(
+                output_stats,
+                records=record_counts,
+                status=tool_run_status,
+                output_file=str(
+                    tool_output_filepath.name
+                ),  # Store relative path or just name
+                end_time=datetime.datetime.now().isoformat(),
+                error_message=(tool_error_message if tool_error_message else None),
+            ),
+            task_logs,
+            output_path=(
+                str(tool_output_filepath) if tool_output_filepath.exists() else None
+            ),
+            batch_targets=batch_targets,
+            tool_id=tool_id,
+        )
+
+    def dispatch_tasks_threads(self, pending_tasks, finished_task_keys, max_workers):
+        """Despacha las tareas listas en un pool de hilos, una por hilo, hasta que no quede ninguna."""
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"{self.job_id}-worker"
+        ) as task_pool:
+            running_futures = {}
+            while pending_tasks or running_futures:
+                for task in planner.get_ready_tasks(pending_tasks, finished_task_keys):
+                    del pending_tasks[task["key"]]
+                    running_futures[task_pool.submit(self.run_tool_task, task)] = task["key"]
+                if not running_futures:
+                    break  # Sin tareas listas ni en curso: dependencias imposibles
+                done_futures, _ = concurrent.futures.wait(
+                    running_futures,
+                    timeout=CANCEL_CHECK_INTERVAL,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                # Cancelaciones que solo llegan por la DB (p. ej. desde otro proceso)
+                if not self.cancel_detected.is_set() and self.is_cancel_requested():
+                    self.logger.info(f"Job {self.job_id}: cancelación detectada, deteniendo herramientas en curso.")
+                for future in done_futures:
+                    finished_task_keys.add(running_futures.pop(future))
+                    future.result()  # Propagate unexpected errors to the handler below
+
+    async def dispatch_tasks_async(self, pending_tasks, finished_task_keys, max_workers):
+        """Despacho por dependencias del motor asyncio, equivalente al del pool de hilos."""
+        loop = asyncio.get_running_loop()
+        running_tasks = {}
+        try:
+            while pending_tasks or running_tasks:
+                for task in planner.get_ready_tasks(pending_tasks, finished_task_keys):
+                    if len(running_tasks) >= max_workers:
+                        break
+                    del pending_tasks[task["key"]]
+                    running_tasks[
+                        asyncio.ensure_future(self.run_tool_task_async(task))
+                    ] = task["key"]
+                if not running_tasks:
+                    break  # Sin tareas listas ni en curso: dependencias imposibles
+                done_tasks, _ = await asyncio.wait(
+                    running_tasks,
+                    timeout=CANCEL_CHECK_INTERVAL,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not self.cancel_detected.is_set() and await loop.run_in_executor(
+                    None, self.is_cancel_requested
+                ):
+                    self.logger.info(f"Job {self.job_id}: cancelación detectada, deteniendo herramientas en curso.")
+                for done_task in done_tasks:
+                    finished_task_keys.add(running_tasks.pop(done_task))
+                    done_task.result()  # Propagate unexpected errors to the handler below
+        finally:
+            # Como al cerrar el pool de hilos: las tareas en curso terminan antes de salir
+            if running_tasks:
+                await asyncio.wait(running_tasks)
+
+    def run_queued_task(self, queued_task):
+        """Ejecuta la tarea de un worker con los checkpoints de sus dependencias; devuelve su estado."""
+        task = queued_task["task"]
+        self.task_results.update(queued_task["upstream_results"])
+        self.total_tasks = queued_task["total_tasks"]
+        self.finished_tasks = queued_task["finished_tasks"]
+        try:
+            if self.engine == "asyncio":
+                asyncio.run_coroutine_threadsafe(
+                    self.run_tool_task_async(task), executor.get_process_loop()
+                ).result()
+            else:
+                self.run_tool_task(task)
+        except Exception as e_task:
+            self.logger.error(f"Error en el motor de escaneo para {task['key']} del job {self.job_id}: {e_task}")
+            self.job_journal.log(f"Error crítico del motor en {task['key']}: {e_task}", "error")
+            return "ERROR"
+        if self.cancel_detected.is_set():
+            return "CANCELLED"
+        return self.task_results.get(task["key"], {}).get("status")
+
+    def run(self, targets, selected_tools_config_list):
+        """Construye el DAG del job, ejecuta sus tareas y devuelve el estado final del job."""
+        self.logger.info(f"Motor de escaneo iniciado para job {self.job_id} en {self.job_path}")
+        try:
+            scan_tasks = planner.build_task_graph(
+                targets,
+                selected_tools_config_list,
+                self.tool_definitions,
+                phase_order=list(helpers.get_pentest_phases()),
+                advanced_options=self.advanced_options,
+            )
+            self.total_tasks = len(scan_tasks)
+            added_dependencies = {
+                task["tool_id"]: task["tool_config_entry"]["added_as_dependency_of"]
+                for task in scan_tasks.values()
+                if task["tool_config_entry"].get("added_as_dependency_of")
+            }
+            for upstream_id, dependent_id in added_dependencies.items():
+                self.job_journal.log(
+                    f"{upstream_id} añadido al job como dependencia de {dependent_id}.",
+                    "info",
+                )
+
+            # Job reanudado: las tareas con checkpoint no se repiten
+            with self.db_pool.connection() as conn_checkpoints:
+                reused_tasks = checkpoints.load_reusable_tasks(conn_checkpoints, self.job_id, scan_tasks)
+            if reused_tasks:
+                # Spools de stderr de las tareas que el reinicio interrumpió
+                for stale_spool in self.tool_outputs_dir.glob("*.stderr.tmp"):
+                    stale_spool.unlink(missing_ok=True)
+                self.task_results.update(reused_tasks)
+                self.finished_tasks = len(reused_tasks)
+                self.job_journal.log(
+                    f"Job reanudado: {len(reused_tasks)} de {self.total_tasks} tareas ya completadas se reutilizan.",
+                    "info",
+                )
+
+            max_workers = max(1, min(int(self.max_parallel_tasks), self.total_tasks or 1))
+            self.logger.info(
+                f"Job {self.job_id}: {self.total_tasks} tareas con hasta {max_workers} en paralelo."
+            )
+            # Despacho por dependencias: una tarea empieza cuando sus dependencias terminan
+            pending_tasks = {
+                task_key: task
+                for task_key, task in scan_tasks.items()
+                if task_key not in reused_tasks
+            }
+            finished_task_keys = set(reused_tasks)
+            if self.engine == "asyncio":
+                asyncio.run_coroutine_threadsafe(
+                    self.dispatch_tasks_async(pending_tasks, finished_task_keys, max_workers),
+                    executor.get_process_loop(),
+                ).result()
+            else:
+                self.dispatch_tasks_threads(pending_tasks, finished_task_keys, max_workers)
+
+            if self.cancel_detected.is_set():
+                return "CANCELLED"
+
+            final_job_status = "COMPLETED"
+            if any(
+                task_result["status"] == "error" for task_result in self.task_results.values()
+            ):
+                final_job_status = "COMPLETED_WITH_ERRORS"
+
+            # Check final cancellation status from DB one last time
+            with self.db_pool.connection() as conn_final_cancel:
+                job_final_status_db = conn_final_cancel.execute(
+                    "SELECT status FROM job WHERE id = ?", (self.job_id,)
+                ).fetchone()
+            if job_final_status_db and job_final_status_db["status"] == "CANCELLED":
+                final_job_status = (
+                    "CANCELLED"  # Override if it was cancelled during the last tool run
+                )
+
+        except Exception as e_main:
+            self.logger.error(
+                f"Error mayor en el motor de escaneo para job {self.job_id}: {e_main}"
+            )
+            self.job_journal.append(
+                journal.make_log_event(f"Error crítico del motor: {e_main}", "error"),
+                journal.make_summary_event({"error_message": str(e_main)}),
+            )
+            final_job_status = "ERROR"
+        finally:
+            self.job_journal.compact()
+
+        return final_job_status
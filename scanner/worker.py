@@ -0,0 +1,165 @@
+"""Worker independiente que ejecuta tareas de la cola persistente (ver scanner.task_queue).
+
+Cada worker tiene `concurrency` hilos. Un hilo reclama la siguiente tarea lista
+y la ejecuta mientras un latido renueva su lease y detiene la herramienta si el job
+pasa a REQUEST_CANCEL. Si no hay tareas, planifica el siguiente job PENDING. Pueden
+correr varios workers a la vez, en la misma máquina o en varias, siempre que compartan la base de datos y el directorio de resultados
+(DATABASE_PATH y RESULTS_DIR). scripts/workers/local_workers.py lanza varios en local.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from scanner import task_queue
+from utils import database
+
+CANCEL_POLL_INTERVAL = 1.0  # Segundos entre comprobaciones de cancelación de la tarea en curso
+
+
+def make_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TaskWorker:
+    def __init__(
+        self,
+        db_path,
+        run_task,
+        plan_job,
+        finalize_job,
+        logger,
+        worker_id=None,
+        concurrency=2,
+        max_running_jobs=2,
+        poll_interval=2.0,
+        lease_seconds=task_queue.LEASE_SECONDS,
+        cancel_poll_interval=CANCEL_POLL_INTERVAL,
+    ):
+        self.db_path = db_path
+        self.run_task = run_task  # callable(tarea reclamada, cancel_event)
+        self.plan_job = plan_job  # callable(conn, job_row): encola las tareas, sin commit
+        self.finalize_job = finalize_job  # callable(job_id): cierra el job si ya terminó
+        self.logger = logger
+        self.worker_id = worker_id or make_worker_id()
+        self.concurrency = max(1, int(concurrency))
+        self.max_running_jobs = max_running_jobs
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.cancel_poll_interval = cancel_poll_interval
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Deja de reclamar tareas; las que están en curso terminan normalmente."""
+        self._stop.set()
+
+    def run(self):
+        """Bloquea hasta `stop()`, repartiendo el trabajo entre los hilos del worker."""
+        self.logger.info(
+            f"Worker {self.worker_id} iniciado con {self.concurrency} hilos."
+        )
+        threads = [
+            threading.Thread(
+                target=self._work_loop, name=f"worker-{index}", daemon=True
+            )
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        while not self._stop.wait(self.poll_interval):
+            self._finalize_cancelled_jobs()
+        for thread in threads:
+            thread.join()
+        self.logger.info(f"Worker {self.worker_id} detenido.")
+
+    def _work_loop(self):
+        pool = database.get_pool(self.db_path)
+        while not self._stop.is_set():
+            try:
+                with pool.connection() as conn:
+                    claimed = task_queue.claim_task(conn, self.worker_id, self.lease_seconds)
+                if claimed is not None:
+                    self._execute(claimed)
+                elif not self._plan_next_job():
+                    self._stop.wait(self.poll_interval)
+            except sqlite3.Error as e:
+                self.logger.error(f"Worker {self.worker_id}: error de base de datos: {e}")
+                self._stop.wait(self.poll_interval)
+
+    def _plan_next_job(self):
+        with database.get_pool(self.db_path).connection() as conn:
+            job_row = task_queue.claim_next_job(conn, self.max_running_jobs)
+            if job_row is None:
+                return False
+            try:
+                self.plan_job(conn, job_row)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        self.logger.info(f"Worker {self.worker_id}: job {job_row['id']} planificado.")
+        self.finalize_job(job_row["id"])  # Un job sin tareas termina en el acto
+        return True
+
+    def _execute(self, claimed):
+        job_id, task_key = claimed["job_id"], claimed["task_key"]
+        cancel_event = threading.Event()
+        lease_lost = threading.Event()
+        task_done = threading.Event()
+
+        def heartbeat():
+            pool = database.get_pool(self.db_path)
+            next_renewal = time.monotonic() + self.lease_seconds / 3
+            while not task_done.wait(min(self.cancel_poll_interval, self.lease_seconds / 3)):
+                try:
+                    with pool.connection() as conn:
+                        # La cancelación solo llega por la DB: la API corre en otro proceso
+                        if not cancel_event.is_set() and task_queue.is_job_cancelling(conn, job_id):
+                            self.logger.info(
+                                f"Worker {self.worker_id}: job {job_id} cancelado, deteniendo {task_key}."
+                            )
+                            cancel_event.set()
+                        if time.monotonic() < next_renewal:
+                            continue
+                        next_renewal = time.monotonic() + self.lease_seconds / 3
+                        renewed = task_queue.renew_lease(
+                            conn, self.worker_id, job_id, task_key, self.lease_seconds
+                        )
+                except sqlite3.Error as e:
+                    self.logger.warning(f"Worker {self.worker_id}: no se pudo renovar el lease de {task_key}: {e}")
+                    continue
+                if not renewed:
+                    # Otro worker reclamó la tarea: esta ejecución ya no cuenta
+                    self.logger.warning(f"Worker {self.worker_id}: lease de {task_key} perdido.")
+                    lease_lost.set()
+                    cancel_event.set()
+                    return
+
+        heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+        heartbeat_thread.start()
+        try:
+            self.run_task(claimed, cancel_event)
+        except Exception as e:
+            self.logger.error(f"Worker {self.worker_id}: error ejecutando {task_key} de {job_id}: {e}")
+            with database.get_pool(self.db_path).connection() as conn:
+                task_queue.release_task(conn, self.worker_id, job_id, task_key)
+            return
+        finally:
+            task_done.set()
+            heartbeat_thread.join()
+
+        if lease_lost.is_set():
+            return
+        with database.get_pool(self.db_path).connection() as conn:
+            task_queue.complete_task(conn, self.worker_id, job_id, task_key)
+        self.finalize_job(job_id)
+
+    def _finalize_cancelled_jobs(self):
+        try:
+            with database.get_pool(self.db_path).connection() as conn:
+                job_ids = task_queue.list_jobs_requesting_cancel(conn)
+            for job_id in job_ids:
+                self.finalize_job(job_id)
+        except sqlite3.Error as e:
+            self.logger.error(f"Worker {self.worker_id}: error revisando cancelaciones: {e}")
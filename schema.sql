@@ -21,4 +21,18 @@ CREATE TABLE job (
   zip_path TEXT,                      -- Ruta (relativa a la app o URL) al archivo ZIP de resultados
   error_message TEXT,                 -- Mensaje de error si el job falla
   FOREIGN KEY (user_id) REFERENCES user (id)
-);
\ No newline at end of file
+);
+
+-- Índices y tablas añadidos después: ver schema_upgrades.sql (se aplica también al inicializar)
+DROP TABLE IF EXISTS rate_lease_host;
+DROP TABLE IF EXISTS rate_lease;
+DROP TABLE IF EXISTS task_process;
+DROP TABLE IF EXISTS task_queue;
+DROP TABLE IF EXISTS job_task;
+DROP TABLE IF EXISTS output_fts;
+DROP TABLE IF EXISTS output_files;
+DROP TABLE IF EXISTS findings;
+DROP TABLE IF EXISTS urls;
+DROP TABLE IF EXISTS services;
+DROP TABLE IF EXISTS ports;
+DROP TABLE IF EXISTS hosts;
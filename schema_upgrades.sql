@@ -0,0 +1,158 @@
+-- Cambios de esquema posteriores a schema.sql. Se ejecutan al inicializar la base y al
+-- abrir el pool de una base ya existente, así que deben poder repetirse: CREATE ... IF NOT
+-- EXISTS y DROP ... IF EXISTS lo son por sí mismos; los ALTER TABLE ... ADD COLUMN los salta
+-- utils/database.py si la columna ya existe. Cualquier otro error detiene el arranque.
+
+-- Listado paginado de trabajos por usuario (/api/jobs): índice que cubre todas las columnas
+-- que lee el listado (orden por fecha e id, estado, número de objetivos y los primeros),
+-- sin acceder a la tabla ni copiar en el índice el JSON completo de `targets`
+ALTER TABLE job ADD COLUMN target_count INTEGER;
+ALTER TABLE job ADD COLUMN targets_preview TEXT;  -- JSON con los primeros objetivos (JOBS_PREVIEW_TARGETS en app.py)
+UPDATE job SET
+  target_count = json_array_length(targets),
+  targets_preview = (SELECT json_group_array(value) FROM (SELECT value FROM json_each(job.targets) LIMIT 5))
+WHERE target_count IS NULL AND json_valid(targets);
+DROP INDEX IF EXISTS idx_job_user_created;
+DROP INDEX IF EXISTS idx_job_user_listing;
+CREATE INDEX IF NOT EXISTS idx_job_user_page ON job (user_id, creation_timestamp DESC, id DESC, status, target_count, targets_preview);
+
+-- Resultados normalizados extraídos de las salidas de las herramientas (ver scanner/findings.py)
+CREATE TABLE IF NOT EXISTS hosts (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  job_id TEXT NOT NULL,
+  host TEXT NOT NULL,                 -- IP si se conoce; si no, el nombre
+  hostname TEXT,
+  tool_id TEXT,                       -- Primera herramienta que lo reportó
+  UNIQUE (job_id, host)
+);
+CREATE INDEX IF NOT EXISTS idx_hosts_host ON hosts (host);
+CREATE INDEX IF NOT EXISTS idx_hosts_hostname ON hosts (hostname);
+
+CREATE TABLE IF NOT EXISTS ports (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  job_id TEXT NOT NULL,
+  host_id INTEGER NOT NULL,
+  port INTEGER NOT NULL,
+  protocol TEXT NOT NULL DEFAULT 'tcp',
+  state TEXT NOT NULL DEFAULT 'open',
+  tool_id TEXT,
+  UNIQUE (host_id, port, protocol),
+  FOREIGN KEY (host_id) REFERENCES hosts (id)
+);
+CREATE INDEX IF NOT EXISTS idx_ports_port_state ON ports (port, state, host_id);
+CREATE INDEX IF NOT EXISTS idx_ports_job ON ports (job_id);
+
+CREATE TABLE IF NOT EXISTS services (
+  port_id INTEGER PRIMARY KEY,
+  name TEXT,
+  product TEXT,
+  version TEXT,
+  extra_info TEXT,
+  tool_id TEXT,
+  FOREIGN KEY (port_id) REFERENCES ports (id)
+);
+CREATE INDEX IF NOT EXISTS idx_services_name ON services (name);
+
+CREATE TABLE IF NOT EXISTS urls (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  job_id TEXT NOT NULL,
+  url TEXT NOT NULL,
+  host TEXT,
+  status_code INTEGER,
+  title TEXT,
+  technologies TEXT,                  -- Lista separada por comas
+  tool_id TEXT,
+  UNIQUE (job_id, url)
+);
+CREATE INDEX IF NOT EXISTS idx_urls_host ON urls (host);
+
+CREATE TABLE IF NOT EXISTS findings (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  job_id TEXT NOT NULL,
+  tool_id TEXT NOT NULL,
+  check_id TEXT NOT NULL,             -- Plantilla de nuclei, id de testssl, etc.
+  severity TEXT NOT NULL DEFAULT 'info',
+  host TEXT NOT NULL DEFAULT '',
+  port INTEGER,
+  matched_at TEXT NOT NULL DEFAULT '',
+  description TEXT,
+  cve TEXT,
+  UNIQUE (job_id, tool_id, check_id, host, matched_at)
+);
+CREATE INDEX IF NOT EXISTS idx_findings_job_severity ON findings (job_id, severity);
+CREATE INDEX IF NOT EXISTS idx_findings_severity ON findings (severity, host);
+
+-- Índice de texto completo de las salidas de las herramientas (ver utils/output_index.py)
+CREATE TABLE IF NOT EXISTS output_files (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  job_id TEXT NOT NULL,
+  tool_id TEXT,
+  file_name TEXT NOT NULL,
+  indexed_bytes INTEGER NOT NULL DEFAULT 0,   -- Bytes del archivo ya indexados
+  UNIQUE (job_id, file_name)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS output_fts USING fts5(
+  content,
+  file_id UNINDEXED,
+  tokenize = 'unicode61 remove_diacritics 2'
+);
+
+-- Estado de cada tarea herramienta×objetivo terminada, para reanudar jobs tras un reinicio (ver scanner/checkpoints.py)
+CREATE TABLE IF NOT EXISTS job_task (
+  job_id TEXT NOT NULL,
+  task_key TEXT NOT NULL,             -- Clave de la tarea en el DAG (ver scanner.planner)
+  tool_id TEXT NOT NULL,
+  status TEXT NOT NULL,               -- completed, error, skipped
+  output_path TEXT,                   -- Salida que reciben las tareas dependientes
+  updated_at DATETIME NOT NULL,
+  PRIMARY KEY (job_id, task_key)
+) WITHOUT ROWID;
+
+-- Cola persistente de tareas herramienta×objetivo para los workers independientes (ver scanner/task_queue.py)
+CREATE TABLE IF NOT EXISTS task_queue (
+  job_id TEXT NOT NULL,
+  task_key TEXT NOT NULL,             -- Clave de la tarea en el DAG (ver scanner.planner)
+  tool_id TEXT NOT NULL,
+  priority INTEGER NOT NULL DEFAULT 0,  -- Orden de fase: menor se reclama antes
+  depends_on TEXT NOT NULL DEFAULT '[]',  -- JSON con las task_key de las dependencias
+  state TEXT NOT NULL DEFAULT 'queued',   -- queued, leased, done
+  worker_id TEXT,
+  lease_expires_at REAL,              -- Epoch; caducado, otro worker puede reclamarla
+  attempts INTEGER NOT NULL DEFAULT 0,
+  enqueued_at REAL NOT NULL,
+  PRIMARY KEY (job_id, task_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_task_queue_state ON task_queue (state, lease_expires_at);
+-- Tarea ya planificada (JSON): el worker la ejecuta sin reconstruir el DAG del job
+ALTER TABLE task_queue ADD COLUMN task_spec TEXT;
+
+-- Proceso dueño de cada job en ejecución y su último latido: un job solo se recupera
+-- cuando su dueño ya no existe (ver scanner/scheduler.py)
+ALTER TABLE job ADD COLUMN owner_id TEXT;
+ALTER TABLE job ADD COLUMN owner_heartbeat_at REAL;
+
+-- Grupos de procesos de las herramientas en curso, para matar los que sobreviven a una caída (ver scanner/task_processes.py)
+CREATE TABLE IF NOT EXISTS task_process (
+  job_id TEXT NOT NULL,
+  task_key TEXT NOT NULL,
+  host TEXT NOT NULL,
+  pid INTEGER NOT NULL,               -- También el id de su grupo de procesos
+  create_time REAL NOT NULL,          -- Distingue el proceso de otro que reutilice el pid
+  PRIMARY KEY (job_id, task_key)
+) WITHOUT ROWID;
+
+-- Permisos de tasa compartidos por todos los procesos (ver scanner/rate_limits.py)
+CREATE TABLE IF NOT EXISTS rate_lease (
+  lease_id TEXT PRIMARY KEY,
+  owner_id TEXT NOT NULL,             -- Proceso que lo tiene y lo renueva
+  rate INTEGER,                       -- Parte del presupuesto global; NULL si no cuenta
+  expires_at REAL NOT NULL            -- Epoch; caducado, el permiso ya no cuenta
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rate_lease_host (
+  lease_id TEXT NOT NULL,
+  host TEXT NOT NULL,
+  PRIMARY KEY (lease_id, host)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rate_lease_host ON rate_lease_host (host);
+-- Unidad del presupuesto ("pps" o "rps"): cada una se reparte por separado
+ALTER TABLE rate_lease ADD COLUMN unit TEXT;
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""Benchmark del motor de escaneo con herramientas simuladas.
+
+Crea en un directorio temporal una herramienta falsa (duración, volumen de salida
+y código de salida configurables), un tools_config.json con M herramientas que la
+usan, una base de datos y un directorio de resultados propios. Después lanza jobs
+de N objetivos × M herramientas a través de la API real (test client de Flask,
+planificador y motor incluidos) y escribe los resultados en JSON:
+
+    python scripts/benchmark/engine_benchmark.py --targets 50 --tools 4 --output bench.json
+
+Métricas por ejecución: makespan del job, sobrecoste del motor por tarea (duración
+de la tarea en tool_progress menos la del proceso), RSS e hilos máximos del proceso Flask,
+coste de las escrituras del diario/summary.json y de la DB, y latencia del
+endpoint de estado durante el job.
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FAKE_TOOL_NAME = "panthera-bench-tool"
+TERMINAL_STATUSES = ("COMPLETED", "COMPLETED_WITH_ERRORS", "CANCELLED", "ERROR")
+RSS_SAMPLE_INTERVAL = 0.05
+
+FAKE_TOOL_SOURCE = '''#!{python}
+"""Herramienta simulada: reparte `lines` líneas de `line_bytes` bytes a lo largo de `runtime` segundos."""
+import sys
+import time
+
+runtime, lines, line_bytes, exit_code, target = (
+    float(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]), sys.argv[5]
+)
+line = (target + " " + "x" * line_bytes)[: max(1, line_bytes - 1)] + "\\n"
+steps = 10 if runtime > 0 else 1
+lines_per_step, extra_lines = divmod(lines, steps)
+for step in range(steps):
+    sys.stdout.write(line * (lines_per_step + (1 if step < extra_lines else 0)))
+    sys.stdout.flush()
+    if runtime > 0:
+        time.sleep(runtime / steps)
+if exit_code:
+    sys.stderr.write("fallo simulado\\n")
+sys.exit(exit_code)
+'''
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--targets", type=int, default=20, help="Objetivos por job (N).")
+    parser.add_argument("--tools", type=int, default=4, help="Herramientas por job (M).")
+    parser.add_argument("--runtime", type=float, default=0.2, help="Segundos que dura cada ejecución.")
+    parser.add_argument("--output-lines", type=int, default=500, help="Líneas de salida por ejecución.")
+    parser.add_argument("--line-bytes", type=int, default=120, help="Bytes por línea de salida.")
+    parser.add_argument(
+        "--failing-tools", type=int, default=0, help="Cuántas de las M herramientas salen con código 1."
+    )
+    parser.add_argument(
+        "--batch", action="store_true", help="Herramientas de lista (una ejecución por lote de objetivos)."
+    )
+    parser.add_argument("--parallel", type=int, default=3, help="MAX_PARALLEL_THREADS_PER_JOB.")
+    parser.add_argument("--max-tools", type=int, default=3, help="MAX_CONCURRENT_TOOLS.")
+    parser.add_argument(
+        "--engine", choices=("threads", "asyncio"), default="threads", help="SCAN_ENGINE."
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Jobs consecutivos a medir.")
+    parser.add_argument(
+        "--poll-interval", type=float, default=0.2, help="Intervalo de consulta de /api/scan/status."
+    )
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto, stdout).")
+    parser.add_argument("--keep-workdir", action="store_true", help="No borrar el directorio temporal.")
+    return parser.parse_args(argv)
+
+
+def percentile(values, fraction):
+    """Percentil por rango más cercano (None si no hay valores)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def describe(values, scale=1.0, digits=3):
+    """count/mean/p50/p95/max de una serie, multiplicada por `scale`."""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(statistics.fmean(values) * scale, digits),
+        "p50": round(percentile(values, 0.50) * scale, digits),
+        "p95": round(percentile(values, 0.95) * scale, digits),
+        "max": round(max(values) * scale, digits),
+    }
+
+
+def install_fake_tool(bin_dir):
+    tool_path = os.path.join(bin_dir, FAKE_TOOL_NAME)
+    with open(tool_path, "w", encoding="utf-8") as f:
+        f.write(FAKE_TOOL_SOURCE.format(python=sys.executable))
+    os.chmod(tool_path, 0o755)
+    return tool_path
+
+
+def write_tools_config(path, args):
+    tools_definition = {}
+    for tool_index in range(args.tools):
+        exit_code = 1 if tool_index < args.failing_tools else 0
+        target_argument = "{target}"
+        if args.batch:
+            # La herramienta recibe la ruta del archivo de objetivos en lugar de un objetivo
+            target_argument = "{targets_file}"
+        tools_definition[f"bench_{tool_index}"] = {
+            "name": f"Bench {tool_index}",
+            "command_template": (
+                f"{FAKE_TOOL_NAME} {args.runtime} {args.output_lines} {args.line_bytes} "
+                f"{exit_code} {target_argument}"
+            ),
+            "phase_key": "bench",
+            "category": "Benchmark",
+            "target_type": "domain_list" if args.batch else "domain",
+        }
+    config = {
+        "pentest_phases": {"bench": "Benchmark"},
+        "tools_definition": tools_definition,
+        "scan_profiles": {},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    return list(tools_definition)
+
+
+class RssSampler:
+    """Muestrea en segundo plano el RSS y el número de hilos del proceso actual y guarda los máximos."""
+
+    def __init__(self):
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = None
+        self.peak_bytes = 0
+        self.peak_threads = 0
+
+    def __enter__(self):
+        self.peak_bytes = self._process.memory_info().rss
+        self.peak_threads = self._process.num_threads()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak_bytes = max(self.peak_bytes, self._process.memory_info().rss)
+            self.peak_threads = max(self.peak_threads, self._process.num_threads())
+
+
+def histogram_totals(histogram, label_values):
+    return {label: histogram.totals(operation=label) for label in label_values}
+
+
+def totals_delta(before, after):
+    delta = {}
+    for label, (count_after, sum_after) in after.items():
+        count_before, sum_before = before[label]
+        count = count_after - count_before
+        total = sum_after - sum_before
+        delta[label] = {
+            "count": count,
+            "total_ms": round(total * 1000, 3),
+            "mean_ms": round(total * 1000 / count, 4) if count else None,
+        }
+    return delta
+
+
+def task_overheads(tool_progress):
+    """Duración de cada tarea en el motor menos la del proceso de la herramienta (segundos)."""
+    overheads = []
+    for entry in tool_progress.values():
+        if entry.get("batch") or entry.get("wall_seconds") is None:
+            continue  # Entradas por objetivo de un lote: la tarea es la del lote
+        if not entry.get("start_time") or not entry.get("end_time"):
+            continue
+        start = datetime.datetime.fromisoformat(entry["start_time"])
+        end = datetime.datetime.fromisoformat(entry["end_time"])
+        overheads.append((end - start).total_seconds() - entry["wall_seconds"])
+    return overheads
+
+
+def run_job(client, app_module, targets, tool_ids, args):
+    metrics = app_module.metrics
+    journal_before = histogram_totals(metrics.JOURNAL_WRITE_SECONDS, ("append", "compact"))
+    db_before = histogram_totals(
+        metrics.DB_WRITE_SECONDS, ("job_create", "progress_batch", "job_final")
+    )
+    status_latencies = []
+    status_bytes = []
+
+    with RssSampler() as rss_sampler:
+        started_at = time.perf_counter()
+        response = client.post(
+            "/api/scan/start",
+            json={"targets": targets, "tools": [{"id": tool_id} for tool_id in tool_ids]},
+        )
+        if response.status_code != 202:
+            raise RuntimeError(f"No se pudo crear el job: {response.status_code} {response.json}")
+        job_id = response.json["job_id"]
+        while True:
+            request_started_at = time.perf_counter()
+            status_response = client.get(f"/api/scan/status/{job_id}")
+            status_latencies.append(time.perf_counter() - request_started_at)
+            status_bytes.append(len(status_response.data))
+            status = status_response.json
+            if status["status"] in TERMINAL_STATUSES:
+                break
+            time.sleep(args.poll_interval)
+        makespan = time.perf_counter() - started_at
+
+    # El estado final se escribe después del último progreso: esperar a que se vacíe el lote de la DB
+    app_module.database.get_progress_batcher(app_module.app.config["DATABASE"]).flush()
+    journal_after = histogram_totals(metrics.JOURNAL_WRITE_SECONDS, ("append", "compact"))
+    db_after = histogram_totals(
+        metrics.DB_WRITE_SECONDS, ("job_create", "progress_batch", "job_final")
+    )
+
+    tool_progress = status.get("tool_progress", {})
+    task_entries = [
+        entry for entry in tool_progress.values()
+        if not entry.get("batch") and entry.get("wall_seconds") is not None
+    ]
+    tool_wall_total = sum(entry["wall_seconds"] for entry in task_entries)
+    concurrency = max(1, min(args.parallel, args.max_tools))
+    return {
+        "job_id": job_id,
+        "status": status["status"],
+        "tasks": len(task_entries),
+        "tasks_by_status": {
+            task_status: sum(1 for entry in task_entries if entry.get("status") == task_status)
+            for task_status in sorted({entry.get("status") for entry in task_entries})
+        },
+        "makespan_seconds": round(makespan, 3),
+        # Cota inferior con la concurrencia configurada; la diferencia es coste del motor y de la cola
+        "ideal_makespan_seconds": round(tool_wall_total / concurrency, 3),
+        "makespan_overhead_seconds": round(makespan - tool_wall_total / concurrency, 3),
+        "task_overhead_ms": describe(task_overheads(tool_progress), scale=1000),
+        "tool_wall_seconds": describe([entry["wall_seconds"] for entry in task_entries]),
+        "peak_rss_mb": round(rss_sampler.peak_bytes / (1024 * 1024), 1),
+        "peak_threads": rss_sampler.peak_threads,
+        "journal_writes": totals_delta(journal_before, journal_after),
+        "db_writes": totals_delta(db_before, db_after),
+        "status_latency_ms": describe(status_latencies, scale=1000),
+        "status_response_bytes": describe(status_bytes, digits=0),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix="panthera-bench-")
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(bin_dir)
+    install_fake_tool(bin_dir)
+    tools_config_path = os.path.join(work_dir, "tools_config.json")
+    tool_ids = write_tools_config(tools_config_path, args)
+
+    # La configuración de app.py se lee al importarlo
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+    os.environ["MAX_PARALLEL_THREADS_PER_JOB"] = str(args.parallel)
+    os.environ["MAX_CONCURRENT_TOOLS"] = str(args.max_tools)
+    os.environ["MAX_CONCURRENT_JOBS"] = "1"
+    os.environ["SCAN_ENGINE"] = args.engine
+    os.environ["ADMISSION_MAX_CPU_PERCENT"] = "100"
+    os.environ["ADMISSION_MIN_AVAILABLE_MEMORY_MB"] = "0"
+    os.environ["TOOL_CACHE_DIR"] = os.path.join(work_dir, "tool_cache")
+    os.environ["DATABASE_PATH"] = os.path.join(work_dir, "panthera.db")
+    os.environ["RESULTS_DIR"] = os.path.join(work_dir, "scan_results")
+    os.environ["TOOLS_CONFIG_PATH"] = tools_config_path
+    sys.path.insert(0, REPO_ROOT)
+    import app as app_module
+
+    app_module.app.logger.setLevel("WARNING")
+    with app_module.app.app_context():
+        app_module.init_db_command()
+
+    client = app_module.app.test_client()
+    client.post("/login", data={"username": "panthera", "password": "panthera"})
+    targets = [f"bench-{target_index}.example.com" for target_index in range(args.targets)]
+
+    runs = []
+    try:
+        for _ in range(args.repeat):
+            runs.append(run_job(client, app_module, targets, tool_ids, args))
+    finally:
+        app_module.scan_scheduler.stop()
+        if not args.keep_workdir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "benchmark": "engine",
+        "timestamp": datetime.datetime.now().isoformat(),
+        "params": vars(args),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "runs": runs,
+        "summary": {
+            "makespan_seconds_median": round(
+                statistics.median(run["makespan_seconds"] for run in runs), 3
+            ),
+            "task_overhead_ms_p50_median": round(
+                statistics.median(run["task_overhead_ms"].get("p50", 0) for run in runs), 3
+            ),
+            "status_latency_ms_p95_median": round(
+                statistics.median(run["status_latency_ms"].get("p95", 0) for run in runs), 3
+            ),
+            "peak_rss_mb_max": max(run["peak_rss_mb"] for run in runs),
+            "peak_threads_max": max(run["peak_threads"] for run in runs),
+            # ru_maxrss está en KiB en Linux
+            "process_max_rss_mb": round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+            ),
+        },
+    }
+    if args.keep_workdir:
+        results["work_dir"] = work_dir
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return results
+
+
+if __name__ == "__main__":
+    main()
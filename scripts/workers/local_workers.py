@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Prueba local del modo "workers" con varios procesos `flask worker`.
+
+Crea en un directorio temporal la herramienta simulada del benchmark (ver
+scripts/benchmark/engine_benchmark.py), un tools_config.json, una base de datos y un
+directorio de resultados propios. Encola un job de N objetivos × M herramientas a
+través de la API real, lanza W procesos `flask worker` contra esa base de datos y
+espera a que el job termine. Escribe en JSON el estado final y cuántas tareas
+ejecutó cada worker:
+
+    python scripts/workers/local_workers.py --workers 3 --targets 20 --tools 2
+
+Con `--kill-after` se mata con SIGKILL un worker a mitad del job: sus tareas vuelven
+a la cola cuando caduca su lease (`--lease-seconds`) y las terminan los demás.
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(REPO_ROOT, "scripts", "benchmark"))
+
+from engine_benchmark import TERMINAL_STATUSES, install_fake_tool, write_tools_config  # noqa: E402
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=3, help="Procesos `flask worker` (W).")
+    parser.add_argument("--concurrency", type=int, default=2, help="Hilos por worker.")
+    parser.add_argument("--max-tools", type=int, default=2, help="MAX_CONCURRENT_TOOLS de cada worker.")
+    parser.add_argument("--targets", type=int, default=12, help="Objetivos del job (N).")
+    parser.add_argument("--tools", type=int, default=2, help="Herramientas del job (M).")
+    parser.add_argument("--runtime", type=float, default=1.0, help="Segundos que dura cada ejecución.")
+    parser.add_argument("--output-lines", type=int, default=50, help="Líneas de salida por ejecución.")
+    parser.add_argument("--line-bytes", type=int, default=80, help="Bytes por línea de salida.")
+    parser.add_argument(
+        "--failing-tools", type=int, default=0, help="Cuántas de las M herramientas salen con código 1."
+    )
+    parser.add_argument(
+        "--batch", action="store_true", help="Herramientas de lista (una ejecución por lote de objetivos)."
+    )
+    parser.add_argument(
+        "--engine", choices=("threads", "asyncio"), default="threads", help="SCAN_ENGINE de los workers."
+    )
+    parser.add_argument(
+        "--kill-after", type=float, default=None, help="Segundos tras los que se mata el primer worker."
+    )
+    parser.add_argument("--lease-seconds", type=float, default=5.0, help="Lease de las tareas.")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Espera máxima del job.")
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto, stdout).")
+    parser.add_argument("--keep-workdir", action="store_true", help="No borrar el directorio temporal.")
+    return parser.parse_args(argv)
+
+
+def start_worker(index, args, env, work_dir):
+    log_file = open(os.path.join(work_dir, f"worker-{index}.log"), "w", encoding="utf-8")
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "flask", "--app", "app", "worker",
+            "--concurrency", str(args.concurrency),
+            "--worker-id", f"local-{index}",
+            "--lease-seconds", str(args.lease_seconds),
+        ],
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+    )
+    log_file.close()
+    return process
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix="panthera-workers-")
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(bin_dir)
+    install_fake_tool(bin_dir)
+    tools_config_path = os.path.join(work_dir, "tools_config.json")
+    tool_ids = write_tools_config(tools_config_path, args)
+
+    # El proceso actual y los workers leen la misma configuración del entorno
+    os.environ.update(
+        PATH=bin_dir + os.pathsep + os.environ.get("PATH", ""),
+        DATABASE_PATH=os.path.join(work_dir, "panthera.db"),
+        RESULTS_DIR=os.path.join(work_dir, "scan_results"),
+        TOOLS_CONFIG_PATH=tools_config_path,
+        TOOL_CACHE_DIR=os.path.join(work_dir, "tool_cache"),
+        SCAN_EXECUTION_MODE="workers",
+        SCAN_ENGINE=args.engine,
+        MAX_CONCURRENT_TOOLS=str(args.max_tools),
+    )
+    sys.path.insert(0, REPO_ROOT)
+    import app as app_module
+
+    app_module.app.logger.setLevel("WARNING")
+    with app_module.app.app_context():
+        app_module.init_db_command()
+    client = app_module.app.test_client()
+    client.post("/login", data={"username": "panthera", "password": "panthera"})
+    targets = [f"worker-{target_index}.example.com" for target_index in range(args.targets)]
+    response = client.post(
+        "/api/scan/start",
+        json={"targets": targets, "tools": [{"id": tool_id} for tool_id in tool_ids]},
+    )
+    if response.status_code != 202:
+        raise RuntimeError(f"No se pudo crear el job: {response.status_code} {response.json}")
+    job_id = response.json["job_id"]
+
+    workers = [start_worker(index, args, dict(os.environ), work_dir) for index in range(args.workers)]
+    killed_worker = None
+    started_at = time.perf_counter()
+    status = {}
+    try:
+        while time.perf_counter() - started_at < args.timeout:
+            if (
+                args.kill_after is not None
+                and killed_worker is None
+                and time.perf_counter() - started_at >= args.kill_after
+            ):
+                workers[0].send_signal(signal.SIGKILL)
+                killed_worker = "local-0"
+            status = client.get(f"/api/scan/status/{job_id}").json
+            if status["status"] in TERMINAL_STATUSES:
+                break
+            time.sleep(0.5)
+        makespan = time.perf_counter() - started_at
+    finally:
+        for process in workers:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        for process in workers:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    with app_module.database.get_pool(app_module.app.config["DATABASE"]).connection() as conn:
+        rows = conn.execute(
+            """SELECT worker_id, COUNT(*) AS tasks, SUM(attempts) AS attempts
+               FROM task_queue WHERE job_id = ? GROUP BY worker_id""",
+            (job_id,),
+        ).fetchall()
+    results = {
+        "benchmark": "local_workers",
+        "timestamp": datetime.datetime.now().isoformat(),
+        "params": vars(args),
+        "job_id": job_id,
+        "status": status.get("status"),
+        "makespan_seconds": round(makespan, 3),
+        "killed_worker": killed_worker,
+        # worker_id None: tareas reutilizadas o descartadas sin llegar a ejecutarse
+        "tasks_per_worker": {row["worker_id"]: row["tasks"] for row in rows},
+        "attempts_per_worker": {row["worker_id"]: row["attempts"] for row in rows},
+        "worker_exit_codes": [process.returncode for process in workers],
+    }
+    if args.keep_workdir:
+        results["work_dir"] = work_dir
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -28,6 +28,11 @@ document.addEventListener('DOMContentLoaded', () => {
     let appConfig = { tools: {}, profiles: {}, phases: {} }; // Para almacenar la configuración del backend
     let currentJobId = localStorage.getItem('currentJobId');
     let statusPollInterval;
+    let statusCursor = null; // Offset del diario del job ya mostrado (respuestas delta)
+    let statusCursorJobId = null;
+    let jobEventSource = null; // Stream SSE del job en curso
+    let eventStreamUnavailable = false; // Si el SSE falla, se vuelve al sondeo
+    const TERMINAL_STATUSES = ['COMPLETED', 'COMPLETED_WITH_ERRORS', 'CANCELLED', 'ERROR'];
 
 
     function logToTerminal(message, type = 'info', isHtml = false) {
@@ -132,6 +137,11 @@ document.addEventListener('DOMContentLoaded', () => {
                     const toolItemId = `tool-${tool.id}-${toolIdCounter++}`;
                     const toolItemDiv = document.createElement('div');
                     toolItemDiv.className = 'tool-item';
+                    const inventoryEntry = (appConfig.inventory || {})[tool.id];
+                    const isUnavailable = inventoryEntry && !inventoryEntry.available;
+                    const inventoryTitle = inventoryEntry
+                        ? (inventoryEntry.available ? `${inventoryEntry.path}${inventoryEntry.version ? ' — ' + inventoryEntry.version : ''}` : `No encontrada en el servidor: ${inventoryEntry.missing.join(', ')}`)
+                        : '';
                     
                     let cliParamsHtml = '';
                     if (tool.cli_params_config && tool.cli_params_config.length > 0) {
@@ -152,9 +162,10 @@ document.addEventListener('DOMContentLoaded', () => {
                     }
 
                     toolItemDiv.innerHTML = `
-                        <label for="${toolItemId}">
-                            <input type="checkbox" id="${toolItemId}" name="selected_tools" value="${tool.id}" class="tool-item-checkbox" data-category-parent-id="${categoryId}" data-type="tool" ${tool.default_enabled ? 'checked' : ''}>
+                        <label for="${toolItemId}" title="${inventoryTitle}">
+                            <input type="checkbox" id="${toolItemId}" name="selected_tools" value="${tool.id}" class="tool-item-checkbox" data-category-parent-id="${categoryId}" data-type="tool" ${tool.default_enabled && !isUnavailable ? 'checked' : ''}>
                             ${tool.name} ${tool.dangerous ? '<span class="tool-dangerous-indicator" title="Esta herramienta puede ser intrusiva o disruptiva">⚠️</span>' : ''}
+                            ${isUnavailable ? '<span class="tool-unavailable-indicator">(no instalada)</span>' : ''}
                         </label>
                         <div class="tool-description">${tool.description}</div>
                         ${cliParamsHtml}
@@ -343,6 +354,7 @@ document.addEventListener('DOMContentLoaded', () => {
         const advancedScanOptions = {
             customScanTime: document.getElementById('customScanTime') ? document.getElementById('customScanTime').value : null,
             followRedirects: document.getElementById('followRedirects') ? document.getElementById('followRedirects').value : null,
+            bypass_result_cache: document.getElementById('bypassResultCache') ? document.getElementById('bypassResultCache').checked : false,
             // Añadir más opciones avanzadas globales aquí
         };
 
@@ -374,12 +386,15 @@ document.addEventListener('DOMContentLoaded', () => {
                 currentJobId = data.job_id;
                 jobIdDisplay.textContent = currentJobId;
                 logToTerminal(`Escaneo iniciado con Job ID: ${currentJobId}`, "success");
+                (data.skipped_tools || []).forEach(skipped => logToTerminal(`Herramienta omitida, ${skipped}`, "warn"));
+                (data.skipped_targets || []).forEach(skipped => logToTerminal(`Objetivos incompatibles: ${skipped}`, "info"));
                 localStorage.setItem('currentJobId', currentJobId);
-                clearTimeout(statusPollInterval); // Limpiar sondeo anterior
+                stopLiveUpdates(); // Limpiar sondeo/stream anterior
                 refreshStatus(currentJobId, true); // Iniciar sondeo para el nuevo job
                 loadJobs(); // Actualizar lista de historial
             } else {
                 logToTerminal(`Error al iniciar escaneo (HTTP ${response.status}): ${data.error || 'Error desconocido'}`, "error");
+                (data.details || []).forEach(detail => logToTerminal(detail, "error"));
                 currentJobInfoDiv.style.display = 'none';
             }
         } catch (error) {
@@ -424,8 +439,17 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
 
+        // El cursor solo vale para el job con el que se obtuvo
+        if (initialCall || statusCursorJobId !== effectiveJobId) {
+            statusCursor = null;
+            statusCursorJobId = effectiveJobId;
+        }
+
         try {
-            const response = await fetch(`${SCRIPT_ROOT}/api/scan/status/${effectiveJobId}`);
+            const statusUrl = statusCursor === null
+                ? `${SCRIPT_ROOT}/api/scan/status/${effectiveJobId}`
+                : `${SCRIPT_ROOT}/api/scan/status/${effectiveJobId}?since=${statusCursor}`;
+            const response = await fetch(statusUrl);
             if (!response.ok) {
                 if (response.status === 404) {
                     logToTerminal(`Job ID ${effectiveJobId} no encontrado. Pudo haber sido eliminado o nunca existió.`, "warn");
@@ -433,7 +457,7 @@ document.addEventListener('DOMContentLoaded', () => {
                         localStorage.removeItem('currentJobId');
                         currentJobId = null;
                         currentJobInfoDiv.style.display = 'none';
-                        clearTimeout(statusPollInterval);
+                        stopLiveUpdates();
                     }
                 } else {
                     const errorData = await response.json().catch(() => ({ error: "Error desconocido al obtener estado." }));
@@ -443,6 +467,8 @@ document.addEventListener('DOMContentLoaded', () => {
             }
 
             const data = await response.json();
+            if (statusCursorJobId !== effectiveJobId) return; // Se cambió de job durante la petición
+            statusCursor = data.cursor ?? statusCursor;
             jobIdDisplay.textContent = data.job_id; // Actualizar por si acaso
             jobStatusDisplay.textContent = data.status;
             overallProgressBar.style.width = `${data.overall_progress || 0}%`;
@@ -456,23 +482,19 @@ document.addEventListener('DOMContentLoaded', () => {
                 scanOutput.dataset.currentJobLog = data.job_id;
             }
             
-            // Mostrar logs del job (el backend debería enviar solo logs nuevos o un subconjunto)
+            // Mostrar logs del job: con cursor el backend solo envía los posteriores a él
             if (data.logs && Array.isArray(data.logs)) {
                 data.logs.forEach(log => {
-                    // Una forma simple de evitar duplicados si el backend reenvía todos los logs
-                    // Lo ideal es que el backend envíe solo logs nuevos desde el último poll.
-                    // Esta comprobación puede ser costosa si hay muchos logs.
-                    // if (!scanOutput.innerHTML.includes(log.message)) { // Esta comprobación puede ser ineficiente
-                        logToTerminal(log.message, log.type || 'info', log.is_html || false);
-                    // }
+                    logToTerminal(log.message, log.type || 'info', log.is_html || false);
                 });
             }
 
 
-            if (data.status === 'COMPLETED' || data.status === 'CANCELLED' || data.status === 'ERROR') {
+            if (TERMINAL_STATUSES.includes(data.status)) {
                 cancelJobButton.style.display = 'none';
                 if (data.zip_path) {
                     downloadJobZipLink.href = `${SCRIPT_ROOT}${data.zip_path}`; // Asegurar SCRIPT_ROOT si es necesario
+                    downloadJobZipLink.textContent = '💾 Descargar ZIP';
                     downloadJobZipLink.style.display = 'inline-block';
                     downloadJobZipLink.classList.remove('disabled');
 
@@ -481,14 +503,26 @@ document.addEventListener('DOMContentLoaded', () => {
                     // No remover currentJobId de localStorage aquí, para que la UI pueda mostrarlo hasta que el usuario seleccione otro.
                     // currentJobId = null; // No establecer a null para que refreshStatus manual aún funcione
                 }
-                clearTimeout(statusPollInterval); // Detener sondeo
+                stopLiveUpdates(); // Detener sondeo
                 loadJobs(); // Actualizar la lista para reflejar el estado final
             } else { // PENDING, RUNNING
                 cancelJobButton.style.display = 'inline-block'; // Mantener visible si está en curso
-                downloadJobZipLink.style.display = 'none';
-                downloadJobZipLink.classList.add('disabled');
-                clearTimeout(statusPollInterval); // Limpiar sondeo anterior
-                statusPollInterval = setTimeout(() => refreshStatus(effectiveJobId), 5000);
+                if (data.status === 'RUNNING' && data.zip_path) {
+                    // El ZIP se genera al vuelo: durante la ejecución contiene los resultados parciales
+                    downloadJobZipLink.href = `${SCRIPT_ROOT}${data.zip_path}`;
+                    downloadJobZipLink.textContent = '💾 Descargar ZIP parcial';
+                    downloadJobZipLink.style.display = 'inline-block';
+                    downloadJobZipLink.classList.remove('disabled');
+                } else {
+                    downloadJobZipLink.style.display = 'none';
+                    downloadJobZipLink.classList.add('disabled');
+                }
+                if (window.EventSource && !eventStreamUnavailable) {
+                    startEventStream(effectiveJobId);
+                } else {
+                    clearTimeout(statusPollInterval); // Limpiar sondeo anterior
+                    statusPollInterval = setTimeout(() => refreshStatus(effectiveJobId), 5000);
+                }
             }
 
         } catch (error) {
@@ -497,6 +531,57 @@ document.addEventListener('DOMContentLoaded', () => {
             statusPollInterval = setTimeout(() => refreshStatus(effectiveJobId), 10000); // Reintentar tras 10s
         }
     }
+    function stopLiveUpdates() {
+        clearTimeout(statusPollInterval);
+        if (jobEventSource) {
+            jobEventSource.close();
+            jobEventSource = null;
+        }
+    }
+
+    // Recibe por SSE los eventos del diario desde statusCursor en lugar de sondear
+    function startEventStream(jobId) {
+        if (jobEventSource && jobEventSource.jobId === jobId) return; // Ya conectado
+        stopLiveUpdates();
+        const source = new EventSource(`${SCRIPT_ROOT}/api/scan/events/${jobId}?since=${statusCursor || 0}`);
+        source.jobId = jobId;
+        jobEventSource = source;
+
+        const advanceCursor = (event) => {
+            if (event.lastEventId) statusCursor = Number(event.lastEventId);
+        };
+        source.addEventListener('log', (event) => {
+            advanceCursor(event);
+            const log = JSON.parse(event.data);
+            logToTerminal(log.message, log.type || 'info', log.is_html || false);
+        });
+        source.addEventListener('progress', advanceCursor);
+        source.addEventListener('summary', advanceCursor);
+        source.addEventListener('status', (event) => {
+            const data = JSON.parse(event.data);
+            jobStatusDisplay.textContent = data.status;
+            overallProgressBar.style.width = `${data.overall_progress || 0}%`;
+            overallProgressBar.textContent = `${data.overall_progress || 0}%`;
+            if (data.status === 'RUNNING' && data.zip_path) {
+                downloadJobZipLink.href = `${SCRIPT_ROOT}${data.zip_path}`;
+                downloadJobZipLink.textContent = '💾 Descargar ZIP parcial';
+                downloadJobZipLink.style.display = 'inline-block';
+                downloadJobZipLink.classList.remove('disabled');
+            }
+        });
+        source.addEventListener('end', () => {
+            stopLiveUpdates();
+            refreshStatus(jobId); // Estado final, enlace al ZIP e historial
+        });
+        source.onerror = () => {
+            if (source.readyState !== EventSource.CLOSED) return; // El navegador reintenta solo
+            logToTerminal("Stream de eventos no disponible, se usará sondeo periódico.", "warn");
+            eventStreamUnavailable = true;
+            stopLiveUpdates();
+            statusPollInterval = setTimeout(() => refreshStatus(jobId), 5000);
+        };
+    }
+
     // ELIMINADA: La siguiente línea es redundante y causaba el error TypeError debido al selector incorrecto.
     // La asignación de onclick para refreshButton ya se hace arriba de forma segura.
     // document.querySelector('button[onclick="refreshStatus()"]').onclick = () => refreshStatus();
@@ -519,7 +604,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 logToTerminal(`Solicitud de cancelación enviada para el trabajo ${jobIdToCancel}.`, "info");
                 jobStatusDisplay.textContent = "Cancelando...";
                 cancelJobButton.style.display = 'none'; // Ocultar inmediatamente
-                clearTimeout(statusPollInterval); // Detener sondeo temporalmente
+                stopLiveUpdates(); // Detener sondeo temporalmente
                 statusPollInterval = setTimeout(() => refreshStatus(jobIdToCancel), 2000); // Actualizar estado pronto
             } else {
                 logToTerminal(`Error al cancelar escaneo (HTTP ${response.status}): ${data.error || 'Error desconocido'}`, "error");
@@ -533,15 +618,28 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
 
-    async function loadJobs() {
-        jobsListArea.innerHTML = '<li>Cargando trabajos...</li>';
+    // El historial se pide por páginas; jobsNextCursor apunta a la siguiente (null si no hay más)
+    let jobsNextCursor = null;
+
+    async function loadJobs(append = false) {
+        if (!append) {
+            jobsNextCursor = null;
+            jobsListArea.innerHTML = '<li>Cargando trabajos...</li>';
+        }
         try {
-            const response = await fetch(`${SCRIPT_ROOT}/api/jobs`);
+            const jobsUrl = append && jobsNextCursor
+                ? `${SCRIPT_ROOT}/api/jobs?cursor=${encodeURIComponent(jobsNextCursor)}`
+                : `${SCRIPT_ROOT}/api/jobs`;
+            const response = await fetch(jobsUrl);
             if (!response.ok) throw new Error(`HTTP error ${response.status}`);
-            const jobs = await response.json();
-            
-            jobsListArea.innerHTML = ''; // Limpiar
-            if (jobs.length === 0) {
+            const data = await response.json();
+            const jobs = data.jobs || [];
+            jobsNextCursor = data.next_cursor || null;
+
+            if (!append) jobsListArea.innerHTML = ''; // Limpiar
+            const loadMoreItem = jobsListArea.querySelector('.load-more-jobs');
+            if (loadMoreItem) loadMoreItem.remove();
+            if (!append && jobs.length === 0) {
                 jobsListArea.innerHTML = '<li>No hay trabajos anteriores.</li>';
                 return;
             }
@@ -549,6 +647,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 const li = document.createElement('li');
                 let targetsDisplay = Array.isArray(job.targets) ? job.targets.join(', ') : (job.targets || 'N/A');
                 if (targetsDisplay.length > 50) targetsDisplay = targetsDisplay.substring(0, 47) + '...';
+                if (job.target_count > (job.targets || []).length) targetsDisplay += ` (${job.target_count} en total)`;
 
                 li.innerHTML = `
                     <div class="job-summary">
@@ -568,9 +667,19 @@ document.addEventListener('DOMContentLoaded', () => {
                 };
                 jobsListArea.appendChild(li);
             });
+            if (jobsNextCursor) {
+                const li = document.createElement('li');
+                li.className = 'load-more-jobs';
+                li.innerHTML = '<button class="button-like">Cargar más trabajos</button>';
+                li.querySelector('button').onclick = (e) => {
+                    e.stopPropagation();
+                    loadJobs(true);
+                };
+                jobsListArea.appendChild(li);
+            }
         } catch (error) {
             logToTerminal(`Error al cargar historial de trabajos: ${error.message || error}`, "error");
-            jobsListArea.innerHTML = '<li>Error al cargar trabajos.</li>';
+            if (!append) jobsListArea.innerHTML = '<li>Error al cargar trabajos.</li>';
         }
     }
 
@@ -578,7 +687,7 @@ document.addEventListener('DOMContentLoaded', () => {
         logToTerminal(`Cargando detalles para el trabajo ${jobId}...`, "info");
         currentJobId = jobId; // Actualizar el currentJobId global del frontend
         localStorage.setItem('currentJobId', jobId); // Guardar para futuras recargas de página
-        clearTimeout(statusPollInterval); // Detener cualquier sondeo anterior
+        stopLiveUpdates(); // Detener cualquier sondeo anterior
         // Limpiar terminal para logs del nuevo job ANTES de llamar a refreshStatus
         scanOutput.innerHTML = ''; 
         scanOutput.dataset.currentJobLog = jobId; // Marcar la terminal
@@ -0,0 +1,92 @@
+"""Entorno aislado para los tests: base de datos, resultados y herramientas en un directorio temporal.
+
+app.py lee su configuración del entorno al importarse, así que se fija aquí, antes
+de que ningún test lo importe.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="panthera-tests-")
+BIN_DIR = os.path.join(WORK_DIR, "bin")
+TOOLS_CONFIG_PATH = os.path.join(WORK_DIR, "tools_config.json")
+
+SLEEPER_SOURCE = '''#!{python}
+"""Herramienta de prueba: escribe el objetivo y espera `seconds` segundos."""
+import sys
+import time
+
+seconds, target = float(sys.argv[1]), sys.argv[2]
+print(target, flush=True)
+time.sleep(seconds)
+'''
+
+TEST_TOOLS_CONFIG = {
+    "pentest_phases": {"recon": "Reconocimiento"},
+    "tools_definition": {
+        "sleeper": {
+            "name": "Sleeper",
+            "command_template": "panthera-test-sleeper 60 {target} {sleeper_extra_args}",
+            "phase_key": "recon",
+            "category": "Test",
+            "target_type": "domain",
+            "cli_params_config": [
+                {"name": "sleeper_extra_args", "type": "text", "label": "Extra Arguments"}
+            ],
+        },
+    },
+    "scan_profiles": {},
+}
+
+os.makedirs(BIN_DIR)
+with open(os.path.join(BIN_DIR, "panthera-test-sleeper"), "w", encoding="utf-8") as f:
+    f.write(SLEEPER_SOURCE.format(python=sys.executable))
+os.chmod(os.path.join(BIN_DIR, "panthera-test-sleeper"), 0o755)
+with open(TOOLS_CONFIG_PATH, "w", encoding="utf-8") as f:
+    json.dump(TEST_TOOLS_CONFIG, f)
+
+os.environ["PATH"] = BIN_DIR + os.pathsep + os.environ.get("PATH", "")
+os.environ["DATABASE_PATH"] = os.path.join(WORK_DIR, "panthera.db")
+os.environ["RESULTS_DIR"] = os.path.join(WORK_DIR, "scan_results")
+os.environ["TOOLS_CONFIG_PATH"] = TOOLS_CONFIG_PATH
+os.environ["TOOL_CACHE_DIR"] = os.path.join(WORK_DIR, "tool_cache")
+# Los jobs los ejecutan los workers que lanza cada test, nunca el planificador en proceso
+os.environ["SCAN_EXECUTION_MODE"] = "workers"
+sys.path.insert(0, REPO_ROOT)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+def wait_until(predicate, timeout=10.0, interval=0.05):
+    """Espera a que `predicate()` devuelva algo verdadero; lo devuelve o None si pasa `timeout`."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = predicate()
+        if value:
+            return value
+        time.sleep(interval)
+    return None
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    import app as app_module
+
+    with app_module.app.app_context():
+        app_module.init_db_command()
+    return app_module
+
+
+@pytest.fixture
+def client(app_module):
+    client = app_module.app.test_client()
+    client.post("/login", data={"username": "panthera", "password": "panthera"})
+    return client
@@ -0,0 +1,82 @@
+import pytest
+
+from scanner.command_template import CommandTemplate, TemplateError, find_param_errors
+
+
+def test_whole_param_splits_into_arguments():
+    template = CommandTemplate("nmap {nmap_extra_args} {target}")
+    argv, stdout_path = template.render(
+        {"nmap_extra_args": '-sV --script "http-* and safe"', "target": "a b.example.com"}
+    )
+    assert argv == ["nmap", "-sV", "--script", "http-* and safe", "a b.example.com"]
+    assert stdout_path is None
+
+
+def test_unbalanced_quote_in_param_is_template_error():
+    template = CommandTemplate("nmap {nmap_extra_args} {target}")
+    with pytest.raises(TemplateError, match="nmap_extra_args"):
+        template.render({"nmap_extra_args": '-sV "x', "target": "example.com"})
+
+
+def test_unbalanced_quote_in_shell_param_is_template_error():
+    template = CommandTemplate("tool {extra} {target} | sort -u", needs_shell=True)
+    with pytest.raises(TemplateError, match="extra"):
+        template.render({"extra": "-a 'b", "target": "example.com"})
+
+
+def test_find_param_errors_uses_defaults_and_user_params():
+    template = CommandTemplate("nmap {nmap_extra_args} {target} -oX {output_file_xml}")
+    tool_definition = {"cli_params_config": [{"name": "nmap_extra_args", "default": "-sV"}]}
+    assert find_param_errors(template, tool_definition, None) is None
+    assert "nmap_extra_args" in find_param_errors(
+        template, tool_definition, {"nmap_extra_args": '-sV "x'}
+    )
+
+
+def test_start_scan_rejects_unbalanced_quote(client):
+    response = client.post(
+        "/api/scan/start",
+        json={
+            "targets": ["quote.example.com"],
+            "tools": [{"id": "sleeper", "cli_params": {"sleeper_extra_args": '-v "x'}}],
+        },
+    )
+    assert response.status_code == 400
+    assert any("sleeper_extra_args" in detail for detail in response.json["details"])
+
+
+def test_stdout_redirect_is_split_from_argv():
+    template = CommandTemplate("subfinder -d {target_domain} -silent > {output_file}")
+    argv, stdout_path = template.render(
+        {"target_domain": "example.com", "output_file": "/tmp/out dir/sub.txt"}
+    )
+    assert argv == ["subfinder", "-d", "example.com", "-silent"]
+    assert stdout_path == "/tmp/out dir/sub.txt"
+    assert not template.use_shell
+    assert template.display(argv, stdout_path) == "subfinder -d example.com -silent > '/tmp/out dir/sub.txt'"
+
+
+def test_placeholder_inside_token_stays_one_argument():
+    template = CommandTemplate("curl -o{output_file} http://{target_host_or_ip_and_port}/ {extra}")
+    argv, _ = template.render(
+        {"output_file": "/tmp/a b.html", "target_host_or_ip_and_port": "example.com:8080", "extra": ""}
+    )
+    # Un parámetro vacío no aporta argumentos
+    assert argv == ["curl", "-o/tmp/a b.html", "http://example.com:8080/"]
+
+
+def test_shell_template_quotes_engine_values_only():
+    template = CommandTemplate("tool {target} {extra} | sort -u > {output_file}", needs_shell=True)
+    command, stdout_path = template.render(
+        {"target": "x.com; rm -rf /", "extra": "-a -b", "output_file": "/tmp/o.txt"}
+    )
+    assert template.use_shell
+    # La redirección final la sigue haciendo el motor, también con shell
+    assert command == "tool 'x.com; rm -rf /' -a -b | sort -u"
+    assert stdout_path == "/tmp/o.txt"
+
+
+def test_missing_placeholders_are_template_error():
+    template = CommandTemplate("ffuf -u {target_url}/FUZZ -w {wordlist}")
+    with pytest.raises(TemplateError, match=r"\{wordlist\}"):
+        template.render({"target_url": "http://example.com"})
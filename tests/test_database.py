@@ -0,0 +1,59 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+from utils import database
+
+
+def create_base_schema(conn):
+    with open(os.path.join(os.path.dirname(database.SCHEMA_UPGRADES_PATH), "schema.sql")) as f:
+        conn.executescript(f.read())
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = database.connect(str(tmp_path / "panthera.db"))
+    yield conn
+    conn.close()
+
+
+def test_upgrades_wait_for_base_schema(conn):
+    database.apply_schema_upgrades(conn)
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+
+
+def test_upgrades_can_be_applied_twice(conn):
+    create_base_schema(conn)
+    database.apply_schema_upgrades(conn)
+    database.apply_schema_upgrades(conn)
+    assert database._has_column(conn, "task_queue", "task_spec")
+    assert database._has_column(conn, "rate_lease", "unit")
+
+
+def test_upgrade_errors_are_not_swallowed(conn, monkeypatch):
+    conn.execute("CREATE TABLE job (id TEXT PRIMARY KEY)")
+    monkeypatch.setattr(
+        database,
+        "_read_schema_upgrades",
+        lambda: ["ALTER TABLE job ADD COLUMN owner_id TEXT", "CREATE INDEX idx_broken ON job (missing)"],
+    )
+    with pytest.raises(sqlite3.OperationalError, match="missing"):
+        database.apply_schema_upgrades(conn)
+    assert database._has_column(conn, "job", "owner_id")
+
+
+def test_upgrades_fill_listing_columns_of_existing_jobs(conn):
+    create_base_schema(conn)
+    targets = [f"{letter}.example.com" for letter in "abcdefg"]
+    conn.execute(
+        "INSERT INTO job (id, status, targets, creation_timestamp) VALUES ('old', 'COMPLETED', ?, '2026-01-01')",
+        (json.dumps(targets),),
+    )
+    database.apply_schema_upgrades(conn)
+    target_count, targets_preview = conn.execute(
+        "SELECT target_count, targets_preview FROM job WHERE id = 'old'"
+    ).fetchone()
+    assert target_count == 7
+    assert json.loads(targets_preview) == targets[:5]
@@ -0,0 +1,43 @@
+import asyncio
+import os
+
+import pytest
+
+from scanner import executor
+
+
+def failing_progress(stats):
+    raise OSError("disco lleno")
+
+
+def assert_group_gone(pid):
+    with pytest.raises(ProcessLookupError):
+        os.killpg(pid, 0)
+
+
+def test_run_streaming_kills_group_when_progress_fails(tmp_path):
+    started = []
+    with pytest.raises(OSError, match="disco lleno"):
+        executor.run_streaming(
+            ["panthera-test-sleeper", "60", "example.com"],
+            str(tmp_path / "console.log"),
+            on_progress=failing_progress,
+            progress_interval=0.1,
+            on_start=started.append,
+        )
+    assert_group_gone(started[0])
+
+
+def test_run_streaming_async_kills_group_when_progress_fails(tmp_path):
+    started = []
+    with pytest.raises(OSError, match="disco lleno"):
+        asyncio.run(
+            executor.run_streaming_async(
+                ["panthera-test-sleeper", "60", "example.com"],
+                str(tmp_path / "console.log"),
+                on_progress=failing_progress,
+                progress_interval=0.1,
+                on_start=started.append,
+            )
+        )
+    assert_group_gone(started[0])
@@ -0,0 +1,58 @@
+import pytest
+
+from scanner import findings
+from utils import database
+
+NMAP_XML = """<?xml version="1.0"?>
+<nmaprun>
+<host><address addr="10.0.0.1" addrtype="ipv4"/>
+<ports>
+<port protocol="tcp" portid="22"><state state="open"/><service name="ssh"/></port>
+<port protocol="tcp" portid="443"><state state="open"/></port>
+</ports></host>
+"""
+
+
+@pytest.fixture
+def conn(app_module):
+    with database.get_pool(app_module.app.config["DATABASE"]).connection() as conn:
+        yield conn
+
+
+def count_rows(conn, table, job_id):
+    return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE job_id = ?", (job_id,)).fetchone()[0]
+
+
+def test_reingesting_output_counts_only_new_rows(conn, tmp_path):
+    output_path = tmp_path / "nmap.xml"
+    output_path.write_text(NMAP_XML + "</nmaprun>\n")
+    first = findings.ingest_tool_output(conn, "findings-reingest", "nmap", "nmap_xml", str(output_path))
+    second = findings.ingest_tool_output(conn, "findings-reingest", "nmap", "nmap_xml", str(output_path))
+    assert first == {"hosts": 1, "ports": 2, "urls": 0, "findings": 0}
+    assert second == {"hosts": 0, "ports": 0, "urls": 0, "findings": 0}
+    assert count_rows(conn, "ports", "findings-reingest") == 2
+
+
+def test_parse_error_leaves_no_rows(conn, tmp_path):
+    output_path = tmp_path / "nmap.xml"
+    output_path.write_text(NMAP_XML + "<host><address addr=")  # Salida cortada a mitad
+    with pytest.raises(findings.FindingsParseError):
+        findings.ingest_tool_output(conn, "findings-broken", "nmap", "nmap_xml", str(output_path))
+    assert count_rows(conn, "hosts", "findings-broken") == 0
+    assert count_rows(conn, "ports", "findings-broken") == 0
+
+
+def test_reingested_urls_keep_known_fields(conn, tmp_path):
+    output_path = tmp_path / "httpx.txt"
+    output_path.write_text("https://a.example.com [200] [Inicio]\nhttps://b.example.com\n")
+    first = findings.ingest_tool_output(conn, "findings-urls", "httpx", "httpx_lines", str(output_path))
+    output_path.write_text("https://a.example.com\nhttps://b.example.com [404] [No encontrado]\n")
+    second = findings.ingest_tool_output(conn, "findings-urls", "httpx", "httpx_lines", str(output_path))
+    assert (first["urls"], second["urls"]) == (2, 0)
+    rows = conn.execute(
+        "SELECT url, status_code, title FROM urls WHERE job_id = ? ORDER BY url", ("findings-urls",)
+    ).fetchall()
+    assert [tuple(row) for row in rows] == [
+        ("https://a.example.com", 200, "Inicio"),
+        ("https://b.example.com", 404, "No encontrado"),
+    ]
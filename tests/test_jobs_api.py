@@ -0,0 +1,32 @@
+import pytest
+
+
+def start_job(client, targets):
+    response = client.post("/api/scan/start", json={"targets": targets, "tools": [{"id": "sleeper"}]})
+    assert response.status_code == 202
+    job_id = response.json["job_id"]
+    # Nadie lo ejecuta: los workers solo corren en los tests que los lanzan
+    assert client.post(f"/api/scan/cancel/{job_id}").status_code == 200
+    return job_id
+
+
+def test_listing_reads_target_count_and_preview(client):
+    targets = [f"list-{index}.example.com" for index in range(7)]
+    job_id = start_job(client, targets)
+    jobs = {job["id"]: job for job in client.get("/api/jobs?limit=200").json["jobs"]}
+    assert jobs[job_id]["target_count"] == 7
+    assert jobs[job_id]["targets"] == targets[:5]
+
+
+def test_jobs_cursor_round_trip(app_module):
+    cursor = app_module._encode_jobs_cursor("2026-01-02T03:04:05.123456", "scan_1")
+    assert app_module._decode_jobs_cursor(cursor) == ("2026-01-02T03:04:05.123456", "scan_1")
+
+
+@pytest.mark.parametrize("cursor", ["###", "bm90IGpzb24=", "WzFd", "NQ=="])
+def test_invalid_jobs_cursor(app_module, client, cursor):
+    # Caracteres no base64, texto que no es JSON, lista de un elemento y un número suelto
+    with pytest.raises(ValueError):
+        app_module._decode_jobs_cursor(cursor)
+    response = client.get("/api/jobs", query_string={"cursor": cursor})
+    assert response.status_code == 400
@@ -0,0 +1,85 @@
+import json
+import os
+
+from utils import journal
+
+
+def write_logs(job_path, first, count):
+    journal.append_events(
+        str(job_path), [journal.make_log_event(f"log {index}") for index in range(first, first + count)]
+    )
+
+
+def test_snapshot_keeps_bounded_log_tail(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal, "LOG_TAIL_SIZE", 10)
+    write_logs(tmp_path, 0, 25)
+    journal.append_events(str(tmp_path), [journal.make_progress_event("a_on_x", {"status": "running"})])
+    journal.compact(str(tmp_path))
+    with open(tmp_path / journal.SNAPSHOT_FILENAME, encoding="utf-8") as f:
+        snapshot = json.load(f)
+    assert [log["message"] for log in snapshot["logs"]] == [f"log {index}" for index in range(15, 25)]
+    assert snapshot["journal_offset"] == os.path.getsize(tmp_path / journal.EVENTS_FILENAME)
+
+    write_logs(tmp_path, 25, 3)
+    state = journal.load_state(str(tmp_path))
+    assert [log["message"] for log in state["logs"]] == [f"log {index}" for index in range(18, 28)]
+    assert state["tool_progress"] == {"a_on_x": {"status": "running"}}
+
+
+def test_load_state_replays_only_after_snapshot(tmp_path, monkeypatch):
+    write_logs(tmp_path, 0, 5)
+    snapshot_offset = journal.compact(str(tmp_path))["journal_offset"]
+    write_logs(tmp_path, 5, 1)
+    read_offsets = []
+    iter_events = journal.iter_events
+
+    def recording_iter_events(job_path, offset=0):
+        read_offsets.append(offset)
+        return iter_events(job_path, offset)
+
+    monkeypatch.setattr(journal, "iter_events", recording_iter_events)
+    state = journal.load_state(str(tmp_path))
+    assert read_offsets == [snapshot_offset]
+    assert [log["message"] for log in state["logs"]] == [f"log {index}" for index in range(6)]
+
+
+def test_snapshot_without_log_tail_reads_whole_journal(tmp_path):
+    write_logs(tmp_path, 0, 3)
+    snapshot = {"job_id": "old", "tool_progress": {}, "journal_offset": journal.get_events_end_offset(str(tmp_path))}
+    with open(tmp_path / journal.SNAPSHOT_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    state = journal.load_state(str(tmp_path))
+    assert [log["message"] for log in state["logs"]] == ["log 0", "log 1", "log 2"]
+
+
+def test_read_delta_returns_only_changes_since_cursor(tmp_path):
+    job_path = str(tmp_path)
+    job_journal = journal.JobJournal(job_path)
+    job_journal.log("antes")
+    job_journal.progress("a_on_x", status="running", command="a x")
+    since = journal.get_events_end_offset(job_path)
+
+    job_journal.log("después")
+    job_journal.progress("a_on_x", status="completed")
+    job_journal.update(status="COMPLETED", overall_progress=100)
+    delta = journal.read_delta(job_path, since)
+
+    assert [log["message"] for log in delta["logs"]] == ["después"]
+    # Las entradas cambiadas se devuelven completas, no solo el último update
+    assert delta["tool_progress"] == {"a_on_x": {"status": "completed", "command": "a x"}}
+    assert delta["fields"] == {"status": "COMPLETED", "overall_progress": 100}
+    assert delta["cursor"] == journal.get_events_end_offset(job_path)
+
+    empty = journal.read_delta(job_path, delta["cursor"])
+    assert empty == {"logs": [], "tool_progress": {}, "fields": {}, "cursor": delta["cursor"]}
+
+
+def test_read_delta_ignores_partial_last_line(tmp_path):
+    job_path = str(tmp_path)
+    journal.append_events(job_path, [journal.make_log_event("completa")])
+    end_offset = journal.get_events_end_offset(job_path)
+    with open(tmp_path / journal.EVENTS_FILENAME, "a", encoding="utf-8") as f:
+        f.write('{"event": "log", "message": "a medi')
+    delta = journal.read_delta(job_path, 0)
+    assert [log["message"] for log in delta["logs"]] == ["completa"]
+    assert delta["cursor"] == end_offset
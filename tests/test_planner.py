@@ -0,0 +1,48 @@
+from scanner import planner
+
+TOOL_DEFINITIONS = {
+    "resolver": {"target_type": "domain_or_ip_list", "batch_size": 2, "phase_key": "recon"},
+    "prober": {"target_type": "domain", "depends_on_output_of": "resolver", "phase_key": "scan"},
+}
+TARGETS = ["a.example.com", "b.example.com", "c.example.com", "http://b.example.com:8080"]
+
+
+def test_list_tool_is_split_into_batches_of_batch_size():
+    tasks = planner.build_task_graph(TARGETS, [{"id": "resolver"}], TOOL_DEFINITIONS)
+    assert list(tasks) == ["resolver_batch_0", "resolver_batch_1"]
+    assert tasks["resolver_batch_0"]["target"] is None
+    assert tasks["resolver_batch_0"]["batch_targets"] == ["a.example.com", "b.example.com"]
+    assert tasks["resolver_batch_1"]["batch_targets"] == ["c.example.com", "http://b.example.com:8080"]
+    # La URL y el dominio se resuelven al mismo host: un solo valor en {targets_file}
+    assert tasks["resolver_batch_1"]["batch_values"] == ["c.example.com", "b.example.com"]
+
+
+def test_advanced_batch_size_overrides_tool_batch_size():
+    tasks = planner.build_task_graph(
+        TARGETS, [{"id": "resolver"}], TOOL_DEFINITIONS, advanced_options={"batch_size": 3}
+    )
+    assert [len(task["batch_targets"]) for task in tasks.values()] == [3, 1]
+    assert planner.get_batch_size({}, None) == planner.DEFAULT_BATCH_SIZE
+    assert planner.get_batch_size({"batch_size": 0}, {"batch_size": 0}) == 1
+
+
+def test_dependent_task_waits_for_the_batch_that_covers_its_target():
+    tasks = planner.build_task_graph(
+        TARGETS[:3],
+        [{"id": "prober"}],
+        TOOL_DEFINITIONS,
+        phase_order=["recon", "scan"],
+    )
+    assert tasks["prober_on_a.example.com"]["depends_on"] == ["resolver_batch_0"]
+    assert tasks["prober_on_c.example.com"]["depends_on"] == ["resolver_batch_1"]
+
+    pending_tasks = dict(tasks)
+    ready = planner.get_ready_tasks(pending_tasks, set())
+    assert [task["key"] for task in ready] == ["resolver_batch_0", "resolver_batch_1"]
+    del pending_tasks["resolver_batch_0"]
+    ready = planner.get_ready_tasks(pending_tasks, {"resolver_batch_0"})
+    assert [task["key"] for task in ready] == [
+        "resolver_batch_1",
+        "prober_on_a.example.com",
+        "prober_on_b.example.com",
+    ]
@@ -0,0 +1,32 @@
+import pytest
+
+from scanner.rate_limits import RateScheduler
+
+
+@pytest.fixture
+def rate_scheduler(app_module):
+    return RateScheduler(
+        app_module.app.config["DATABASE"], max_tasks_per_host=1, budgets={"pps": 1000, "rps": 100}
+    )
+
+
+def test_each_unit_has_its_own_budget(rate_scheduler):
+    packets = rate_scheduler.acquire([], 1000, 100, "pps", timeout=0)
+    requests = rate_scheduler.acquire([], 150, 10, "rps", timeout=0)
+    assert (packets.rate, requests.rate) == (1000, 100)
+    assert rate_scheduler.acquire([], 500, 100, "pps", timeout=0) is None
+    assert rate_scheduler.allocated_rate("pps") == 1000
+    assert rate_scheduler.allocated_rate("rps") == 100
+    rate_scheduler.release(packets)
+    rate_scheduler.release(requests)
+    assert rate_scheduler.allocated_rate("pps") == 0
+
+
+def test_busy_host_waits_for_release(rate_scheduler):
+    first = rate_scheduler.acquire(["busy.example.com"], timeout=0)
+    assert first is not None
+    assert rate_scheduler.acquire(["busy.example.com", "idle.example.com"], timeout=0) is None
+    rate_scheduler.release(first)
+    second = rate_scheduler.acquire(["busy.example.com"], timeout=0)
+    assert second is not None
+    rate_scheduler.release(second)
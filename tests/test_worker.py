@@ -0,0 +1,60 @@
+import os
+import threading
+
+import pytest
+
+from conftest import wait_until
+from scanner.worker import TaskWorker
+from utils import database
+
+
+@pytest.fixture
+def task_worker(app_module):
+    worker = TaskWorker(
+        app_module.app.config["DATABASE"],
+        app_module.run_queued_task,
+        app_module.plan_queued_job,
+        app_module.finalize_queued_job,
+        app_module.app.logger,
+        worker_id="test-worker",
+        concurrency=1,
+        poll_interval=0.1,
+        cancel_poll_interval=0.1,
+    )
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+    yield worker
+    worker.stop()
+    thread.join(timeout=10)
+
+
+def query_one(app_module, sql, params):
+    with database.get_pool(app_module.app.config["DATABASE"]).connection() as conn:
+        return conn.execute(sql, params).fetchone()
+
+
+def test_cancel_stops_tool_running_in_worker(app_module, client, task_worker):
+    response = client.post(
+        "/api/scan/start",
+        json={"targets": ["cancel.example.com"], "tools": [{"id": "sleeper"}]},
+    )
+    assert response.status_code == 202
+    job_id = response.json["job_id"]
+
+    tool_process = wait_until(
+        lambda: query_one(app_module, "SELECT pid FROM task_process WHERE job_id = ?", (job_id,))
+    )
+    assert tool_process is not None, "la herramienta no llegó a arrancar en el worker"
+
+    assert client.post(f"/api/scan/cancel/{job_id}").status_code == 200
+    job = wait_until(
+        lambda: query_one(
+            app_module, "SELECT status FROM job WHERE id = ? AND status = 'CANCELLED'", (job_id,)
+        ),
+        timeout=10,
+    )
+    assert job is not None, "el job sigue en curso tras la cancelación"
+    with pytest.raises(ProcessLookupError):
+        os.killpg(tool_process["pid"], 0)
+    status = client.get(f"/api/scan/status/{job_id}").json
+    assert status["tool_progress"]["sleeper_on_cancel.example.com"]["status"] == "cancelled"
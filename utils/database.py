@@ -0,0 +1,194 @@
+import contextlib
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+from . import metrics
+
+# Capa de acceso a SQLite compartida por la web, el planificador y el motor.
+# Todas las conexiones usan WAL (lectores y un escritor no se bloquean entre sí)
+# y salen de un pool por archivo de base de datos en lugar de abrirse por request.
+BUSY_TIMEOUT_MS = 10000
+POOL_MAX_IDLE_CONNECTIONS = 8
+PROGRESS_FLUSH_INTERVAL = 2.0
+
+# Cambios de esquema posteriores a schema.sql. Se aplican también al abrir el pool para
+# que las bases existentes los reciban, así que se pueden repetir (ver apply_schema_upgrades).
+SCHEMA_UPGRADES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "schema_upgrades.sql"
+)
+_ADD_COLUMN_RE = re.compile(
+    r"^ALTER\s+TABLE\s+(?P<table>\w+)\s+ADD\s+(?:COLUMN\s+)?(?P<column>\w+)", re.IGNORECASE
+)
+
+_pools = {}
+_progress_batchers = {}
+_pools_lock = threading.Lock()
+
+
+def connect(db_path):
+    """Abre una conexión configurada: WAL, synchronous NORMAL, busy_timeout y filas sqlite3.Row."""
+    conn = sqlite3.connect(
+        db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+class ConnectionPool:
+    """Pool de conexiones a un archivo SQLite; una conexión la usa un solo hilo a la vez."""
+
+    def __init__(self, db_path, max_idle=POOL_MAX_IDLE_CONNECTIONS):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect(self.db_path)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()  # No devolver al pool una transacción a medias
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+
+def _read_schema_upgrades():
+    statements = []
+    pending = ""
+    with open(SCHEMA_UPGRADES_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            if not pending and (not line.strip() or line.lstrip().startswith("--")):
+                continue
+            pending += line
+            if sqlite3.complete_statement(pending):
+                statements.append(pending.strip())
+                pending = ""
+    return statements
+
+
+def _has_column(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def apply_schema_upgrades(conn):
+    """Aplica schema_upgrades.sql sentencia a sentencia sobre una base con el esquema de schema.sql.
+
+    Una base aún sin tablas (antes de init-db) se deja como está: init-db las aplica después.
+    Los `ALTER TABLE ... ADD COLUMN` de columnas que ya existen se saltan; cualquier otro
+    error se propaga.
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'job'").fetchone() is None:
+        return
+    for statement in _read_schema_upgrades():
+        add_column = _ADD_COLUMN_RE.match(statement)
+        if add_column and _has_column(conn, add_column["table"], add_column["column"]):
+            continue
+        try:
+            conn.execute(statement)
+        except sqlite3.OperationalError as e:
+            # Otro proceso que abrió la misma base añadió la columna a la vez
+            if not (add_column and "duplicate column name" in str(e)):
+                raise
+    conn.commit()
+
+
+def get_pool(db_path):
+    """Pool compartido del archivo `db_path` (se crea en el primer uso)."""
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None:
+                pool = ConnectionPool(db_path)
+                with pool.connection() as conn:
+                    apply_schema_upgrades(conn)
+                _pools[db_path] = pool
+    return pool
+
+
+class ProgressBatcher:
+    """Agrupa las actualizaciones de `job.overall_progress` en escrituras periódicas.
+
+    Los motores llaman a `set_progress` tras cada tarea; un hilo escribe el último
+    valor de cada job cada `flush_interval` segundos en una sola transacción.
+    """
+
+    def __init__(self, db_path, flush_interval=PROGRESS_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self._pending = {}  # job_id: overall_progress
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def set_progress(self, job_id, overall_progress):
+        with self._lock:
+            self._pending[job_id] = overall_progress
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop, name="panthera-progress-writer", daemon=True
+                )
+                self._thread.start()
+
+    def flush(self):
+        # _write_lock serializa las escrituras para que `discard` no compita con una en curso
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            with get_pool(self.db_path).connection() as conn, metrics.DB_WRITE_SECONDS.time(
+                operation="progress_batch"
+            ):
+                # Un lote tardío (p. ej. de otro worker) no pisa el 100 de un job ya cerrado
+                conn.executemany(
+                    "UPDATE job SET overall_progress = ? WHERE id = ? AND end_timestamp IS NULL",
+                    [(progress, job_id) for job_id, progress in pending.items()],
+                )
+                conn.commit()
+
+    def discard(self, job_id):
+        """Olvida el progreso pendiente de un job (antes de escribir su estado final)."""
+        with self._write_lock:
+            with self._lock:
+                self._pending.pop(job_id, None)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Error writing batched job progress: {e}")
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+
+
+def get_progress_batcher(db_path):
+    """ProgressBatcher compartido del archivo `db_path` (se crea en el primer uso)."""
+    batcher = _progress_batchers.get(db_path)
+    if batcher is None:
+        with _pools_lock:
+            batcher = _progress_batchers.setdefault(db_path, ProgressBatcher(db_path))
+    return batcher
@@ -1,44 +1,165 @@
 import os
 import datetime
 import json
-import shutil # Para shutil.move, que es similar a os.replace pero más universal
+import threading
+import time
+
+from scanner.command_template import compile_tool_templates
+
+from . import journal
 
-# Variable global para la configuración cacheada
-_tool_config_cache = None
 CONFIG_FILE_PATH = 'tools_config.json' # Ajusta la ruta si es necesario
+CONFIG_RELOAD_CHECK_SECONDS = 1.0 # Intervalo mínimo entre comprobaciones del mtime del archivo
+EMPTY_CONFIG = {"pentest_phases": {}, "tools_definition": {}, "scan_profiles": {}}
 
-def load_config_from_file():
-    """Carga la configuración completa desde el archivo JSON."""
-    global _tool_config_cache
-    if _tool_config_cache is None:
+
+class FrozenDict(dict):
+    """dict de solo lectura (sigue siendo serializable a JSON); dict(x) da una copia mutable."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("La configuración de herramientas es de solo lectura.")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class ToolConfig:
+    """Configuración de herramientas inmutable e indexada, construida una vez por versión del archivo."""
+
+    def __init__(self, raw_config, version=None):
+        self.version = version
+        self.phases = _freeze(raw_config.get("pentest_phases", {}))
+        self.profiles = _freeze(raw_config.get("scan_profiles", {}))
+
+        tools = {}
+        tools_by_phase = {}
+        tools_by_target_type = {}
+        for tool_id, tool_data in raw_config.get("tools_definition", {}).items():
+            phase_key = tool_data.get('phase_key', '')
+            tools[tool_id] = _freeze(
+                dict(tool_data, phase=self.phases.get(phase_key, "Unknown Phase"))
+            )
+            tools_by_phase.setdefault(phase_key, []).append(tool_id)
+            tools_by_target_type.setdefault(tool_data.get('target_type', 'domain_or_ip'), []).append(tool_id)
+        self.tools = FrozenDict(tools)
+        self.tools_by_phase = _freeze(tools_by_phase)
+        self.tools_by_target_type = _freeze(tools_by_target_type)
+
+        # Parámetros efectivos por perfil: defaults de cada herramienta + params_override
+        profile_params = {}
+        for profile_name, profile in self.profiles.items():
+            overrides = profile.get("params_override", {})
+            profile_params[profile_name] = {
+                tool_id: dict(
+                    {
+                        param_config["name"]: param_config.get("default", "")
+                        for param_config in self.tools[tool_id].get("cli_params_config", ())
+                    },
+                    **overrides.get(tool_id, {}),
+                )
+                for tool_id in dict.fromkeys(tuple(profile.get("tools", ())) + tuple(overrides))
+                if tool_id in self.tools
+            }
+        self.profile_params = _freeze(profile_params)
+        self.command_templates = compile_tool_templates(self.tools)
+
+    def get_tool(self, tool_id):
+        return self.tools.get(tool_id, FrozenDict())
+
+    def get_profile_tool_params(self, profile_name, tool_id):
+        return self.profile_params.get(profile_name, FrozenDict()).get(tool_id, FrozenDict())
+
+
+_tool_config = None
+_tool_config_checked_at = 0.0
+_tool_config_checked_path = None
+_tool_config_failed_version = None # Versión del archivo que no se pudo cargar (no se reintenta)
+_tool_config_lock = threading.Lock()
+
+
+def _is_tool_config_fresh(now):
+    return (
+        _tool_config is not None
+        and _tool_config_checked_path == CONFIG_FILE_PATH
+        and now - _tool_config_checked_at < CONFIG_RELOAD_CHECK_SECONDS
+    )
+
+
+def _get_config_file_version():
+    stat_result = os.stat(CONFIG_FILE_PATH)
+    return (os.path.abspath(CONFIG_FILE_PATH), stat_result.st_mtime_ns, stat_result.st_size)
+
+
+def get_tool_config():
+    """Configuración indexada vigente; se reconstruye cuando cambia el mtime de tools_config.json.
+
+    Si la nueva versión del archivo no se puede leer, se mantiene la anterior.
+    """
+    global _tool_config, _tool_config_checked_at, _tool_config_checked_path, _tool_config_failed_version
+    now = time.monotonic()
+    if _is_tool_config_fresh(now):
+        return _tool_config
+    with _tool_config_lock:
+        if _is_tool_config_fresh(now):
+            return _tool_config
+        _tool_config_checked_at = now
+        _tool_config_checked_path = CONFIG_FILE_PATH
+        try:
+            version = _get_config_file_version()
+        except OSError:
+            if _tool_config is None:
+                print(f"ERROR: Archivo de configuración '{CONFIG_FILE_PATH}' no encontrado.")
+                _tool_config = ToolConfig(EMPTY_CONFIG)
+            return _tool_config
+        if _tool_config is not None and version in (_tool_config.version, _tool_config_failed_version):
+            return _tool_config
         try:
             with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
-                _tool_config_cache = json.load(f)
-        except FileNotFoundError:
-            print(f"ERROR: Archivo de configuración '{CONFIG_FILE_PATH}' no encontrado.")
-            # Podrías retornar una configuración por defecto o levantar una excepción
-            _tool_config_cache = {"pentest_phases": {}, "tools_definition": {}, "scan_profiles": {}}
-        except json.JSONDecodeError:
-            print(f"ERROR: Error al decodificar JSON desde '{CONFIG_FILE_PATH}'.")
-            _tool_config_cache = {"pentest_phases": {}, "tools_definition": {}, "scan_profiles": {}}
-    return _tool_config_cache
+                new_config = ToolConfig(json.load(f), version)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: No se pudo cargar '{CONFIG_FILE_PATH}': {e}")
+            _tool_config_failed_version = version
+            if _tool_config is None:
+                _tool_config = ToolConfig(EMPTY_CONFIG, version)
+            return _tool_config
+        if _tool_config is not None:
+            print(f"INFO: Configuración de herramientas recargada desde '{CONFIG_FILE_PATH}'.")
+        _tool_config = new_config
+        return _tool_config
+
+def load_config_from_file():
+    """Configuración completa tal como está en el archivo JSON (solo lectura)."""
+    tool_config = get_tool_config()
+    return FrozenDict(
+        pentest_phases=tool_config.phases,
+        tools_definition=tool_config.tools,
+        scan_profiles=tool_config.profiles,
+    )
 
 def get_pentest_phases():
-    config = load_config_from_file()
-    return config.get("pentest_phases", {})
+    return get_tool_config().phases
 
 def get_tools_definition():
-    config = load_config_from_file()
-    # Enriquecer cada herramienta con su 'phase_name' basado en 'phase_key'
-    phases = get_pentest_phases()
-    tools_def = config.get("tools_definition", {})
-    for tool_id, tool_data in tools_def.items():
-        tool_data['phase'] = phases.get(tool_data.get('phase_key', ''), "Unknown Phase")
-    return tools_def
+    """Definiciones de herramientas (solo lectura), con 'phase' resuelto desde 'phase_key'."""
+    return get_tool_config().tools
+
+def get_command_templates():
+    """Plantillas de comando de todas las herramientas, compiladas una vez por versión de la configuración."""
+    return get_tool_config().command_templates
 
 def get_scan_profiles():
-    config = load_config_from_file()
-    return config.get("scan_profiles", {})
+    return get_tool_config().profiles
 
 def create_job_directories(base_results_dir, job_id, targets):
     """Crea los directorios necesarios para un nuevo job de escaneo."""
@@ -55,52 +176,53 @@ def create_job_directories(base_results_dir, job_id, targets):
     return job_path, targets_file_path
 
 def get_scan_status_from_file(job_id, results_dir):
-    """Obtiene el estado de un job de escaneo desde su summary.json."""
+    """Obtiene el estado de un job de escaneo desde su summary.json y su diario de eventos."""
     job_path = os.path.join(results_dir, job_id)
-    summary_file = os.path.join(job_path, 'summary.json')
-    if os.path.exists(summary_file):
-        try:
-            with open(summary_file, 'r', encoding='utf-8') as f:
-                status_info = json.load(f)
-            return status_info
-        except json.JSONDecodeError:
-            return {'status': 'error', 'error_message': 'Could not parse summary file', 'job_id': job_id}
-    return None # O un estado indicando 'not_found' o 'initializing'
-
-def list_all_jobs(base_results_dir):
-    """Lista todos los job IDs existentes basándose en directorios y summary.json."""
+    if not os.path.exists(os.path.join(job_path, journal.SNAPSHOT_FILENAME)) and \
+            not os.path.exists(os.path.join(job_path, journal.EVENTS_FILENAME)):
+        return None # O un estado indicando 'not_found' o 'initializing'
+    return journal.load_state(job_path)
+
+def list_all_jobs(base_results_dir, limit=None, before_job_id=None):
+    """Lista los jobs del directorio de resultados, más recientes primero.
+
+    Los IDs (scan_<timestamp>) ordenan cronológicamente, así que se pagina sobre los
+    nombres de directorio y solo se lee el resumen de los jobs de la página:
+    `before_job_id` es el último ID de la página anterior y `limit` su tamaño.
+    """
     if not os.path.exists(base_results_dir):
         return []
-    
+
+    with os.scandir(base_results_dir) as entries:
+        job_ids = sorted((entry.name for entry in entries if entry.is_dir()), reverse=True)
+    if before_job_id is not None:
+        job_ids = [job_id for job_id in job_ids if job_id < before_job_id]
+    if limit is not None:
+        job_ids = job_ids[:limit]
+
     job_details_list = []
-    job_ids = [d for d in os.listdir(base_results_dir) if os.path.isdir(os.path.join(base_results_dir, d))]
-    
     for job_id in job_ids:
-        summary_path = os.path.join(base_results_dir, job_id, 'summary.json')
-        if os.path.exists(summary_path):
-            try:
-                with open(summary_path, 'r', encoding='utf-8') as f:
-                    summary_data = json.load(f)
-                    job_details_list.append({
-                        "id": summary_data.get("job_id", job_id),
-                        "status": summary_data.get("status", "unknown"),
-                        "timestamp": summary_data.get("start_time", ""), # O creation_time
-                        "targets": summary_data.get("targets", []),
-                        "zip_path": get_results_zip_path(job_id, base_results_dir) if summary_data.get("status") in ["COMPLETED", "CANCELLED"] else None
-                        # Añadir más campos si es necesario para la lista
-                    })
-            except json.JSONDecodeError:
+        job_path = os.path.join(base_results_dir, job_id)
+        if os.path.exists(os.path.join(job_path, journal.SNAPSHOT_FILENAME)) or \
+                os.path.exists(os.path.join(job_path, journal.EVENTS_FILENAME)):
+            summary_data = journal.load_state(job_path, include_logs=False)
+            if not summary_data.get("job_id") and not summary_data.get("status"):
                 job_details_list.append({
                     "id": job_id, "status": "error_summary_corrupt", "timestamp": "", "targets": []
                 })
+                continue
+            job_details_list.append({
+                "id": summary_data.get("job_id", job_id),
+                "status": summary_data.get("status", "unknown"),
+                "timestamp": summary_data.get("start_time", ""), # O creation_time
+                "targets": summary_data.get("targets", []),
+                "zip_path": get_results_download_path(job_id)
+            })
         else:
             # Directorio existe pero no summary.json, podría ser un job fallido o incompleto
-             job_details_list.append({
+            job_details_list.append({
                 "id": job_id, "status": "incomplete_no_summary", "timestamp": "", "targets": []
             })
-
-    # Ordenar por timestamp si está disponible, o por ID
-    job_details_list.sort(key=lambda x: x.get("timestamp", x["id"]), reverse=True)
     return job_details_list
 
 
@@ -109,54 +231,38 @@ def get_current_timestamp_str():
     return datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f") # Added microseconds for uniqueness
 
 def save_job_summary(job_path, job_data):
-    """Guarda o actualiza el archivo summary.json del job de forma atómica."""
-    summary_file_path = os.path.join(job_path, 'summary.json')
-    temp_summary_file_path = summary_file_path + ".tmp"
-    
-    current_summary = {}
-    if os.path.exists(summary_file_path):
-        try:
-            with open(summary_file_path, 'r', encoding='utf-8') as f:
-                current_summary = json.load(f)
-        except json.JSONDecodeError:
-            print(f"Warning: Corrupted summary file at {summary_file_path}. Will overwrite.")
-            current_summary = {} # Reset if corrupt
+    """Registra una actualización del job en su diario de eventos (O(1), sin releer el resumen).
 
-    # Deep merge logic for nested dictionaries like 'tool_progress'
+    Se mantiene la semántica anterior: 'logs' se añaden, 'tool_progress' se fusiona por
+    clave y el resto de campos se sobrescriben.
+    """
+    events = []
+    summary_fields = {}
     for key, value in job_data.items():
-        if isinstance(value, dict) and isinstance(current_summary.get(key), dict):
-            current_summary[key].update(value)
-        elif isinstance(value, list) and key == 'logs': # Append to logs
-            if key not in current_summary or not isinstance(current_summary[key], list):
-                current_summary[key] = []
-            current_summary[key].extend(value)
+        if key == 'logs' and isinstance(value, list):
+            for log in value:
+                events.append(journal.make_log_event(log.get('message', ''), log.get('type', 'info'), log.get('timestamp')))
+        elif key == 'tool_progress' and isinstance(value, dict):
+            for progress_key, progress_update in value.items():
+                events.append(journal.make_progress_event(progress_key, progress_update))
         else:
-            current_summary[key] = value
-    
+            summary_fields[key] = value
+    if summary_fields:
+        events.insert(0, journal.make_summary_event(summary_fields))
+
     try:
-        with open(temp_summary_file_path, 'w', encoding='utf-8') as f:
-            json.dump(current_summary, f, indent=4)
-        shutil.move(temp_summary_file_path, summary_file_path) # Atomic replace
-    except Exception as e:
+        journal.append_events(job_path, events)
+    except OSError as e:
         print(f"Error saving job summary for {job_data.get('job_id', 'Unknown Job')}: {e}")
-        if os.path.exists(temp_summary_file_path):
-            try:
-                os.remove(temp_summary_file_path)
-            except OSError:
-                pass # Couldn't remove temp file, log or handle as needed
-    return current_summary
 
 
-def get_results_zip_path(job_id, results_dir):
-    """Devuelve la ruta esperada para el archivo ZIP de resultados de un job."""
-    # Asume que el ZIP se guarda en el directorio padre de los directorios de jobs
-    # o en un directorio específico de "archives". Aquí lo pongo junto al dir del job.
-    return os.path.join(results_dir, f"{job_id}_results.zip")
+def get_results_download_path(job_id):
+    """URL de descarga del ZIP de resultados de un job (se genera al vuelo, no se guarda en disco)."""
+    return f"/api/results/download/{job_id}_results.zip"
 
 # Funciones para acceder a detalles de herramientas desde la config cacheada
 def get_tool_details(tool_id):
-    tools_def = get_tools_definition()
-    return tools_def.get(tool_id, {})
+    return get_tool_config().get_tool(tool_id)
 
 def get_target_type_for_tool(tool_id):
     return get_tool_details(tool_id).get('target_type', 'domain_or_ip')
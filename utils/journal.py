@@ -0,0 +1,226 @@
+import collections
+import datetime
+import json
+import os
+import threading
+
+from . import metrics
+
+# Diario de eventos de un job: events.jsonl es append-only (un evento JSON por línea) y
+# summary.json es una instantánea compacta (con solo los últimos logs) con el offset del
+# diario que cubre. El estado completo es instantánea + eventos posteriores; el historial
+# entero de logs queda en el diario.
+EVENTS_FILENAME = "events.jsonl"
+SNAPSHOT_FILENAME = "summary.json"
+SNAPSHOT_EVERY_EVENTS = 200
+LOG_TAIL_SIZE = 500  # Logs que guarda la instantánea y devuelve el estado completo
+
+
+def make_log_event(message, log_type="info", timestamp=None):
+    return {
+        "event": "log",
+        "timestamp": timestamp or datetime.datetime.now().isoformat(),
+        "message": message,
+        "type": log_type,
+    }
+
+
+def make_progress_event(progress_key, update):
+    """Fusiona `update` en tool_progress[progress_key]."""
+    return {"event": "progress", "key": progress_key, "update": update}
+
+
+def make_summary_event(fields):
+    """Actualiza campos de primer nivel del job (status, overall_progress, ...)."""
+    return {"event": "summary", "fields": fields}
+
+
+def append_events(job_path, events):
+    """Añade eventos al diario con una sola escritura O_APPEND (atómica entre hilos y procesos)."""
+    if not events:
+        return
+    data = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+    with metrics.JOURNAL_WRITE_SECONDS.time(operation="append"):
+        fd = os.open(
+            os.path.join(job_path, EVENTS_FILENAME),
+            os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+            0o644,
+        )
+        try:
+            os.write(fd, data.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+
+def iter_events(job_path, offset=0):
+    """Itera (evento, offset_siguiente) desde `offset`, ignorando una última línea incompleta."""
+    events_path = os.path.join(job_path, EVENTS_FILENAME)
+    if not os.path.exists(events_path):
+        return
+    with open(events_path, "rb") as f:
+        f.seek(offset)
+        for raw_line in f:
+            if not raw_line.endswith(b"\n"):
+                break  # Otro escritor aún no terminó esta línea
+            offset += len(raw_line)
+            try:
+                event = json.loads(raw_line)
+            except ValueError:
+                continue
+            yield event, offset
+
+
+def get_events_end_offset(job_path):
+    events_path = os.path.join(job_path, EVENTS_FILENAME)
+    return os.path.getsize(events_path) if os.path.exists(events_path) else 0
+
+
+def log_entry_from_event(event):
+    return {key: event[key] for key in ("timestamp", "message", "type") if key in event}
+
+
+def apply_event(state, event):
+    kind = event.get("event")
+    if kind == "log":
+        state.setdefault("logs", []).append(log_entry_from_event(event))
+    elif kind == "progress":
+        state.setdefault("tool_progress", {}).setdefault(event["key"], {}).update(
+            event.get("update", {})
+        )
+    elif kind == "summary":
+        state.update(event.get("fields", {}))
+
+
+def load_snapshot(job_path):
+    snapshot_path = os.path.join(job_path, SNAPSHOT_FILENAME)
+    if not os.path.exists(snapshot_path):
+        return {}
+    try:
+        with open(snapshot_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        print(f"Warning: Corrupted summary file at {snapshot_path}. Rebuilding from journal.")
+        return {}
+
+
+def load_state(job_path, include_logs=True):
+    """Reconstruye el estado del job: instantánea + cola del diario.
+
+    Los logs son los últimos LOG_TAIL_SIZE: la instantánea guarda los que había al
+    escribirse y solo se leen los eventos posteriores a su offset. Una instantánea sin
+    esos logs (escrita antes de guardarlos) obliga a leer el diario desde el principio;
+    los summary.json antiguos (sin `journal_offset`) se leen tal cual, logs incluidos.
+    El estado devuelto incluye `journal_offset`, el cursor hasta el que se ha leído.
+    """
+    state = load_snapshot(job_path)
+    snapshot_offset = state.pop("journal_offset", None)
+    has_log_tail = snapshot_offset is not None and "logs" in state
+    if snapshot_offset is None:
+        # Instantánea ilegible o resumen heredado: todo el diario es cola
+        snapshot_offset = 0
+    state.setdefault("tool_progress", {})
+    logs = collections.deque(state.pop("logs", []), maxlen=LOG_TAIL_SIZE)
+
+    offset = snapshot_offset if has_log_tail or not include_logs else 0
+    end_offset = offset
+    for event, end_offset in iter_events(job_path, offset):
+        if event.get("event") == "log":
+            if include_logs:
+                logs.append(log_entry_from_event(event))
+        elif end_offset > snapshot_offset:
+            apply_event(state, event)
+
+    if include_logs:
+        state["logs"] = list(logs)
+    state["journal_offset"] = max(end_offset, snapshot_offset)
+    return state
+
+
+def compact(job_path):
+    """Escribe una instantánea nueva (con los últimos logs) a partir de la anterior y la cola del diario (O(cola))."""
+    with metrics.JOURNAL_WRITE_SECONDS.time(operation="compact"):
+        return _compact(job_path)
+
+
+def _compact(job_path):
+    state = load_state(job_path)
+    snapshot_path = os.path.join(job_path, SNAPSHOT_FILENAME)
+    temp_path = f"{snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=4)
+        os.replace(temp_path, snapshot_path)  # Atomic replace
+    except OSError as e:
+        print(f"Error saving job snapshot for {state.get('job_id', job_path)}: {e}")
+        if os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+    return state
+
+
+class JobJournal:
+    """Escritor del diario de un job, compartido por los hilos del motor.
+
+    Cada evento es O(1); cada `snapshot_every` eventos se compacta la instantánea.
+    """
+
+    def __init__(self, job_path, snapshot_every=SNAPSHOT_EVERY_EVENTS):
+        self.job_path = job_path
+        self.snapshot_every = snapshot_every
+        self._lock = threading.Lock()
+        self._events_since_snapshot = 0
+
+    def append(self, *events):
+        append_events(self.job_path, events)
+        with self._lock:
+            self._events_since_snapshot += len(events)
+            needs_snapshot = self._events_since_snapshot >= self.snapshot_every
+            if needs_snapshot:
+                self._events_since_snapshot = 0
+        if needs_snapshot:
+            compact(self.job_path)
+
+    def log(self, message, log_type="info"):
+        self.append(make_log_event(message, log_type))
+
+    def progress(self, progress_key, **update):
+        self.append(make_progress_event(progress_key, update))
+
+    def update(self, **fields):
+        self.append(make_summary_event(fields))
+
+    def compact(self):
+        with self._lock:
+            self._events_since_snapshot = 0
+        return compact(self.job_path)
+
+
+def read_delta(job_path, since):
+    """Cambios del job desde el cursor `since` (offset en el diario).
+
+    Devuelve los logs nuevos, el estado completo de las entradas de tool_progress
+    que cambiaron, los campos de primer nivel actualizados y el nuevo cursor.
+    """
+    logs = []
+    changed_progress_keys = set()
+    fields = {}
+    cursor = since
+    for event, cursor in iter_events(job_path, since):
+        kind = event.get("event")
+        if kind == "log":
+            logs.append(log_entry_from_event(event))
+        elif kind == "progress":
+            changed_progress_keys.add(event["key"])
+        elif kind == "summary":
+            fields.update(event.get("fields", {}))
+
+    tool_progress = {}
+    if changed_progress_keys:
+        current_progress = load_state(job_path, include_logs=False)["tool_progress"]
+        tool_progress = {
+            progress_key: current_progress.get(progress_key, {})
+            for progress_key in changed_progress_keys
+        }
+    return {"logs": logs, "tool_progress": tool_progress, "fields": fields, "cursor": cursor}
@@ -0,0 +1,233 @@
+"""Métricas del proceso en formato de texto de Prometheus, sin dependencias externas.
+
+Contadores, gauges e histogramas con etiquetas que se registran al importarse y
+se sirven en `/metrics` desde la propia app Flask. Los valores son del proceso
+actual: con varios procesos, cada uno expone los suyos.
+"""
+import bisect
+import contextlib
+import math
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+TOOL_DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"Métrica duplicada: {metric.name}")
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Todas las métricas en el formato de exposición de texto de Prometheus."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(metric.render_samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name, help_text, label_names=(), registry=REGISTRY):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}  # tupla de valores de etiquetas -> valor
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(
+                f"{self.name} espera las etiquetas {self.label_names}, recibió {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render_samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name, help_text, label_names=(), registry=REGISTRY):
+        super().__init__(name, help_text, label_names, registry)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """Calcula el valor al exponer las métricas (solo gauges sin etiquetas)."""
+        self._function = function
+
+    def render_samples(self):
+        if self._function is None:
+            return super().render_samples()
+        try:
+            value = self._function()
+        except Exception:
+            return []  # Mejor omitir la muestra que romper toda la exposición
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        super().__init__(name, help_text, label_names, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            if bucket_index < len(self.buckets):
+                state["counts"][bucket_index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def totals(self, **labels):
+        """(número de observaciones, suma) de una serie; (0, 0.0) si aún no tiene datos."""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            return (state["count"], state["sum"]) if state else (0, 0.0)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observa la duración del bloque `with`, también si termina con excepción."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def render_samples(self):
+        with self._lock:
+            items = sorted(
+                (key, (list(state["counts"]), state["sum"], state["count"]))
+                for key, state in self._values.items()
+            )
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, [("le", _format_value(float(upper_bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+# Métricas del motor y de la API
+JOBS_RUNNING = Gauge("panthera_jobs_running", "Jobs en ejecución en la base de datos (cualquier proceso).")
+JOBS_QUEUED = Gauge("panthera_jobs_queued", "Jobs en estado PENDING en la base de datos.")
+JOBS_FINISHED = Counter(
+    "panthera_jobs_finished_total", "Jobs terminados por estado final.", ["status"]
+)
+TOOL_PROCESSES_RUNNING = Gauge(
+    "panthera_tool_processes_running", "Procesos de herramientas en ejecución."
+)
+TOOL_RUNS = Counter(
+    "panthera_tool_runs_total",
+    "Ejecuciones de herramientas por resultado "
+    "(completed, error, timeout, cancelled, memory_limit, cpu_limit, exception, cache_hit).",
+    ["tool_id", "status"],
+)
+RATE_ALLOCATED_PPS = Gauge(
+    "panthera_rate_allocated_pps",
+    "Parte del presupuesto global de tasa (pps) concedida a herramientas en ejecución en todos los procesos.",
+)
+RATE_ALLOCATED_RPS = Gauge(
+    "panthera_rate_allocated_rps",
+    "Parte del presupuesto global de peticiones HTTP/s concedida a herramientas en ejecución en todos los procesos.",
+)
+TOOL_DURATION_SECONDS = Histogram(
+    "panthera_tool_duration_seconds",
+    "Duración (reloj) de cada ejecución de herramienta.",
+    ["tool_id"],
+    buckets=TOOL_DURATION_BUCKETS,
+)
+JOURNAL_WRITE_SECONDS = Histogram(
+    "panthera_journal_write_seconds",
+    "Latencia de escritura del diario de eventos (append) y de summary.json (compact).",
+    ["operation"],
+)
+DB_WRITE_SECONDS = Histogram(
+    "panthera_db_write_seconds",
+    "Latencia de las escrituras del estado de los jobs en SQLite.",
+    ["operation"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "panthera_http_request_seconds",
+    "Latencia de las peticiones HTTP por endpoint.",
+    ["endpoint", "method", "status"],
+)
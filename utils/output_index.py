@@ -0,0 +1,155 @@
+"""Índice de texto completo (SQLite FTS5) de las salidas de las herramientas.
+
+Cada archivo de `tool_outputs` se indexa por fragmentos de líneas completas mientras
+la herramienta lo escribe y una última vez al terminar su tarea.
+`output_files.indexed_bytes` guarda hasta dónde se indexó cada archivo, así que
+volver a indexarlo solo añade lo nuevo (o lo rehace si se truncó).
+"""
+import os
+
+CHUNK_BYTES = 64 * 1024
+MAX_INDEXED_BYTES_PER_FILE = 50 * 1024 * 1024
+BINARY_SNIFF_BYTES = 4096
+SNIPPET_TOKENS = 16
+SNIPPET_MARKERS = ("«", "»")
+
+
+def build_match_query(text):
+    """Consulta FTS5 a partir del texto del usuario: cada palabra como frase, todas obligatorias.
+
+    Así `CVE-2021-41773` o `a.example.com` buscan la secuencia exacta de tokens y
+    los operadores de FTS5 no se interpretan.
+    """
+    terms = [term for term in text.split() if term.strip('"')]
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _is_binary(path):
+    with open(path, "rb") as f:
+        return b"\0" in f.read(BINARY_SNIFF_BYTES)
+
+
+def index_file(conn, job_id, tool_id, path, complete_lines_only=False):
+    """Indexa lo que falte de `path`. Devuelve los bytes añadidos al índice.
+
+    Con `complete_lines_only` (archivo aún en escritura) la última línea sin salto no
+    se indexa: se añadirá entera en la siguiente llamada.
+    """
+    file_name = os.path.basename(path)
+    size = min(os.path.getsize(path), MAX_INDEXED_BYTES_PER_FILE)
+    row = conn.execute(
+        "SELECT id, indexed_bytes FROM output_files WHERE job_id = ? AND file_name = ?",
+        (job_id, file_name),
+    ).fetchone()
+    if row is None:
+        if size == 0 or _is_binary(path):
+            return 0
+        file_id = conn.execute(
+            "INSERT INTO output_files (job_id, tool_id, file_name) VALUES (?, ?, ?)",
+            (job_id, tool_id, file_name),
+        ).lastrowid
+        indexed_bytes = 0
+    else:
+        file_id, indexed_bytes = row[0], row[1]
+        if size < indexed_bytes:  # Archivo reescrito: se indexa de nuevo
+            conn.execute("DELETE FROM output_fts WHERE file_id = ?", (file_id,))
+            indexed_bytes = 0
+        if size == indexed_bytes:
+            return 0
+
+    start_offset = indexed_bytes
+    with open(path, "rb") as f:
+        f.seek(indexed_bytes)
+        remaining = size - indexed_bytes
+        while remaining > 0:
+            data = f.read(min(CHUNK_BYTES, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            # Cortar en el último salto de línea para no partir palabras entre fragmentos
+            if remaining > 0 or complete_lines_only:
+                if b"\n" in data:
+                    cut = data.rindex(b"\n") + 1
+                    f.seek(cut - len(data), os.SEEK_CUR)
+                    remaining += len(data) - cut
+                    data = data[:cut]
+                elif remaining == 0:
+                    break
+            conn.execute(
+                "INSERT INTO output_fts (content, file_id) VALUES (?, ?)",
+                (data.decode("utf-8", errors="replace"), file_id),
+            )
+            indexed_bytes += len(data)
+    conn.execute(
+        "UPDATE output_files SET indexed_bytes = ? WHERE id = ?", (indexed_bytes, file_id)
+    )
+    return indexed_bytes - start_offset
+
+
+def index_files(conn, job_id, tool_id, paths, complete_lines_only=False):
+    """Indexa varios archivos de una tarea en una transacción."""
+    indexed_bytes = 0
+    try:
+        for path in paths:
+            if os.path.isfile(path):
+                indexed_bytes += index_file(conn, job_id, tool_id, path, complete_lines_only)
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+    return indexed_bytes
+
+
+def index_job_directory(conn, job_id, job_path, tool_ids=()):
+    """Indexa (o completa) todas las salidas de un job ya existente.
+
+    La herramienta de cada archivo se deduce del prefijo más largo de `tool_ids` en su nombre.
+    """
+    tool_outputs_dir = os.path.join(job_path, "tool_outputs")
+    if not os.path.isdir(tool_outputs_dir):
+        return 0
+    with os.scandir(tool_outputs_dir) as entries:
+        paths = sorted(
+            entry.path
+            for entry in entries
+            if entry.is_file() and not entry.name.endswith(".tmp")
+        )
+    prefixes = sorted(tool_ids, key=len, reverse=True)
+    indexed_bytes = 0
+    try:
+        for path in paths:
+            file_name = os.path.basename(path)
+            tool_id = next((t for t in prefixes if file_name.startswith(f"{t}_")), None)
+            indexed_bytes += index_file(conn, job_id, tool_id, path)
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+    return indexed_bytes
+
+
+def search(conn, user_id, text, limit, offset=0, job_id=None, tool_id=None):
+    """Fragmentos de salidas de los jobs de `user_id` que contienen todas las palabras de `text`."""
+    match_query = build_match_query(text)
+    if not match_query:
+        return []
+    conditions = ["output_fts MATCH ?", "j.user_id = ?"]
+    params = [match_query, user_id]
+    if job_id:
+        conditions.append("f.job_id = ?")
+        params.append(job_id)
+    if tool_id:
+        conditions.append("f.tool_id = ?")
+        params.append(tool_id)
+    rows = conn.execute(
+        f"""SELECT f.job_id, f.tool_id, f.file_name, j.creation_timestamp,
+                   snippet(output_fts, 0, ?, ?, '…', ?) AS snippet
+            FROM output_fts
+            JOIN output_files f ON f.id = output_fts.file_id
+            JOIN job j ON j.id = f.job_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY rank
+            LIMIT ? OFFSET ?""",
+        [SNIPPET_MARKERS[0], SNIPPET_MARKERS[1], SNIPPET_TOKENS] + params + [limit, offset],
+    ).fetchall()
+    return [dict(row) for row in rows]
@@ -0,0 +1,91 @@
+"""ZIP generado al vuelo para descargar los resultados de un job.
+
+El archivo se escribe sobre un búfer sin `seek` (zipfile usa descriptores de datos)
+y se entrega por bloques mientras se lee cada archivo del job, sin crear una copia
+del ZIP en disco. Para jobs en curso se incluye de cada archivo solo lo escrito
+hasta el momento de listarlo, de modo que el ZIP parcial siempre es válido.
+"""
+import os
+import zipfile
+
+DEFAULT_COMPRESSION_LEVEL = 6
+READ_CHUNK_SIZE = 256 * 1024
+TEMP_FILE_SUFFIX = ".tmp"
+
+
+class _StreamBuffer:
+    """Destino de escritura de zipfile que acumula bytes hasta que el generador los entrega."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def list_job_files(job_path):
+    """[(ruta, nombre en el ZIP, tamaño)] de los archivos del job, ordenados por nombre."""
+    files = []
+    for dir_path, dir_names, file_names in os.walk(job_path):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith(TEMP_FILE_SUFFIX):
+                continue  # Archivos temporales de tareas en curso (p. ej. stderr del ejecutor)
+            file_path = os.path.join(dir_path, file_name)
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                continue  # El archivo desapareció mientras se listaba
+            arcname = os.path.relpath(file_path, job_path).replace(os.sep, "/")
+            files.append((file_path, arcname, size))
+    return files
+
+
+def iter_zip_stream(job_path, compression_level=DEFAULT_COMPRESSION_LEVEL):
+    """Genera los bytes de un ZIP con los archivos del job.
+
+    `compression_level` 0 guarda los archivos sin comprimir; 1-9 usa deflate.
+    Las entradas llevan la fecha de la descarga, no la de cada archivo.
+    """
+    if compression_level == 0:
+        compression, compresslevel = zipfile.ZIP_STORED, None
+    else:
+        compression, compresslevel = zipfile.ZIP_DEFLATED, compression_level
+
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=compression, compresslevel=compresslevel) as zip_file:
+        for file_path, arcname, size in list_job_files(job_path):
+            try:
+                source = open(file_path, "rb")
+            except OSError:
+                continue
+            with source:
+                # Abrir la entrada por nombre aplica la compresión y el nivel del ZipFile
+                with zip_file.open(
+                    arcname, "w", force_zip64=size >= zipfile.ZIP64_LIMIT
+                ) as entry:
+                    remaining = size
+                    while remaining > 0:
+                        chunk = source.read(min(READ_CHUNK_SIZE, remaining))
+                        if not chunk:
+                            break  # Truncado mientras se leía
+                        entry.write(chunk)
+                        remaining -= len(chunk)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    data = buffer.drain()
+    if data:
+        yield data